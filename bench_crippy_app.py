@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Benchmarks for crippy_app.py"""
+
+import concurrent.futures
+import os
+import sys
+import sysconfig
+import time
+from collections.abc import Callable, Iterable
+from typing import Any
+
+import click
+
+import crippy_app
+
+
+def _measure(name: str, num_items: int, function: Callable[..., Any], *args: Any) -> Any:
+    """Run a function once and print the number of items processed per second."""
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    click.echo(f"{name:<32} {elapsed:8.2f} s {num_items / elapsed:14,.0f} items/s")
+    return result
+
+
+def _map(executor: concurrent.futures.Executor, function: Callable[[Any], Any], items: Iterable) -> list:
+    """Apply a function to all items using an executor."""
+    return list(executor.map(function, items))
+
+
+@click.group()
+def cli():
+    """Benchmarks for crippy_app.py."""
+
+
+@cli.command()
+@click.option("-n", "--num-records", type=click.IntRange(min=1), default=1_000_000, show_default=True)
+@click.option("-s", "--size", type=click.IntRange(min=0), default=32, show_default=True, help="bytes per record")
+@click.option("--blocks/--no-blocks", default=False, help="also encrypt every record to a block (slow)")
+def records(num_records, size, blocks):
+    """Encrypt / decrypt many small records: one token per record vs. batched records."""
+    block_crypter = crippy_app.BlockCrypter(crippy_app.BlockCrypter.generate_key())
+    values = [os.urandom(size) for _ in range(num_records)]
+    click.echo(f"{num_records:,} records of {size} bytes")
+    if blocks:
+        data_objects = [crippy_app.DataObject("application/octet-stream", binary_data=value) for value in values]
+        _measure("encrypt_to_block() per record", num_records, list, map(block_crypter.encrypt_to_block, data_objects))
+    tokens = _measure("Fernet.encrypt() per record", num_records, list, map(block_crypter.encrypt, values))
+    _measure("Fernet.decrypt() per record", num_records, list, map(block_crypter.decrypt, tokens))
+    tokens = _measure("encrypt_records()", num_records, block_crypter.encrypt_records, values)
+    decrypted = _measure("decrypt_records()", num_records, block_crypter.decrypt_records, tokens)
+    if decrypted != values:
+        raise click.ClickException("decrypted records differ from the original records")
+
+
+def _gil_status() -> str:
+    """Describe the interpreter: free-threaded build or not, GIL enabled or not (at run time)."""
+    free_threaded = bool(sysconfig.get_config_var("Py_GIL_DISABLED"))
+    gil_enabled = getattr(sys, "_is_gil_enabled", lambda: True)()
+    build = "free-threaded" if free_threaded else "default"
+    return f"Python {sys.version.split()[0]}, {build} build, GIL {'enabled' if gil_enabled else 'disabled'}"
+
+
+def _shards(items: list, num_shards: int) -> list[list]:
+    """Split a list into `num_shards` (nearly) equal parts."""
+    size = -(-len(items) // num_shards)
+    return [items[start : start + size] for start in range(0, len(items), size)]
+
+
+@cli.command()
+@click.option("-n", "--num-records", type=click.IntRange(min=1), default=1_000_000, show_default=True)
+@click.option("-s", "--size", type=click.IntRange(min=0), default=32, show_default=True, help="bytes per record")
+@click.option("-b", "--num-blocks", type=click.IntRange(min=1), default=2000, show_default=True)
+@click.option("--block-size", type=click.IntRange(min=1), default=16 * 1024, show_default=True, help="bytes per block")
+@click.option(
+    "-t", "--threads", "max_threads", type=click.IntRange(min=1), default=os.cpu_count() or 1, show_default=True
+)
+def threads(num_records, size, num_blocks, block_size, max_threads):
+    """Batch encrypt / decrypt throughput with 1, 2, 4, ... threads sharing one BlockCrypter.
+
+    Run it with the default and with the free-threaded (3.13t) interpreter to compare the scaling.
+    """
+    block_crypter = crippy_app.BlockCrypter(crippy_app.BlockCrypter.generate_key())
+    values = [os.urandom(size) for _ in range(num_records)]
+    data_objects = [
+        crippy_app.DataObject("application/octet-stream", binary_data=os.urandom(block_size)) for _ in range(num_blocks)
+    ]
+    click.echo(f"{_gil_status()}, {os.cpu_count()} CPUs")
+    click.echo(f"{num_records:,} records of {size} bytes, {num_blocks:,} blocks of {block_size:,} bytes")
+    num_threads = 1
+    while num_threads <= max_threads:
+        click.echo(f"{num_threads} thread(s)")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as executor:
+            shards = _shards(values, num_threads)
+            tokens = _measure("  encrypt_records()", num_records, _map, executor, block_crypter.encrypt_records, shards)
+            _measure("  decrypt_records()", num_records, _map, executor, block_crypter.decrypt_records, tokens)
+            blocks = _measure(
+                "  encrypt_to_block()", num_blocks, _map, executor, block_crypter.encrypt_to_block, data_objects
+            )
+            _measure("  decrypt_from_block()", num_blocks, _map, executor, block_crypter.decrypt_from_block, blocks)
+        num_threads *= 2
+
+
+if __name__ == "__main__":
+    cli()
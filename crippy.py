@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
 """Encrypt / decrypt text and files to and from BASE64 encoded blocks."""
 
+import functools
 import pathlib
 import sys
+from collections.abc import Callable
 
 from PySide6 import QtCore, QtWidgets
 
 import crippy_app
+import crippy_batch
+import crippy_jobs
 import crippy_ui
 from usersettings import UserSettings
 
@@ -47,11 +51,19 @@ class MainWindow(QtWidgets.QMainWindow, crippy_ui.Ui_MainWindow):
 
     LAST_LOAD_PATH = "LAST_LOAD_PATH"
     LAST_SAVE_PATH = "LAST_SAVE_PATH"
+    ZDICT_FILE = "ZDICT_FILE"
 
     def __init__(self) -> None:
         super().__init__()
         self.settings = UserSettings("crippy", "nl.benhattem")
         self.setupUi(self)
+        self._jobs: set[crippy_jobs.Job] = set()
+        self.job_queue: None | crippy_jobs.JobQueuePanel = None
+
+        # optional preset dictionary (see: crippy_cli.py train-zdict) for compressing text
+        self.zdict_id = None
+        if (zdict_file := self.settings.get(self.ZDICT_FILE)) and pathlib.Path(zdict_file).is_file():
+            self.zdict_id = crippy_app.register_zdict(pathlib.Path(zdict_file).read_bytes())
 
     def reset_gui(self) -> None:
         """Reset the entire GUI state."""
@@ -67,6 +79,19 @@ def on_file_new_triggered(self) -> None:
         """Menu: File -> New"""
         self.reset_gui()
 
+    @QtCore.Slot()
+    def on_file_save_triggered(self) -> None:
+        """Menu: File -> Save (from Output)"""
+        if not self.te_output.toPlainText():
+            self.status_bar.showMessage("Nothing to save...")
+            return
+        filename = self.select_file_dialog(save=True)
+        if filename:
+            num_chars = self.te_output.save(filename)
+            self.status_bar.showMessage(
+                f"{msg_with_correct_plural('Saved {} character{}', num_chars)} to '{filename}'..."
+            )
+
     @QtCore.Slot()
     def on_file_exit_triggered(self) -> None:
         """Menu: File -> Exit"""
@@ -148,6 +173,15 @@ def select_file_dialog(self, save: bool = False, overrule_filename: None | str =
             self.le_filename.setText(path_filename.name)
         return filename
 
+    def block_crypter(self) -> crippy_app.BlockCrypter:
+        """Create a BlockCrypter for the password in the GUI.
+
+        Returns:
+            crippy_app.BlockCrypter: BlockCrypter with a key derived from the password
+        """
+        key = crippy_app.BlockCrypter.derive_key_from_password(self.le_password.text(), salt=crippy_app.SALT)
+        return crippy_app.BlockCrypter(key)
+
     def encrypt(self, data: crippy_app.DataObject) -> str:
         """Encrypt a DataObject to a text block.
 
@@ -157,9 +191,7 @@ def encrypt(self, data: crippy_app.DataObject) -> str:
         Returns:
             str: text block with encrypted result (including headers)
         """
-        key = crippy_app.BlockCrypter.derive_key_from_password(self.le_password.text(), salt=crippy_app.SALT)
-        block_crypter = crippy_app.BlockCrypter(key)
-        encrypted_data = block_crypter.encrypt_to_block(data)
+        encrypted_data = self.block_crypter().encrypt_to_block(data)
         len_data = 0 if data.binary_data is None else len(data.binary_data)
         self.status_bar.showMessage(msg_with_correct_plural("Encrypted {} byte{}...", len_data))
         return encrypted_data
@@ -167,7 +199,9 @@ def encrypt(self, data: crippy_app.DataObject) -> str:
     @QtCore.Slot()
     def on_encrypt_input_to_output_triggered(self) -> None:
         """Menu: Encrypt -> 'Input -> Output'."""
-        encrypted_block = self.encrypt(crippy_app.DataObject.from_str(self.te_input.toPlainText()))
+        encrypted_block = self.encrypt(
+            crippy_app.DataObject.from_str(self.te_input.toPlainText(), zdict_id=self.zdict_id)
+        )
         self.te_output.setPlainText(encrypted_block)
 
     def _encrypt_file(self, filename: str | pathlib.Path) -> None:
@@ -181,6 +215,113 @@ def _encrypt_file(self, filename: str | pathlib.Path) -> None:
             encrypted_block = self.encrypt(crippy_app.DataObject.from_file(filename))
             self.te_output.setPlainText(encrypted_block)
 
+    def _run_job(self, description: str, function: Callable[[], str]) -> None:
+        """Run a (file) job in the background.
+
+        The function runs in a thread pool, the GUI stays responsive. When
+        finished the returned message is shown in the status bar, an error is
+        reported using a message box.
+
+        Args:
+            description (str): description of the job (shown while running)
+            function (Callable[[], str]): job, returns a message for the status bar
+        """
+        job = crippy_jobs.Job(function)
+        self._jobs.add(job)
+
+        def on_finished(message: str) -> None:
+            self._jobs.discard(job)
+            self.status_bar.showMessage(message)
+
+        def on_failed(error: str) -> None:
+            self._jobs.discard(job)
+            self.status_bar.showMessage(f"{description} failed...")
+            QtWidgets.QMessageBox.critical(
+                self,
+                "Error",
+                f"{description} failed:\n\n{error}\n",
+                QtWidgets.QMessageBox.StandardButton.Ok,
+                QtWidgets.QMessageBox.StandardButton.NoButton,
+            )
+
+        job.signals.finished.connect(on_finished)
+        job.signals.failed.connect(on_failed)
+        self.status_bar.showMessage(f"{description}...")
+        QtCore.QThreadPool.globalInstance().start(job)
+
+    def _encrypt_directory(self, directory: pathlib.Path) -> None:
+        """Encrypt a directory (as a tar archive) to a block file.
+
+        The directory is streamed into the block file (in the background),
+        the (potentially very large) block is not shown in the output.
+
+        Args:
+            directory (pathlib.Path): directory to encrypt
+        """
+        filename = self.select_file_dialog(save=True, overrule_filename=f"{directory.name}.txt")
+        if filename:
+            self.te_input.clear()
+            block_crypter = self.block_crypter()
+
+            def encrypt_directory() -> str:
+                with open(filename, "w", encoding="ascii", newline="\n") as fh_out:
+                    num_bytes = block_crypter.encrypt_directory_to_block(directory, fh_out)
+                return f"{msg_with_correct_plural('Encrypted {} byte{}', num_bytes)}, saved to '{filename}'..."
+
+            self._run_job(f"Encrypting '{directory.name}'", encrypt_directory)
+
+    @QtCore.Slot()
+    def on_encrypt_file_to_file_triggered(self) -> None:
+        """Menu: Encrypt -> 'File -> File'.
+
+        The file is streamed into a block file (in the background), the block
+        is not shown in the output.
+        """
+        source_file = self.select_file_dialog()
+        if not source_file:
+            return
+        target_file = self.select_file_dialog(save=True, overrule_filename=f"{pathlib.Path(source_file).name}.txt")
+        if target_file:
+            block_crypter = self.block_crypter()
+
+            def encrypt_file() -> str:
+                num_bytes = crippy_batch.encrypt_file_atomic(block_crypter, source_file, target_file)
+                return f"{msg_with_correct_plural('Encrypted {} byte{}', num_bytes)}, saved to '{target_file}'..."
+
+            self._run_job(f"Encrypting '{pathlib.Path(source_file).name}'", encrypt_file)
+
+    @QtCore.Slot()
+    def on_decrypt_file_to_file_triggered(self) -> None:
+        """Menu: Decrypt -> 'File -> File'.
+
+        The block file is decrypted to a file (in the background), the block
+        is never loaded in the input.
+        """
+        block_file = self.select_file_dialog()
+        if not block_file:
+            return
+        block_crypter = self.block_crypter()
+        try:
+            with open(block_file, encoding="ascii") as fh_in:
+                filename = block_crypter.open_block_reader(fh_in).info.filename  # only reads the headers
+        except Exception:  # pylint: disable=broad-except
+            QtWidgets.QMessageBox.critical(
+                self,
+                "Invalid block",
+                f"'{block_file}' does not contain a valid block.\n",
+                QtWidgets.QMessageBox.StandardButton.Ok,
+                QtWidgets.QMessageBox.StandardButton.NoButton,
+            )
+            return
+        target_file = self.select_file_dialog(save=True, overrule_filename=filename)
+        if target_file:
+
+            def decrypt_file() -> str:
+                num_bytes = crippy_batch.decrypt_file_atomic(block_crypter, block_file, target_file)
+                return f"{msg_with_correct_plural('Decrypted {} byte{}', num_bytes)}, saved to '{target_file}'..."
+
+            self._run_job(f"Decrypting '{pathlib.Path(block_file).name}'", decrypt_file)
+
     @QtCore.Slot()
     def on_encrypt_file_to_output_triggered(self) -> None:
         """Menu: Encrypt -> 'File -> Output'."""
@@ -208,10 +349,11 @@ def decrypt(self) -> crippy_app.DataObject:
             return crippy_app.DataObject.from_str("")
 
         # decrypt the input text block
-        key = crippy_app.BlockCrypter.derive_key_from_password(self.le_password.text(), salt=crippy_app.SALT)
-        block_crypter = crippy_app.BlockCrypter(key)
         try:
-            decrypted_data = block_crypter.decrypt_from_block(input_text)
+            if crippy_app.is_multipart(input_text):
+                decrypted_data = self.block_crypter().decrypt_from_parts([input_text])
+            else:
+                decrypted_data = self.block_crypter().decrypt_from_block(input_text)
         except Exception:  # pylint: disable=broad-except
             # catch all exceptions (probably: wrong password or corrupt input)
             QtWidgets.QMessageBox.critical(
@@ -230,14 +372,32 @@ def decrypt(self) -> crippy_app.DataObject:
         self.status_bar.showMessage(msg_with_correct_plural("Decrypted {} byte{}", len_data))
         return decrypted_data
 
+    def decompression_error(self, exc: Exception) -> None:
+        """Report decrypted data which expands too much (probably a 'zip bomb').
+
+        Args:
+            exc (Exception): the DecompressionLimitException
+        """
+        QtWidgets.QMessageBox.critical(
+            self,
+            "Decompression error",
+            f"The decrypted data is not accepted:\n\n{exc}\n",
+            QtWidgets.QMessageBox.StandardButton.Ok,
+            QtWidgets.QMessageBox.StandardButton.NoButton,
+        )
+        self.status_bar.showMessage("Decrypted data NOT accepted (too large)...")
+
     @QtCore.Slot()
     def on_decrypt_input_to_output_triggered(self) -> None:
         """Menu: Decrypt -> 'Input -> Output'."""
         decrypted_data = self.decrypt()
         if decrypted_data.binary_data:
-            if (output_text := decrypted_data.as_str()) is None:
-                output_text = ""
-            self.te_output.setPlainText(output_text)
+            try:
+                output_text = decrypted_data.as_str()
+            except crippy_app.DecompressionLimitException as exc:
+                self.decompression_error(exc)
+                return
+            self.te_output.setPlainText("" if output_text is None else output_text)
         self.status_bar.showMessage(f"{self.status_bar.currentMessage()}...")
 
     @QtCore.Slot()
@@ -248,7 +408,11 @@ def on_decrypt_input_to_file_triggered(self) -> None:
             filename = self.select_file_dialog(save=True)
             if filename:
                 self.te_output.clear()
-                decrypted_data.to_file(filename)
+                try:
+                    decrypted_data.to_file(filename)
+                except crippy_app.DecompressionLimitException as exc:
+                    self.decompression_error(exc)
+                    return
                 self.status_bar.showMessage(f"{self.status_bar.currentMessage()}, saved to '{filename}'...")
             else:
                 self.status_bar.showMessage(f"{self.status_bar.currentMessage()}, NOT saved (cancelled)...")
@@ -275,9 +439,38 @@ def on_pb_decrypt_clicked(self) -> None:
 
     @QtCore.Slot(pathlib.Path)  # type: ignore
     def on_te_input_file_dropped(self, filename: pathlib.Path) -> None:
-        """File dropped in input"""
+        """File (or directory) dropped in input"""
         self.settings[self.LAST_LOAD_PATH] = str(filename.parent)
-        self._encrypt_file(filename)
+        if filename.is_dir():
+            self._encrypt_directory(filename)
+        else:
+            self._encrypt_file(filename)
+
+    @QtCore.Slot(list)  # type: ignore
+    def on_te_input_files_dropped(self, filenames: list[pathlib.Path]) -> None:
+        """Multiple files (or directories) dropped in input.
+
+        Every file is added to the job queue: block files are decrypted, all
+        other files (and directories) are encrypted. The results are written
+        to a selected output directory.
+        """
+        self.settings[self.LAST_LOAD_PATH] = str(filenames[0].parent)
+        start_dir = self.settings.get(self.LAST_SAVE_PATH, str(pathlib.Path.cwd()))
+        target_dir = QtWidgets.QFileDialog.getExistingDirectory(self, "Output Directory", start_dir)
+        if not target_dir:
+            self.status_bar.showMessage("Cancelled...")
+            return
+        self.settings[self.LAST_SAVE_PATH] = target_dir
+        if self.job_queue is None:
+            self.job_queue = crippy_jobs.JobQueuePanel(self)
+            self.addDockWidget(QtCore.Qt.DockWidgetArea.BottomDockWidgetArea, self.job_queue)
+        self.job_queue.clear_finished()
+        block_crypter = self.block_crypter()
+        for filename in filenames:
+            self.job_queue.add_job(
+                filename.name, functools.partial(crippy_batch.process_file, block_crypter, filename, target_dir)
+            )
+        self.status_bar.showMessage(msg_with_correct_plural("Added {} file{} to the queue...", len(filenames)))
 
 
 if __name__ == "__main__":
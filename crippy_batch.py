@@ -0,0 +1,554 @@
+#!/usr/bin/env python3
+"""Batch operations on files and directories using crippy blocks."""
+
+import concurrent.futures
+import contextlib
+import dataclasses
+import itertools
+import json
+import os
+import pathlib
+import time
+from collections.abc import Iterable, Iterator
+
+from crippy_app import BlockCrypter, BlockInfo, InvalidBlockException
+
+# suffix added to the name of an encrypted file
+BLOCK_SUFFIX = ".txt"
+
+# default name of the manifest (in the target directory)
+MANIFEST_FILENAME = "manifest.json"
+
+# seconds between saves of the manifest during an incremental run (an interrupted run keeps its progress)
+MANIFEST_SAVE_INTERVAL = 5.0
+
+
+def atomic_write_text(filename: str | pathlib.Path, text: str) -> None:
+    """Write a text file atomically.
+
+    The text is written to a temporary file first, which then replaces the
+    target file. Readers never see a partially written file.
+
+    Args:
+        filename (str | pathlib.Path): file to be written
+        text (str): content of the file
+    """
+    filename = pathlib.Path(filename)
+    tmp_file = filename.with_name(f"{filename.name}.tmp")
+    tmp_file.write_text(text, encoding="utf-8")
+    os.replace(tmp_file, filename)
+
+
+def hash_file(block_crypter: BlockCrypter, filename: str | pathlib.Path) -> str:
+    """Calculate the keyed hash of a file.
+
+    Args:
+        block_crypter (BlockCrypter): BlockCrypter providing the key
+        filename (str | pathlib.Path): file to be hashed
+
+    Returns:
+        str: keyed hash (hex digest)
+    """
+    keyed_hash = block_crypter.keyed_hash()
+    with open(filename, "rb") as fh_in:
+        while data := fh_in.read(block_crypter.chunk_size):
+            keyed_hash.update(data)
+    return keyed_hash.hexdigest()
+
+
+@contextlib.contextmanager
+def _atomic_target(target_file: pathlib.Path) -> Iterator[pathlib.Path]:
+    """Write to a temporary file which replaces `target_file` on success."""
+    tmp_file = target_file.with_name(f"{target_file.name}.tmp")
+    try:
+        yield tmp_file
+        os.replace(tmp_file, target_file)
+    finally:
+        tmp_file.unlink(missing_ok=True)
+
+
+def encrypt_file_atomic(
+    block_crypter: BlockCrypter,
+    source_file: str | pathlib.Path,
+    target_file: str | pathlib.Path,
+    zip_data: None | bool = None,
+) -> int:
+    """Encrypt a file to a block file, replacing the block file atomically.
+
+    Args:
+        block_crypter (BlockCrypter): BlockCrypter to encrypt with
+        source_file (str | pathlib.Path): file to be encrypted
+        target_file (str | pathlib.Path): block file to be written
+        zip_data (None | bool, optional): compression mode
+
+    Returns:
+        int: number of bytes encrypted
+    """
+    target_file = pathlib.Path(target_file)
+    target_file.parent.mkdir(parents=True, exist_ok=True)
+    with _atomic_target(target_file) as tmp_file, open(tmp_file, "w", encoding="ascii", newline="\n") as fh_out:
+        return block_crypter.encrypt_file_to_block(source_file, fh_out, zip_data=zip_data)
+
+
+def decrypt_lines_atomic(block_crypter: BlockCrypter, fh_in: Iterable[str], target_file: str | pathlib.Path) -> int:
+    """Decrypt a block from a text stream (or lines) to a file, replacing the file atomically.
+
+    The block is decrypted one chunk at a time, the target file is only
+    replaced when the complete block was decrypted successfully.
+
+    Args:
+        block_crypter (BlockCrypter): BlockCrypter to decrypt with
+        fh_in (Iterable[str]): text stream (or lines) containing the block
+        target_file (str | pathlib.Path): file to be written
+
+    Returns:
+        int: number of bytes decrypted
+    """
+    target_file = pathlib.Path(target_file)
+    with _atomic_target(target_file) as tmp_file:
+        (_, num_bytes) = block_crypter.decrypt_block_to_file(fh_in, filename=tmp_file)
+    return num_bytes
+
+
+def decrypt_file_atomic(
+    block_crypter: BlockCrypter, block_file: str | pathlib.Path, target_file: str | pathlib.Path
+) -> int:
+    """Decrypt a block file to a file, replacing the file atomically.
+
+    The block is decrypted one chunk at a time, the target file is only
+    replaced when the complete block was decrypted successfully.
+
+    Args:
+        block_crypter (BlockCrypter): BlockCrypter to decrypt with
+        block_file (str | pathlib.Path): block file to be decrypted
+        target_file (str | pathlib.Path): file to be written
+
+    Returns:
+        int: number of bytes decrypted
+    """
+    with open(block_file, encoding="ascii") as fh_in:
+        return decrypt_lines_atomic(block_crypter, fh_in, target_file)
+
+
+def is_block_file(block_crypter: BlockCrypter, filename: str | pathlib.Path) -> bool:
+    """Check if a file is a block file (a block starts in its first 4KB).
+
+    Args:
+        block_crypter (BlockCrypter): BlockCrypter (defines the block markers)
+        filename (str | pathlib.Path): file to be checked
+
+    Returns:
+        bool: the file contains a block
+    """
+    with open(filename, encoding="ascii", errors="replace") as fh_in:
+        return block_crypter.contains_block(fh_in.read(4096))
+
+
+def process_file(
+    block_crypter: BlockCrypter, source: str | pathlib.Path, target_dir: str | pathlib.Path
+) -> tuple[pathlib.Path, int]:
+    """Encrypt or decrypt a file (or directory) to a target directory.
+
+    * a block file is decrypted to a file (with the filename from the block)
+    * a directory is encrypted (as a tar archive) to a block file
+    * any other file is encrypted to a block file
+    Block files get the name of the source plus `BLOCK_SUFFIX`.
+
+    Args:
+        block_crypter (BlockCrypter): BlockCrypter to encrypt / decrypt with
+        source (str | pathlib.Path): file or directory to be processed
+        target_dir (str | pathlib.Path): directory for the results
+
+    Returns:
+        tuple[pathlib.Path, int]: (file written, number of bytes processed)
+    """
+    source = pathlib.Path(source)
+    target_dir = pathlib.Path(target_dir)
+    target_dir.mkdir(parents=True, exist_ok=True)
+    if source.is_dir():
+        target_file = target_dir / f"{source.name}{BLOCK_SUFFIX}"
+        with _atomic_target(target_file) as tmp_file, open(tmp_file, "w", encoding="ascii", newline="\n") as fh_out:
+            num_bytes = block_crypter.encrypt_directory_to_block(source, fh_out)
+    elif is_block_file(block_crypter, source):
+        with open(source, encoding="ascii") as fh_in:
+            filename = block_crypter.open_block_reader(fh_in).info.filename
+        if filename is None:
+            filename = source.stem if source.suffix == BLOCK_SUFFIX else f"{source.name}.out"
+        target_file = target_dir / pathlib.Path(filename).name  # strip path
+        num_bytes = decrypt_file_atomic(block_crypter, source, target_file)
+    else:
+        target_file = target_dir / f"{source.name}{BLOCK_SUFFIX}"
+        num_bytes = encrypt_file_atomic(block_crypter, source, target_file)
+    return target_file, num_bytes
+
+
+def rotate_file(
+    old_block_crypter: BlockCrypter, new_block_crypter: BlockCrypter, block_file: str | pathlib.Path
+) -> int:
+    """Re-encrypt all blocks in a file with a new key, replacing the file atomically.
+
+    A file which is already encrypted with the new key is skipped, so an
+    interrupted rotation can simply be run again.
+
+    Args:
+        old_block_crypter (BlockCrypter): BlockCrypter with the old key
+        new_block_crypter (BlockCrypter): BlockCrypter with the new key
+        block_file (str | pathlib.Path): file with one or more blocks
+
+    Returns:
+        int: number of blocks re-encrypted (0: the file was already rotated)
+    """
+    block_file = pathlib.Path(block_file)
+    with open(block_file, encoding="ascii") as fh_in:
+        if new_block_crypter.can_decrypt_block(fh_in):
+            return 0
+    with (
+        _atomic_target(block_file) as tmp_file,
+        open(block_file, encoding="ascii", newline="") as fh_in,
+        open(tmp_file, "w", encoding="ascii", newline="") as fh_out,
+    ):
+        return old_block_crypter.reencrypt_blocks(fh_in, fh_out, new_block_crypter)
+
+
+def verify_file(block_crypter: BlockCrypter, block_file: str | pathlib.Path) -> int:
+    """Verify the integrity of all blocks in a file, without decrypting their data.
+
+    Args:
+        block_crypter (BlockCrypter): BlockCrypter with the key
+        block_file (str | pathlib.Path): file with one or more blocks
+
+    Raises:
+        InvalidBlockException: error in block structure (or no block found)
+        InvalidToken: a token is corrupt (or the key is wrong)
+
+    Returns:
+        int: number of blocks verified
+    """
+    num_blocks = 0
+    with open(block_file, encoding="ascii") as fh_in:
+        lines = iter(fh_in)
+        for line in lines:
+            if block_crypter.contains_block(line):
+                # the block is read from the same iterator, the lines after the block remain in `lines`
+                block_crypter.verify_block(itertools.chain([line], lines))
+                num_blocks += 1
+    if num_blocks == 0:
+        raise InvalidBlockException("cannot find block markers")
+    return num_blocks
+
+
+@dataclasses.dataclass
+class VerifyReport:
+    """Result of a verification run."""
+
+    files_passed: int = 0
+    blocks_passed: int = 0
+    errors: dict[str, str] = dataclasses.field(default_factory=dict)
+
+
+def verify_files(
+    block_crypter: BlockCrypter, paths: Iterable[str | pathlib.Path], max_workers: None | int = None
+) -> VerifyReport:
+    """Verify the integrity of all block files in a list of files and directories.
+
+    The files are verified in parallel by a pool of processes, no plaintext
+    is produced.
+
+    Args:
+        block_crypter (BlockCrypter): BlockCrypter with the key
+        paths (Iterable[str | pathlib.Path]): block files and/or directories
+        max_workers (None | int, optional): number of processes, default:
+            number of CPUs
+
+    Returns:
+        VerifyReport: number of files and blocks passed and the error per
+            failed file
+    """
+    report = VerifyReport()
+    block_files = find_block_files(block_crypter, paths)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(verify_file, block_crypter, block_file): block_file for block_file in block_files}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                num_blocks = future.result()
+            except Exception as exc:  # pylint: disable=broad-except
+                report.errors[str(futures[future])] = str(exc) or type(exc).__name__
+                continue
+            report.files_passed += 1
+            report.blocks_passed += num_blocks
+    return report
+
+
+def inspect_file(block_crypter: BlockCrypter, block_file: str | pathlib.Path) -> list[BlockInfo]:
+    """Get information about all blocks in a file, from their headers only (nothing is decrypted).
+
+    Args:
+        block_crypter (BlockCrypter): BlockCrypter (defines the block markers,
+            the key is not used)
+        block_file (str | pathlib.Path): file with one or more blocks
+
+    Raises:
+        InvalidBlockException: error in block structure (or no block found)
+
+    Returns:
+        list[BlockInfo]: information per block
+    """
+    infos = []
+    with open(block_file, encoding="ascii", errors="replace") as fh_in:
+        lines = iter(fh_in)
+        for line in lines:
+            if block_crypter.contains_block(line):
+                # the block is read from the same iterator, the lines after the block remain in `lines`
+                infos.append(block_crypter.inspect_block(itertools.chain([line], lines)))
+    if not infos:
+        raise InvalidBlockException("cannot find block markers")
+    return infos
+
+
+@dataclasses.dataclass
+class InspectReport:
+    """Result of inspecting block files."""
+
+    blocks: dict[str, list[BlockInfo]] = dataclasses.field(default_factory=dict)
+    errors: dict[str, str] = dataclasses.field(default_factory=dict)
+
+
+def inspect_files(block_crypter: BlockCrypter, paths: Iterable[str | pathlib.Path]) -> InspectReport:
+    """Get information about all blocks in a list of files and directories.
+
+    Only the headers are parsed, so no key is needed and the files are read
+    at disk speed (sequentially, there is nothing to gain from processes).
+
+    Args:
+        block_crypter (BlockCrypter): BlockCrypter (defines the block markers,
+            the key is not used)
+        paths (Iterable[str | pathlib.Path]): block files and/or directories
+
+    Returns:
+        InspectReport: information per block per file and the error per
+            failed file
+    """
+    report = InspectReport()
+    for block_file in find_block_files(block_crypter, paths):
+        try:
+            report.blocks[str(block_file)] = inspect_file(block_crypter, block_file)
+        except Exception as exc:  # pylint: disable=broad-except
+            report.errors[str(block_file)] = str(exc) or type(exc).__name__
+    return report
+
+
+@dataclasses.dataclass
+class RotationReport:
+    """Result of a key rotation run."""
+
+    files_rotated: int = 0
+    blocks_rotated: int = 0
+    files_skipped: int = 0
+    errors: dict[str, str] = dataclasses.field(default_factory=dict)
+
+
+def find_block_files(block_crypter: BlockCrypter, paths: Iterable[str | pathlib.Path]) -> list[pathlib.Path]:
+    """Get all block files in a list of files and directories (temporary files are skipped).
+
+    Args:
+        block_crypter (BlockCrypter): BlockCrypter (defines the block markers)
+        paths (Iterable[str | pathlib.Path]): files and/or directories
+
+    Returns:
+        list[pathlib.Path]: block files (directories are walked in sorted order)
+    """
+    files: list[pathlib.Path] = []
+    for path in map(pathlib.Path, paths):
+        if path.is_dir():
+            files.extend(find_files(path, exclude=None))
+        else:
+            files.append(path)
+    return [file for file in files if (file.suffix != ".tmp") and is_block_file(block_crypter, file)]
+
+
+def rotate_keys(
+    old_block_crypter: BlockCrypter,
+    new_block_crypter: BlockCrypter,
+    paths: Iterable[str | pathlib.Path],
+    max_workers: None | int = None,
+) -> RotationReport:
+    """Re-encrypt all block files in a list of files and directories with a new key.
+
+    The files are processed in parallel by a pool of processes. Every file
+    is replaced atomically and files already encrypted with the new key are
+    skipped: after an interruption the rotation can be run again.
+
+    Args:
+        old_block_crypter (BlockCrypter): BlockCrypter with the old key
+        new_block_crypter (BlockCrypter): BlockCrypter with the new key
+        paths (Iterable[str | pathlib.Path]): block files and/or directories
+        max_workers (None | int, optional): number of processes, default:
+            number of CPUs
+
+    Returns:
+        RotationReport: number of files and blocks rotated, skipped files and
+            errors per file
+    """
+    report = RotationReport()
+    block_files = find_block_files(old_block_crypter, paths)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(rotate_file, old_block_crypter, new_block_crypter, block_file): block_file
+            for block_file in block_files
+        }
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                num_blocks = future.result()
+            except Exception as exc:  # pylint: disable=broad-except
+                report.errors[str(futures[future])] = str(exc) or type(exc).__name__
+                continue
+            if num_blocks:
+                report.files_rotated += 1
+                report.blocks_rotated += num_blocks
+            else:
+                report.files_skipped += 1
+    return report
+
+
+@dataclasses.dataclass
+class SyncReport:
+    """Result of an incremental encryption run."""
+
+    files_encrypted: int = 0
+    bytes_encrypted: int = 0
+    files_skipped: int = 0
+    bytes_skipped: int = 0
+    files_removed: int = 0
+
+
+class Manifest:
+    """Administration of encrypted files for incremental encryption.
+
+    For every source file (by relative path) the manifest records the size,
+    modification time, keyed content hash and the name of the produced block
+    file. The manifest is a JSON file, it is only valid for the key it was
+    created with: the hashes are keyed hashes and the blocks are encrypted
+    with that key. A manifest for another key is ignored.
+    """
+
+    VERSION = 1
+
+    def __init__(self, filename: str | pathlib.Path, block_crypter: BlockCrypter) -> None:
+        self.filename = pathlib.Path(filename)
+        self.key_check = block_crypter.keyed_hash(b"manifest").hexdigest()
+        self.files: dict[str, dict] = {}
+        if self.filename.exists():
+            manifest = json.loads(self.filename.read_text(encoding="utf-8"))
+            if (manifest.get("version") == self.VERSION) and (manifest.get("key_check") == self.key_check):
+                self.files = manifest["files"]
+
+    def save(self) -> None:
+        """Save the manifest (atomically)."""
+        manifest = {"version": self.VERSION, "key_check": self.key_check, "files": self.files}
+        atomic_write_text(self.filename, json.dumps(manifest, indent=1, sort_keys=True))
+
+
+def find_files(directory: str | pathlib.Path, exclude: None | pathlib.Path = None) -> list[pathlib.Path]:
+    """Get all files in a directory tree.
+
+    Args:
+        directory (str | pathlib.Path): directory to be walked
+        exclude (None | pathlib.Path, optional): resolved path of a
+            directory to be skipped (e.g. the target directory)
+
+    Returns:
+        list[pathlib.Path]: files (directories are walked in sorted order)
+    """
+    files = []
+    for dir_path, dir_names, filenames in os.walk(directory):
+        current_dir = pathlib.Path(dir_path)
+        dir_names[:] = sorted(name for name in dir_names if (current_dir / name).resolve() != exclude)
+        files.extend(current_dir / name for name in sorted(filenames) if (current_dir / name).is_file())
+    return files
+
+
+def encrypt_directory_incremental(
+    block_crypter: BlockCrypter,
+    source_dir: str | pathlib.Path,
+    target_dir: str | pathlib.Path,
+    manifest_file: None | str | pathlib.Path = None,
+    zip_data: None | bool = None,
+) -> SyncReport:
+    """Encrypt all files in a directory tree, skipping unchanged files.
+
+    Every file in `source_dir` is encrypted to a block file with the same
+    relative path (plus `BLOCK_SUFFIX`) in `target_dir`. A manifest keeps
+    track of the encrypted files:
+      * a file with the same size and modification time is skipped
+      * a file with a changed modification time but the same content hash is
+        skipped (only the manifest is updated)
+      * all other files are (re-)encrypted, a file which changes while it
+        is encrypted is recorded without size and hash (it is encrypted
+        again the next run, its block file is removed when it is deleted)
+      * block files of source files which no longer exist are removed
+    The manifest is saved regularly, so an interrupted run keeps its
+    progress.
+
+    Args:
+        block_crypter (BlockCrypter): BlockCrypter to encrypt with
+        source_dir (str | pathlib.Path): directory with files to be encrypted
+        target_dir (str | pathlib.Path): directory for the block files
+        manifest_file (None | str | pathlib.Path, optional): manifest,
+            default: `MANIFEST_FILENAME` in `target_dir`
+        zip_data (None | bool, optional): compression mode
+
+    Returns:
+        SyncReport: number of files and bytes encrypted, skipped and removed
+    """
+    source_dir = pathlib.Path(source_dir)
+    target_dir = pathlib.Path(target_dir)
+    target_dir.mkdir(parents=True, exist_ok=True)
+    manifest = Manifest(target_dir / MANIFEST_FILENAME if manifest_file is None else manifest_file, block_crypter)
+    report = SyncReport()
+
+    seen = set()
+    last_save = time.monotonic()
+    try:
+        for source_file in find_files(source_dir, exclude=target_dir.resolve()):
+            rel_path = source_file.relative_to(source_dir).as_posix()
+            seen.add(rel_path)
+            stat = source_file.stat()
+            entry = manifest.files.get(rel_path)
+            block_file = target_dir / f"{rel_path}{BLOCK_SUFFIX}"
+
+            content_hash = None
+            if (entry is not None) and block_file.exists():
+                if (entry["size"] == stat.st_size) and (entry["mtime_ns"] == stat.st_mtime_ns):
+                    report.files_skipped += 1
+                    report.bytes_skipped += stat.st_size
+                    continue
+                if entry["size"] == stat.st_size:
+                    content_hash = hash_file(block_crypter, source_file)
+                    if content_hash == entry["hash"]:
+                        entry["mtime_ns"] = stat.st_mtime_ns
+                        report.files_skipped += 1
+                        report.bytes_skipped += stat.st_size
+                        continue
+
+            # hash before encrypting, the file must be unchanged afterwards for the hash to match the block
+            content_hash = hash_file(block_crypter, source_file) if content_hash is None else content_hash
+            report.bytes_encrypted += encrypt_file_atomic(block_crypter, source_file, block_file, zip_data=zip_data)
+            report.files_encrypted += 1
+            new_stat = source_file.stat()
+            if (new_stat.st_size, new_stat.st_mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+                entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": content_hash}
+            else:
+                # changed while encrypting: the block is recorded, but the entry never matches
+                entry = {"size": None, "mtime_ns": None, "hash": None}
+            manifest.files[rel_path] = entry | {"block": block_file.relative_to(target_dir).as_posix()}
+            if time.monotonic() - last_save >= MANIFEST_SAVE_INTERVAL:
+                manifest.save()
+                last_save = time.monotonic()
+
+        # remove block files of deleted source files
+        for rel_path in sorted(set(manifest.files) - seen):
+            (target_dir / manifest.files.pop(rel_path)["block"]).unlink(missing_ok=True)
+            report.files_removed += 1
+    finally:
+        manifest.save()
+    return report
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""SQLite catalog of the blocks in block files across directory trees."""
+
+import contextlib
+import dataclasses
+import itertools
+import pathlib
+import sqlite3
+from collections.abc import Iterable, Iterator
+
+from crippy_app import BlockCrypter, BlockInfo, InvalidBlockException, MissingFilenameException
+from crippy_batch import decrypt_lines_atomic, find_block_files
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blocks (
+    path TEXT NOT NULL REFERENCES files (path) ON DELETE CASCADE,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    content_type TEXT,
+    charset TEXT,
+    filename TEXT,
+    content_encoding TEXT,
+    transfer_encoding TEXT NOT NULL,
+    size INTEGER,
+    payload_size INTEGER NOT NULL,
+    PRIMARY KEY (path, offset)
+);
+CREATE INDEX IF NOT EXISTS blocks_filename ON blocks (filename);
+CREATE INDEX IF NOT EXISTS blocks_content_type ON blocks (content_type);
+"""
+
+
+@dataclasses.dataclass
+class CatalogEntry:
+    """A block in the catalog: where it is (file, byte offset and length) and what it holds."""
+
+    path: str
+    offset: int
+    length: int
+    content_type: None | str = None
+    charset: None | str = None
+    filename: None | str = None
+    content_encoding: None | str = None
+    transfer_encoding: str = "base64"
+    # size of the original data (Content-Length), None: unknown
+    size: None | int = None
+    # number of characters of the encoded, encrypted data
+    payload_size: int = 0
+
+
+@dataclasses.dataclass
+class RefreshReport:
+    """Result of refreshing a catalog."""
+
+    files_added: int = 0
+    files_updated: int = 0
+    files_unchanged: int = 0
+    files_removed: int = 0
+    blocks_indexed: int = 0
+    errors: dict[str, str] = dataclasses.field(default_factory=dict)
+
+
+def scan_file(block_crypter: BlockCrypter, block_file: str | pathlib.Path) -> list[CatalogEntry]:
+    """Find all blocks in a file with their byte offsets, from their headers only (nothing is decrypted).
+
+    Args:
+        block_crypter (BlockCrypter): BlockCrypter (defines the block markers,
+            the key is not used)
+        block_file (str | pathlib.Path): file with one or more blocks
+
+    Raises:
+        InvalidBlockException: error in block structure (or no block found)
+
+    Returns:
+        list[CatalogEntry]: the blocks in the file
+    """
+    entries = []
+    position = 0
+    line_start = 0
+    with open(block_file, "rb") as fh_in:
+
+        def lines() -> Iterator[str]:
+            nonlocal position, line_start
+            for line in fh_in:
+                line_start = position
+                position += len(line)
+                yield line.decode("ascii", errors="replace")
+
+        all_lines = lines()
+        for line in all_lines:
+            if block_crypter.contains_block(line):
+                offset = line_start
+                # the block is read from the same iterator, the lines after the block remain in `all_lines`
+                info = block_crypter.inspect_block(itertools.chain([line], all_lines))
+                entries.append(_create_entry(str(block_file), offset, position - offset, info))
+    if not entries:
+        raise InvalidBlockException("cannot find block markers")
+    return entries
+
+
+def _create_entry(path: str, offset: int, length: int, info: BlockInfo) -> CatalogEntry:
+    """Create a catalog entry from the location and the information of a block."""
+    return CatalogEntry(
+        path=path,
+        offset=offset,
+        length=length,
+        content_type=info.content_type,
+        charset=info.charset,
+        filename=info.filename,
+        content_encoding=info.content_encoding,
+        transfer_encoding=info.transfer_encoding,
+        size=info.size,
+        payload_size=info.payload_size,
+    )
+
+
+class Catalog:
+    """SQLite catalog of the blocks in block files across directory trees.
+
+    For every block the file, the byte offset and length of the block and
+    the information from its (plaintext) headers are recorded: content
+    type, charset, filename, encodings and sizes. No password is needed to
+    build the catalog. A refresh only scans new and changed files (by size
+    and modification time), a lookup returns the exact location of a block,
+    so a single block is read without scanning its file.
+    """
+
+    def __init__(self, database: str | pathlib.Path, block_crypter: None | BlockCrypter = None) -> None:
+        # the key is not used for scanning blocks
+        self.block_crypter = BlockCrypter(BlockCrypter.generate_key()) if block_crypter is None else block_crypter
+        self.connection = sqlite3.connect(database)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        """Close the database."""
+        self.connection.close()
+
+    def __enter__(self) -> "Catalog":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def refresh(self, paths: Iterable[str | pathlib.Path]) -> RefreshReport:
+        """Add new and changed block files in a list of files and directories to the catalog.
+
+        Files with the same size and modification time as in the catalog are
+        skipped. Files which are no longer in a refreshed directory (or are
+        no longer block files) are removed from the catalog.
+
+        Args:
+            paths (Iterable[str | pathlib.Path]): block files and/or directories
+
+        Returns:
+            RefreshReport: number of files added, updated, unchanged and
+                removed, number of blocks indexed and the error per failed file
+        """
+        report = RefreshReport()
+        roots = [pathlib.Path(path).resolve() for path in paths]
+        known = {path: (size, mtime_ns) for path, size, mtime_ns in self.connection.execute("SELECT * FROM files")}
+        found = set()
+        for block_file in find_block_files(self.block_crypter, roots):
+            path = str(block_file)
+            found.add(path)
+            stat = block_file.stat()
+            if known.get(path) == (stat.st_size, stat.st_mtime_ns):
+                report.files_unchanged += 1
+                continue
+            try:
+                entries = scan_file(self.block_crypter, block_file)
+            except Exception as exc:  # pylint: disable=broad-except
+                report.errors[path] = str(exc) or type(exc).__name__
+                found.discard(path)
+                continue
+            with self.connection:
+                self.connection.execute("DELETE FROM files WHERE path = ?", (path,))
+                self.connection.execute("INSERT INTO files VALUES (?, ?, ?)", (path, stat.st_size, stat.st_mtime_ns))
+                self.connection.executemany(
+                    "INSERT INTO blocks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (dataclasses.astuple(entry) for entry in entries),
+                )
+            report.blocks_indexed += len(entries)
+            if path in known:
+                report.files_updated += 1
+            else:
+                report.files_added += 1
+        removed = [
+            path
+            for path in known
+            if (path not in found) and any(pathlib.Path(path).is_relative_to(root) for root in roots)
+        ]
+        with self.connection:
+            self.connection.executemany("DELETE FROM files WHERE path = ?", ((path,) for path in removed))
+        report.files_removed = len(removed)
+        return report
+
+    def find(self, filename: None | str = None, content_type: None | str = None) -> list[CatalogEntry]:
+        """Find blocks by filename and/or content type.
+
+        Args:
+            filename (None | str, optional): filename of the block, may
+                contain the wildcards `*` and `?`, default: any
+            content_type (None | str, optional): content type, default: any
+
+        Returns:
+            list[CatalogEntry]: matching blocks (by file and offset)
+        """
+        conditions = []
+        parameters = []
+        if filename is not None:
+            conditions.append("filename GLOB ?")
+            parameters.append(filename)
+        if content_type is not None:
+            conditions.append("content_type = ?")
+            parameters.append(content_type)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self.connection.execute(f"SELECT * FROM blocks{where} ORDER BY path, offset", parameters)
+        return [CatalogEntry(*row) for row in rows]
+
+    def __len__(self) -> int:
+        (num_blocks,) = self.connection.execute("SELECT COUNT(*) FROM blocks").fetchone()
+        return num_blocks
+
+    @staticmethod
+    def iter_block_lines(entry: CatalogEntry) -> Iterator[str]:
+        """Read the lines of a block directly from its location (the file is not scanned).
+
+        Args:
+            entry (CatalogEntry): block from the catalog
+
+        Raises:
+            InvalidBlockException: the file changed since the catalog was
+                refreshed
+
+        Yields:
+            str: the next line of the block
+        """
+        with open(entry.path, "rb") as fh_in:
+            fh_in.seek(entry.offset)
+            num_bytes = 0
+            while num_bytes < entry.length:
+                if not (line := fh_in.readline(entry.length - num_bytes)):
+                    raise InvalidBlockException(f"block not found at offset {entry.offset}: '{entry.path}' changed?")
+                num_bytes += len(line)
+                yield line.decode("ascii")
+
+    def read_block(self, entry: CatalogEntry) -> str:
+        """Read a block directly from its location.
+
+        Args:
+            entry (CatalogEntry): block from the catalog
+
+        Returns:
+            str: the block
+        """
+        return "".join(self.iter_block_lines(entry))
+
+    def extract(
+        self, block_crypter: BlockCrypter, entry: CatalogEntry, directory: None | str | pathlib.Path = None
+    ) -> tuple[str, int]:
+        """Decrypt a block from the catalog to a file (streamed from its location).
+
+        The file gets the filename of the block, it is replaced atomically:
+        an existing file is left untouched when decryption fails.
+
+        Args:
+            block_crypter (BlockCrypter): BlockCrypter with the key
+            entry (CatalogEntry): block from the catalog
+            directory (None | str | pathlib.Path, optional): directory
+
+        Raises:
+            MissingFilenameException: the block has no filename
+
+        Returns:
+            tuple[str, int]: (filename, number_of_bytes_written)
+        """
+        if entry.filename is None:
+            raise MissingFilenameException("extract(): the block has no filename")
+        target_file = pathlib.Path(pathlib.Path(entry.filename).name)  # strip path
+        if directory is not None:
+            target_file = pathlib.Path(directory) / target_file
+        with contextlib.closing(self.iter_block_lines(entry)) as lines:
+            return str(target_file), decrypt_lines_atomic(block_crypter, lines, target_file)
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""Command line interface for batch operations with crippy blocks."""
+
+import pathlib
+
+import click
+
+import crippy_app
+import crippy_batch
+import crippy_catalog
+import crippy_shard
+import crippy_store
+import crippy_watch
+
+__version__ = "1.0.1"
+
+# environment variable which can hold the password
+PASSWORD_ENVVAR = "CRIPPY_PASSWORD"
+
+
+def password_option(function):
+    """Add a `--password` option (prompted for when missing)."""
+    return click.option(
+        "-p",
+        "--password",
+        envvar=PASSWORD_ENVVAR,
+        prompt=True,
+        hide_input=True,
+        help=f"password (default: environment variable '{PASSWORD_ENVVAR}' or prompt)",
+    )(function)
+
+
+def create_block_crypter(password: str) -> crippy_app.BlockCrypter:
+    """Create a BlockCrypter with a key derived from a password.
+
+    Args:
+        password (str): password
+
+    Returns:
+        crippy_app.BlockCrypter: BlockCrypter
+    """
+    return crippy_app.BlockCrypter(crippy_app.BlockCrypter.derive_key_from_password(password, salt=crippy_app.SALT))
+
+
+@click.group()
+@click.version_option(version=__version__, message="%(prog)s V%(version)s")
+def cli():
+    """Batch operations with crippy blocks."""
+
+
+@cli.command()
+@click.argument("source_dir", type=click.Path(exists=True, file_okay=False, path_type=pathlib.Path))
+@click.argument("target_dir", type=click.Path(file_okay=False, path_type=pathlib.Path))
+@click.option("--manifest", type=click.Path(dir_okay=False, path_type=pathlib.Path), help="manifest file")
+@click.option("--zip/--no-zip", "zip_data", default=None, help="compress the data (default: auto)")
+@password_option
+def sync(source_dir, target_dir, manifest, zip_data, password):
+    """Encrypt all new and changed files in SOURCE_DIR to TARGET_DIR.
+
+    Unchanged files are skipped, block files of deleted files are removed.
+    """
+    report = crippy_batch.encrypt_directory_incremental(
+        create_block_crypter(password), source_dir, target_dir, manifest_file=manifest, zip_data=zip_data
+    )
+    click.echo(f"Encrypted: {report.files_encrypted:,} files ({report.bytes_encrypted:,} bytes)")
+    click.echo(f"Skipped:   {report.files_skipped:,} files ({report.bytes_skipped:,} bytes)")
+    click.echo(f"Removed:   {report.files_removed:,} files")
+
+
+@cli.command()
+@click.argument("source", type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path))
+@click.argument("target", type=click.Path(dir_okay=False, path_type=pathlib.Path))
+@click.option(
+    "--transfer-encoding",
+    type=click.Choice(crippy_app.TRANSFER_ENCODINGS),
+    default=crippy_app.TRANSFER_ENCODINGS[0],
+    help="encoding of a block written",
+)
+def convert(source, target, transfer_encoding):
+    """Convert a block (SOURCE) to a binary container (TARGET) or vice versa.
+
+    The encrypted data is not decrypted, so no password is needed.
+    """
+    # the key is not used for a conversion
+    block_crypter = crippy_app.BlockCrypter(crippy_app.BlockCrypter.generate_key())
+    with open(source, "rb") as fh_in:
+        is_container = crippy_app.is_container(fh_in.read(16))
+    if is_container:
+        with open(source, "rb") as fh_in, open(target, "w", encoding="ascii", newline="\n") as fh_out:
+            block_crypter.container_to_block(fh_in, fh_out, transfer_encoding=transfer_encoding)
+        click.echo(f"Converted container '{source}' to block '{target}'.")
+    else:
+        with open(source, encoding="ascii") as fh_in, open(target, "wb") as fh_out:
+            block_crypter.block_to_container(fh_in, fh_out)
+        click.echo(f"Converted block '{source}' to container '{target}'.")
+
+
+@cli.command("ls")
+@click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True, path_type=pathlib.Path))
+def list_blocks(paths):
+    """List the blocks in PATHS (files and/or directories) using their headers only.
+
+    Nothing is decrypted, so no password is needed. Columns: size of the
+    original data ('?': unknown), size of the encrypted data, content
+    type, charset, content encoding, transfer encoding, filename and file.
+    """
+    # the key is not used for inspecting blocks
+    block_crypter = crippy_app.BlockCrypter(crippy_app.BlockCrypter.generate_key())
+    report = crippy_batch.inspect_files(block_crypter, paths)
+    for block_file, infos in report.blocks.items():
+        for info in infos:
+            size = "?" if info.size is None else f"{info.size:,}"
+            encodings = f"{info.content_encoding or '-'}  {info.transfer_encoding}{'/chunked' if info.chunked else ''}"
+            click.echo(
+                f"{size:>15}  {info.payload_size:>15,}  {info.content_type or '-':<24}  {info.charset or '-':<8}  "
+                f"{encodings:<22}  {info.filename or '-'}  {block_file}"
+            )
+    for filename, error in sorted(report.errors.items()):
+        click.echo(f"Failed: {filename}: {error}", err=True)
+    if report.errors:
+        raise click.exceptions.Exit(1)
+
+
+@cli.command()
+@click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True, path_type=pathlib.Path))
+@click.option("--jobs", type=click.IntRange(1), help="number of parallel processes (default: number of CPUs)")
+@password_option
+def verify(paths, jobs, password):
+    """Verify the integrity of all block files in PATHS (files and/or directories).
+
+    The signature of every token and the order of the chunks are checked,
+    nothing is decrypted. A wrong password makes every file fail.
+    """
+    report = crippy_batch.verify_files(create_block_crypter(password), paths, max_workers=jobs)
+    click.echo(f"Passed: {report.files_passed:,} files ({report.blocks_passed:,} blocks)")
+    for filename, error in sorted(report.errors.items()):
+        click.echo(f"Failed: {filename}: {error}", err=True)
+    if report.errors:
+        raise click.exceptions.Exit(1)
+
+
+@cli.command()
+@click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True, path_type=pathlib.Path))
+@click.option("--jobs", type=click.IntRange(1), help="number of parallel processes (default: number of CPUs)")
+@click.option("--key-id/--no-key-id", default=False, help="add a Key-Id header to the re-encrypted blocks")
+@password_option
+@click.option("--new-password", prompt=True, hide_input=True, confirmation_prompt=True, help="new password")
+def rotate(paths, jobs, key_id, password, new_password):
+    """Re-encrypt all block files in PATHS (files and/or directories) with a new password.
+
+    Files are replaced atomically, files already encrypted with the new
+    password are skipped: an interrupted rotation can be run again.
+    """
+    new_block_crypter = create_block_crypter(new_password)
+    new_block_crypter.include_key_id = key_id
+    report = crippy_batch.rotate_keys(create_block_crypter(password), new_block_crypter, paths, max_workers=jobs)
+    click.echo(f"Rotated: {report.files_rotated:,} files ({report.blocks_rotated:,} blocks)")
+    click.echo(f"Skipped: {report.files_skipped:,} files (already rotated)")
+    for filename, error in sorted(report.errors.items()):
+        click.echo(f"Failed:  {filename}: {error}", err=True)
+    if report.errors:
+        raise click.exceptions.Exit(1)
+
+
+@cli.command()
+@click.argument("source", type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path))
+@click.argument("target_dir", type=click.Path(file_okay=False, path_type=pathlib.Path))
+@click.option("--max-size", type=click.IntRange(1024), default=1024 * 1024, show_default=True, help="maximum part size")
+@click.option("--zip/--no-zip", "zip_data", default=None, help="compress the data (default: auto)")
+@password_option
+def split(source, target_dir, max_size, zip_data, password):
+    """Encrypt SOURCE to numbered parts (blocks) of at most --max-size characters in TARGET_DIR.
+
+    The parts can be sent separately (e.g. by mail) and joined in any order.
+    """
+    parts = create_block_crypter(password).encrypt_to_parts(
+        crippy_app.DataObject.from_file(source, zip_data=zip_data), max_size=max_size
+    )
+    target_dir.mkdir(parents=True, exist_ok=True)
+    for number, part in enumerate(parts, start=1):
+        (target_dir / f"{source.name}.part{number:03d}{crippy_batch.BLOCK_SUFFIX}").write_text(
+            part, encoding="ascii", newline="\n"
+        )
+    click.echo(f"Encrypted '{source}' to {len(parts):,} parts in '{target_dir}'.")
+
+
+@cli.command()
+@click.argument("target", type=click.Path(dir_okay=False, path_type=pathlib.Path))
+@click.argument("parts", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path))
+@password_option
+def join(target, parts, password):
+    """Decrypt the PARTS (files, in any order) of a split file to TARGET.
+
+    All parts are verified before TARGET is written.
+    """
+    block_crypter = create_block_crypter(password)
+    part_texts = [part.read_text(encoding="ascii") for part in parts]
+    tmp_file = target.with_name(f"{target.name}.tmp")
+    try:
+        with open(tmp_file, "wb") as fh_out:
+            info = block_crypter.decrypt_parts(part_texts, fh_out)
+    except Exception:
+        tmp_file.unlink(missing_ok=True)
+        raise
+    tmp_file.replace(target)
+    click.echo(f"Decrypted {info.size:,} bytes to '{target}'.")
+
+
+@cli.command()
+@click.argument("target", type=click.Path(dir_okay=False, path_type=pathlib.Path))
+@click.argument("files", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path))
+@click.option("--zip/--no-zip", "zip_data", default=None, help="compress the data (default: auto)")
+@password_option
+def bundle(target, files, zip_data, password):
+    """Encrypt many (small) FILES into a single block (TARGET).
+
+    All files are compressed together and share one header.
+    """
+    items = [crippy_app.DataObject.from_file(filename, zip_data=False) for filename in files]
+    block = create_block_crypter(password).encrypt_to_block(crippy_app.DataObject.from_items(items, zip_data=zip_data))
+    crippy_batch.atomic_write_text(target, block)
+    click.echo(f"Bundled {len(items):,} files into '{target}'.")
+
+
+@cli.command()
+@click.argument("block_file", type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path))
+@click.argument("target_dir", type=click.Path(file_okay=False, path_type=pathlib.Path))
+@click.option("--item", "item_name", help="extract only the item with this filename")
+@click.option("--list", "list_only", is_flag=True, help="list the items, extract nothing")
+@password_option
+def unbundle(block_file, target_dir, item_name, list_only, password):
+    """Extract the items of a bundle (BLOCK_FILE) to TARGET_DIR.
+
+    Items without a filename (text) are written as 'item-<number>.txt'.
+    """
+    block_crypter = create_block_crypter(password)
+    with open(block_file, encoding="ascii") as fh_in:
+        if list_only:
+            for number, item in enumerate(block_crypter.read_bundle_index(fh_in)):
+                click.echo(f"{number:>6}  {item.size:>15,}  {item.content_type:<24}  {item.filename or '-'}")
+            return
+        if item_name is not None:
+            items = {0: block_crypter.extract_item(fh_in, item_name)}
+        else:
+            items = dict(enumerate(block_crypter.decrypt_from_block(fh_in.read()).items()))
+    target_dir.mkdir(parents=True, exist_ok=True)
+    for number, item in items.items():
+        filename = pathlib.Path(item.filename).name if item.filename else f"item-{number:03d}.txt"
+        item.to_file(target_dir / filename)
+    click.echo(f"Extracted {len(items):,} items to '{target_dir}'.")
+
+
+@cli.command()
+@click.argument("watch_dir", type=click.Path(exists=True, file_okay=False, path_type=pathlib.Path))
+@click.argument("output_dir", type=click.Path(file_okay=False, path_type=pathlib.Path))
+@click.option("--mode", type=click.Choice(crippy_watch.WATCH_MODES), default="auto", show_default=True)
+@click.option(
+    "--settle", type=click.FloatRange(0), default=2.0, show_default=True, help="seconds a file must be unchanged"
+)
+@click.option("--interval", type=click.FloatRange(0.1), default=1.0, show_default=True, help="seconds between polls")
+@click.option("--jobs", type=click.IntRange(1), default=2, show_default=True, help="number of parallel workers")
+@click.option("--state", type=click.Path(dir_okay=False, path_type=pathlib.Path), help="state file")
+@password_option
+def watch(watch_dir, output_dir, mode, settle, interval, jobs, state, password):
+    """Watch WATCH_DIR and encrypt (or decrypt) files to OUTPUT_DIR as they arrive.
+
+    In "auto" mode block files are decrypted and all other files are
+    encrypted. Every file is processed at most once (recorded in the state
+    file), stop watching with Ctrl+C.
+    """
+
+    def report(event: crippy_watch.WatchEvent) -> None:
+        if event.status == "done":
+            click.echo(f"{event.path} -> {event.target} ({event.num_bytes:,} bytes)")
+        else:
+            click.echo(f"Failed: {event.path}: {event.error}", err=True)
+
+    watcher = crippy_watch.FolderWatcher(
+        create_block_crypter(password),
+        watch_dir,
+        output_dir,
+        mode=mode,
+        settle_time=settle,
+        workers=jobs,
+        state_file=state,
+    )
+    click.echo(f"Watching '{watch_dir}' (Ctrl+C to stop)...")
+    try:
+        watcher.run(interval=interval, callback=report)
+    except KeyboardInterrupt:
+        for event in watcher.close():
+            report(event)
+
+
+@cli.command("train-zdict")
+@click.argument("target", type=click.Path(dir_okay=False, path_type=pathlib.Path))
+@click.argument("samples", nargs=-1, required=True, type=click.Path(exists=True, path_type=pathlib.Path))
+@click.option("--size", type=click.IntRange(1, crippy_app.ZDICT_SIZE), default=crippy_app.ZDICT_SIZE, show_default=True)
+def train_zdict(target, samples, size):
+    """Train a preset dictionary (TARGET) for compressing short messages.
+
+    Every file in SAMPLES (files and/or directories) is one sample message.
+    """
+    sample_files = []
+    for sample in samples:
+        sample_files.extend(sorted(p for p in sample.rglob("*") if p.is_file()) if sample.is_dir() else [sample])
+    zdict = crippy_app.train_zdict((sample_file.read_bytes() for sample_file in sample_files), size=size)
+    target.write_bytes(zdict)
+    click.echo(f"Trained dictionary of {len(zdict):,} bytes from {len(sample_files):,} samples.")
+    click.echo(f"Dictionary id: {crippy_app.register_zdict(zdict)}")
+
+
+@cli.group()
+def catalog():
+    """SQLite catalog of the blocks in block files (no password needed to build it)."""
+
+
+@catalog.command("refresh")
+@click.argument("database", type=click.Path(dir_okay=False, path_type=pathlib.Path))
+@click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True, path_type=pathlib.Path))
+def catalog_refresh(database, paths):
+    """Add new and changed block files in PATHS (files and/or directories) to DATABASE.
+
+    Unchanged files (same size and modification time) are skipped, deleted
+    files are removed from the catalog.
+    """
+    with crippy_catalog.Catalog(database) as block_catalog:
+        report = block_catalog.refresh(paths)
+    click.echo(f"Added:     {report.files_added:,} files")
+    click.echo(f"Updated:   {report.files_updated:,} files")
+    click.echo(f"Unchanged: {report.files_unchanged:,} files")
+    click.echo(f"Removed:   {report.files_removed:,} files")
+    click.echo(f"Indexed:   {report.blocks_indexed:,} blocks")
+    for filename, error in sorted(report.errors.items()):
+        click.echo(f"Failed:    {filename}: {error}", err=True)
+    if report.errors:
+        raise click.exceptions.Exit(1)
+
+
+@catalog.command("find")
+@click.argument("database", type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path))
+@click.option("--filename", help="filename of the block (wildcards: * and ?)")
+@click.option("--content-type", help="content type of the block")
+def catalog_find(database, filename, content_type):
+    """Find blocks in DATABASE by filename and/or content type.
+
+    Columns: file, byte offset, length of the block, size of the original
+    data ('?': unknown), content type and filename.
+    """
+    with crippy_catalog.Catalog(database) as block_catalog:
+        entries = block_catalog.find(filename=filename, content_type=content_type)
+    for entry in entries:
+        size = "?" if entry.size is None else f"{entry.size:,}"
+        click.echo(
+            f"{entry.path}  {entry.offset:>12}  {entry.length:>12}  {size:>15}  {entry.content_type or '-':<24}  "
+            f"{entry.filename or '-'}"
+        )
+
+
+@catalog.command("extract")
+@click.argument("database", type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path))
+@click.argument("filename")
+@click.argument("target_dir", type=click.Path(exists=True, file_okay=False, path_type=pathlib.Path))
+@password_option
+def catalog_extract(database, filename, target_dir, password):
+    """Decrypt the block(s) with FILENAME (wildcards: * and ?) from DATABASE to TARGET_DIR.
+
+    Every block is read directly from its location, no block file is scanned.
+    """
+    block_crypter = create_block_crypter(password)
+    with crippy_catalog.Catalog(database) as block_catalog:
+        entries = block_catalog.find(filename=filename)
+        if not entries:
+            raise click.ClickException(f"no block found with filename '{filename}'")
+        for entry in entries:
+            (target_file, num_bytes) = block_catalog.extract(block_crypter, entry, target_dir)
+            click.echo(f"Extracted {num_bytes:,} bytes to '{target_file}'.")
+
+
+@cli.group()
+def job():
+    """Large batch jobs described by a job file, shared by workers on one or more hosts."""
+
+
+@job.command("run")
+@click.argument("job_file", type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path))
+@click.option("--processes", type=click.IntRange(1), default=1, show_default=True, help="number of worker processes")
+@password_option
+def job_run(job_file, processes, password):
+    """Process shards of JOB_FILE until all shards are completed.
+
+    Run it on several hosts (sharing the filesystem) to spread the work, a
+    shard of a crashed worker is taken over when its lease expires.
+    """
+    try:
+        report = crippy_shard.run_workers(create_block_crypter(password), job_file, processes=processes)
+    except crippy_app.InvalidDataException as exc:
+        raise click.ClickException(str(exc)) from exc
+    click.echo(f"Processed: {report.files_processed:,} files ({report.bytes_processed:,} bytes)")
+    click.echo(f"Completed: {report.shards_completed:,} shards")
+    for filename, error in sorted(report.errors.items()):
+        click.echo(f"Failed:    {filename}: {error}", err=True)
+    if report.errors:
+        raise click.exceptions.Exit(1)
+
+
+@job.command("status")
+@click.argument("job_file", type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path))
+def job_status(job_file):
+    """Show the progress of JOB_FILE (of all workers)."""
+    try:
+        status = crippy_shard.job_status(job_file)
+    except crippy_app.InvalidDataException as exc:
+        raise click.ClickException(str(exc)) from exc
+    click.echo(
+        f"Shards: {status.shards_completed:,} of {status.shards:,} completed, {status.shards_leased:,} in progress"
+    )
+    click.echo(f"Files:  {status.files_done:,} of {status.files:,} done, {status.files_failed:,} failed")
+
+
+@cli.group()
+def store():
+    """Deduplicating store for encrypted versions of files."""
+
+
+@store.command("put")
+@click.argument("store_dir", type=click.Path(file_okay=False, path_type=pathlib.Path))
+@click.argument("filename", type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path))
+@click.option("--name", help="name in the store (default: name of the file)")
+@password_option
+def store_put(store_dir, filename, name, password):
+    """Store a new version of FILENAME in STORE_DIR."""
+    report = crippy_store.ChunkStore(store_dir, create_block_crypter(password)).put(filename, name=name)
+    click.echo(f"Version:    {report.version}")
+    click.echo(f"Chunks:     {report.num_chunks:,} ({report.num_bytes:,} bytes)")
+    click.echo(f"New chunks: {report.new_chunks:,} ({report.new_bytes:,} bytes)")
+
+
+@store.command("get")
+@click.argument("store_dir", type=click.Path(exists=True, file_okay=False, path_type=pathlib.Path))
+@click.argument("name")
+@click.argument("target_file", type=click.Path(dir_okay=False, path_type=pathlib.Path))
+@click.option("--version", "version", help="version to restore (default: latest)")
+@password_option
+def store_get(store_dir, name, target_file, version, password):
+    """Restore (a version of) NAME from STORE_DIR to TARGET_FILE."""
+    num_bytes = crippy_store.ChunkStore(store_dir, create_block_crypter(password)).get(name, target_file, version)
+    click.echo(f"Restored {num_bytes:,} bytes to '{target_file}'.")
+
+
+@store.command("versions")
+@click.argument("store_dir", type=click.Path(exists=True, file_okay=False, path_type=pathlib.Path))
+@click.argument("name")
+@password_option
+def store_versions(store_dir, name, password):
+    """List the versions of NAME in STORE_DIR."""
+    for version in crippy_store.ChunkStore(store_dir, create_block_crypter(password)).versions(name):
+        click.echo(version)
+
+
+if __name__ == "__main__":
+    # pylint: disable=no-value-for-parameter
+    cli()
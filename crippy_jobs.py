@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Run (long running) jobs in the background using a thread pool."""
+
+import pathlib
+import time
+from collections.abc import Callable
+from typing import Any
+
+from PySide6 import QtCore, QtWidgets
+
+
+class JobSignals(QtCore.QObject):
+    """Signals of a `Job` (a QRunnable can not emit signals itself)."""
+
+    started = QtCore.Signal()
+    finished = QtCore.Signal(object)
+    failed = QtCore.Signal(str)
+
+
+class Job(QtCore.QRunnable):
+    """Run a function in a thread pool and report the result using signals.
+
+    The `started` signal is emitted when the function starts, the `finished`
+    signal with the result of the function and the `failed` signal with the
+    error message when the function raised an exception. All signals are
+    delivered in the thread of the receiver (i.e. the GUI thread). The
+    running time of the function is available as `elapsed` (in seconds).
+    """
+
+    def __init__(self, function: Callable[..., Any], *args: Any, **kwargs: Any) -> None:
+        super().__init__()
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = JobSignals()
+        self.elapsed = 0.0
+
+    def run(self) -> None:
+        """Run the function (called by the thread pool)."""
+        self.signals.started.emit()
+        start = time.perf_counter()
+        try:
+            result = self.function(*self.args, **self.kwargs)
+        except Exception as exc:  # pylint: disable=broad-except
+            self.elapsed = time.perf_counter() - start
+            self.signals.failed.emit(str(exc) or type(exc).__name__)
+        else:
+            self.elapsed = time.perf_counter() - start
+            self.signals.finished.emit(result)
+
+
+class JobQueuePanel(QtWidgets.QDockWidget):
+    """Dockable panel with a queue of file jobs.
+
+    Jobs are run by a thread pool with a bounded number of workers, the
+    panel shows the status of every job: the number of bytes processed,
+    the speed (bytes per second) and the resulting file or the error.
+    A job function must return a tuple: (resulting file, number of bytes).
+    """
+
+    COLUMNS = ("File", "Status", "Bytes", "Speed", "Result")
+    DEFAULT_MAX_WORKERS = 4
+
+    def __init__(self, parent: None | QtWidgets.QWidget = None, max_workers: None | int = None) -> None:
+        super().__init__("Queue", parent)
+        self.setObjectName("dw_queue")
+        self.table = QtWidgets.QTableWidget(0, len(self.COLUMNS), self)
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.setWidget(self.table)
+        if max_workers is None:
+            max_workers = min(self.DEFAULT_MAX_WORKERS, QtCore.QThread.idealThreadCount())
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(max(1, max_workers))
+        self._jobs: set[Job] = set()
+
+    def _set(self, row: int, column: str, text: str) -> None:
+        """Set the text of a cell."""
+        item = QtWidgets.QTableWidgetItem(text)
+        if column in ("Bytes", "Speed"):
+            item.setTextAlignment(QtCore.Qt.AlignmentFlag.AlignRight | QtCore.Qt.AlignmentFlag.AlignVCenter)
+        self.table.setItem(row, self.COLUMNS.index(column), item)
+
+    def add_job(self, name: str, function: Callable[[], tuple[pathlib.Path, int]]) -> None:
+        """Add a job to the queue.
+
+        Args:
+            name (str): name of the job (e.g. the file being processed)
+            function (Callable[[], tuple[pathlib.Path, int]]): job, returns
+                the resulting file and the number of bytes processed
+        """
+        row = self.table.rowCount()
+        self.table.insertRow(row)
+        self._set(row, "File", name)
+        self._set(row, "Status", "queued")
+        job = Job(function)
+        self._jobs.add(job)
+
+        def on_finished(result: tuple[pathlib.Path, int]) -> None:
+            self._jobs.discard(job)
+            (target_file, num_bytes) = result
+            self._set(row, "Status", "done")
+            self._set(row, "Bytes", f"{num_bytes:,}")
+            self._set(row, "Speed", f"{num_bytes / max(job.elapsed, 1e-6) / 1e6:,.1f} MB/s")
+            self._set(row, "Result", str(target_file))
+
+        def on_failed(error: str) -> None:
+            self._jobs.discard(job)
+            self._set(row, "Status", "failed")
+            self._set(row, "Result", error)
+
+        job.signals.started.connect(lambda: self._set(row, "Status", "running"))
+        job.signals.finished.connect(on_finished)
+        job.signals.failed.connect(on_failed)
+        self.pool.start(job)
+        self.show()
+
+    def is_busy(self) -> bool:
+        """Check if there are queued or running jobs."""
+        return bool(self._jobs)
+
+    def clear_finished(self) -> None:
+        """Remove all rows when no jobs are queued or running."""
+        if not self.is_busy():
+            self.table.setRowCount(0)
@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""Large batch jobs described by a job file, sharded over worker processes (on one or more hosts)."""
+
+import concurrent.futures
+import copy
+import dataclasses
+import json
+import os
+import pathlib
+import secrets
+import socket
+import time
+from collections.abc import Iterator
+
+from crippy_app import TRANSFER_ENCODINGS, BlockCrypter, InvalidBlockException, InvalidDataException
+from crippy_batch import (
+    BLOCK_SUFFIX,
+    atomic_write_text,
+    decrypt_file_atomic,
+    encrypt_file_atomic,
+    find_files,
+    is_block_file,
+)
+
+# processing modes: "auto" decrypts block files and encrypts all other files
+JOB_MODES = ("encrypt", "decrypt", "auto")
+
+# name of the plan (the shards) in the work directory of a job
+PLAN_FILENAME = "plan.json"
+
+
+@dataclasses.dataclass
+class JobSpec:
+    """Description of a batch job, read from a JSON job file.
+
+    Example of a job file (paths are relative to the job file):
+        {
+          "inputs": ["incoming", "extra/file.bin"],
+          "output": "encrypted",
+          "mode": "encrypt",
+          "codec": {"transfer_encoding": "base85", "zip": true, "width": 76},
+          "concurrency": {"shard_size": 100, "threads": 2, "lease_time": 300}
+        }
+
+    All workers of a job share its work directory (next to the job file):
+    the plan with the shards, a lease file per shard being processed and a
+    checkpoint per shard.
+    """
+
+    inputs: list[pathlib.Path]
+    output: pathlib.Path
+    # directory of the job file, paths in the plan are relative to it (it may be mounted elsewhere on another host)
+    base_dir: pathlib.Path
+    work_dir: pathlib.Path
+    mode: str = "encrypt"
+    transfer_encoding: str = TRANSFER_ENCODINGS[0]
+    zip_data: None | bool = None
+    width: None | int = None
+    # number of files per shard
+    shard_size: int = 100
+    # number of threads per worker process
+    threads: int = 1
+    # seconds after which the shard of a worker which stopped renewing its lease is taken over (the lease is renewed
+    # after every file, so it must be longer than the time needed for the largest file)
+    lease_time: float = 300.0
+
+    @classmethod
+    def load(cls, job_file: str | pathlib.Path) -> "JobSpec":
+        """Read a job file.
+
+        Args:
+            job_file (str | pathlib.Path): JSON job file
+
+        Raises:
+            InvalidDataException: error in the job file
+
+        Returns:
+            JobSpec: the job
+        """
+        job_file = pathlib.Path(job_file)
+        try:
+            spec = json.loads(job_file.read_text(encoding="utf-8"))
+            codec = spec.get("codec", {})
+            concurrency = spec.get("concurrency", {})
+            job = cls(
+                inputs=[job_file.parent / path for path in spec["inputs"]],
+                output=job_file.parent / spec["output"],
+                base_dir=job_file.parent,
+                work_dir=job_file.with_name(f"{job_file.name}.work"),
+                mode=spec.get("mode", "encrypt"),
+                transfer_encoding=codec.get("transfer_encoding", TRANSFER_ENCODINGS[0]),
+                zip_data=codec.get("zip"),
+                width=codec.get("width"),
+                shard_size=int(concurrency.get("shard_size", 100)),
+                threads=int(concurrency.get("threads", 1)),
+                lease_time=float(concurrency.get("lease_time", 300.0)),
+            )
+        except (ValueError, KeyError, TypeError, AttributeError) as exc:
+            raise InvalidDataException(f"invalid job file '{job_file}': {exc}") from exc
+        if job.mode not in JOB_MODES:
+            raise InvalidDataException(f"mode '{job.mode}' is not supported")
+        if job.transfer_encoding not in TRANSFER_ENCODINGS:
+            raise InvalidDataException(f"transfer_encoding '{job.transfer_encoding}' is not supported")
+        if (job.shard_size < 1) or (job.threads < 1) or (job.lease_time <= 0):
+            raise InvalidDataException("shard_size, threads and lease_time must be positive")
+        return job
+
+    def iter_inputs(self) -> Iterator[tuple[str, str]]:
+        """Get all input files: their path in the output directory and their path relative to `base_dir`.
+
+        Yields:
+            tuple[str, str]: (relative output path, relative input path)
+        """
+        for path in self.inputs:
+            files = find_files(path, exclude=self.output.resolve()) if path.is_dir() else [path]
+            for file in files:
+                rel_path = file.relative_to(path).as_posix() if path.is_dir() else path.name
+                yield (rel_path, pathlib.Path(os.path.relpath(file, self.base_dir)).as_posix())
+
+
+@dataclasses.dataclass
+class JobReport:
+    """Result of a worker run."""
+
+    shards_completed: int = 0
+    files_processed: int = 0
+    bytes_processed: int = 0
+    errors: dict[str, str] = dataclasses.field(default_factory=dict)
+
+
+@dataclasses.dataclass
+class JobStatus:
+    """Progress of a job (of all workers)."""
+
+    shards: int = 0
+    shards_completed: int = 0
+    shards_leased: int = 0
+    files: int = 0
+    files_done: int = 0
+    files_failed: int = 0
+
+
+def default_worker_id() -> str:
+    """Get an id for this worker process: host name and process id."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Lease:
+    """Exclusive, time limited claim of a shard (or the plan) by one worker, stored in a lock file.
+
+    A lease is taken by creating the lock file exclusively. The owner renews
+    it while working, a lease which was not renewed within `duration`
+    seconds (the worker crashed or hangs) can be taken over by another
+    worker. The lock file works on a filesystem shared by several hosts, the
+    clocks of the hosts must be (roughly) synchronized. Leases are advisory:
+    in a rare race two workers may process the same file, every output file
+    is written atomically, so the result is the same.
+    """
+
+    def __init__(self, path: str | pathlib.Path, owner: str, duration: float) -> None:
+        self.path = pathlib.Path(path)
+        self.owner = owner
+        self.duration = duration
+
+    def _read(self) -> None | tuple[str, dict]:
+        """Read the lock file.
+
+        Returns:
+            None | tuple[str, dict]: None: no lock file, else its content and
+                the lease (an incomplete lock file expires based on its
+                modification time)
+        """
+        try:
+            text = self.path.read_text(encoding="utf-8")
+            try:
+                return text, json.loads(text)
+            except ValueError:
+                return text, {"owner": None, "expires": self.path.stat().st_mtime + self.duration}
+        except FileNotFoundError:
+            return None
+
+    def _create(self) -> bool:
+        """Create the lock file exclusively."""
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w", encoding="utf-8") as fh_out:
+            fh_out.write(json.dumps({"owner": self.owner, "expires": time.time() + self.duration}))
+        return True
+
+    def acquire(self) -> bool:
+        """Try to take the lease (a free or an expired lease).
+
+        Returns:
+            bool: the lease is ours
+        """
+        if self._create():
+            return True
+        if (current := self._read()) is None:
+            return self._create()
+        (text, lease) = current
+        if lease["expires"] > time.time():
+            return False
+        # expired: move the lock file out of the way (only one worker succeeds) and check what was moved
+        stale_file = self.path.with_name(f"{self.path.name}.{secrets.token_hex(4)}.stale")
+        try:
+            os.replace(self.path, stale_file)
+        except FileNotFoundError:
+            return False
+        if stale_file.read_text(encoding="utf-8") != text:
+            # another worker took the lease in the meantime, give it back
+            os.replace(stale_file, self.path)
+            return False
+        stale_file.unlink()
+        return self._create()
+
+    def is_leased(self) -> bool:
+        """Check if the lease is taken (and not expired) by any worker."""
+        return ((current := self._read()) is not None) and (current[1]["expires"] > time.time())
+
+    def renew(self) -> bool:
+        """Extend the lease.
+
+        Returns:
+            bool: the lease is still ours, `False`: it was taken over
+        """
+        if ((current := self._read()) is None) or (current[1]["owner"] != self.owner):
+            return False
+        atomic_write_text(self.path, json.dumps({"owner": self.owner, "expires": time.time() + self.duration}))
+        return True
+
+    def release(self) -> None:
+        """Give up the lease (when it is still ours)."""
+        if ((current := self._read()) is not None) and (current[1]["owner"] == self.owner):
+            self.path.unlink(missing_ok=True)
+
+
+def _load_json(filename: pathlib.Path, default: dict) -> dict:
+    """Read a JSON file written by `atomic_write_text()`."""
+    return json.loads(filename.read_text(encoding="utf-8")) if filename.exists() else default
+
+
+def load_plan(job: JobSpec, worker_id: None | str = None) -> list[list[list[str]]]:
+    """Get the shards of a job, the plan is created (once) by the first worker.
+
+    A shard is a list of input files: [relative output path, input path
+    relative to `base_dir`].
+
+    Args:
+        job (JobSpec): the job
+        worker_id (None | str, optional): id of this worker, default:
+            `default_worker_id()`
+
+    Returns:
+        list[list[list[str]]]: the input files per shard
+    """
+    job.work_dir.mkdir(parents=True, exist_ok=True)
+    plan_file = job.work_dir / PLAN_FILENAME
+    lease = Lease(job.work_dir / "plan.lock", default_worker_id() if worker_id is None else worker_id, job.lease_time)
+    while not plan_file.exists():
+        if lease.acquire():
+            try:
+                if not plan_file.exists():
+                    files = [list(item) for item in job.iter_inputs()]
+                    shards = [files[i : i + job.shard_size] for i in range(0, len(files), job.shard_size)]
+                    atomic_write_text(plan_file, json.dumps({"shards": shards}))
+            finally:
+                lease.release()
+        else:
+            time.sleep(0.1)
+    return _load_json(plan_file, {})["shards"]
+
+
+def _job_block_crypter(block_crypter: BlockCrypter, job: JobSpec) -> BlockCrypter:
+    """Get a copy of a BlockCrypter with the codec of a job."""
+    block_crypter = copy.copy(block_crypter)
+    block_crypter.default_transfer_encoding = job.transfer_encoding
+    if job.width is not None:
+        block_crypter.default_width = job.width
+    return block_crypter
+
+
+def process_job_file(block_crypter: BlockCrypter, job: JobSpec, rel_path: str, source: str | pathlib.Path) -> int:
+    """Encrypt or decrypt one input file of a job to the output directory (with the same relative path).
+
+    Args:
+        block_crypter (BlockCrypter): BlockCrypter (with the codec of the job)
+        job (JobSpec): the job
+        rel_path (str): relative path of the input file
+        source (str | pathlib.Path): input file
+
+    Raises:
+        InvalidBlockException: the input file is not a block file (mode
+            "decrypt")
+
+    Returns:
+        int: number of bytes encrypted / decrypted
+    """
+    target_file = job.output / rel_path
+    target_file.parent.mkdir(parents=True, exist_ok=True)
+    is_block = job.mode != "encrypt" and is_block_file(block_crypter, source)
+    if (job.mode == "decrypt") and not is_block:
+        raise InvalidBlockException("not a block file")
+    if not is_block:
+        target_file = target_file.with_name(f"{target_file.name}{BLOCK_SUFFIX}")
+        return encrypt_file_atomic(block_crypter, source, target_file, zip_data=job.zip_data)
+    if target_file.suffix == BLOCK_SUFFIX:
+        target_file = target_file.with_suffix("")
+    else:
+        target_file = target_file.with_name(f"{target_file.name}.out")
+    return decrypt_file_atomic(block_crypter, source, target_file)
+
+
+def _run_shard(
+    block_crypter: BlockCrypter, job: JobSpec, index: int, files: list[list[str]], lease: Lease, report: JobReport
+) -> bool:
+    """Process the files of a shard which are not done yet, checkpointing after every file.
+
+    Returns:
+        bool: the shard is completed, `False`: the lease was lost
+    """
+    checkpoint_file = job.work_dir / f"shard-{index:05d}.json"
+    checkpoint = _load_json(checkpoint_file, {"completed": False, "done": [], "errors": {}})
+    finished = set(checkpoint["done"]) | set(checkpoint["errors"])
+    with concurrent.futures.ThreadPoolExecutor(job.threads, thread_name_prefix="crippy-shard") as executor:
+        futures = {
+            executor.submit(process_job_file, block_crypter, job, rel_path, job.base_dir / source): rel_path
+            for rel_path, source in files
+            if rel_path not in finished
+        }
+        for future in concurrent.futures.as_completed(futures):
+            rel_path = futures[future]
+            try:
+                report.bytes_processed += future.result()
+            except Exception as exc:  # pylint: disable=broad-except
+                checkpoint["errors"][rel_path] = report.errors[rel_path] = str(exc) or type(exc).__name__
+            else:
+                checkpoint["done"].append(rel_path)
+                report.files_processed += 1
+            atomic_write_text(checkpoint_file, json.dumps(checkpoint))
+            if not lease.renew():
+                executor.shutdown(wait=True, cancel_futures=True)
+                return False
+    checkpoint["completed"] = True
+    atomic_write_text(checkpoint_file, json.dumps(checkpoint))
+    report.shards_completed += 1
+    return True
+
+
+def run_worker(
+    block_crypter: BlockCrypter, job_file: str | pathlib.Path, worker_id: None | str = None, poll_interval: float = 1.0
+) -> JobReport:
+    """Process shards of a job until all shards are completed (by any worker).
+
+    Any number of workers (processes, possibly on several hosts sharing a
+    filesystem) can run the same job at the same time. A worker leases a
+    free shard, processes its files and records every finished file in the
+    checkpoint of the shard. The shard of a worker which crashed is taken
+    over when its lease expires and continues from the checkpoint.
+
+    Args:
+        block_crypter (BlockCrypter): BlockCrypter with the key
+        job_file (str | pathlib.Path): JSON job file
+        worker_id (None | str, optional): id of this worker, default:
+            `default_worker_id()`
+        poll_interval (float, optional): seconds between looking for shards
+            when all remaining shards are leased by other workers
+
+    Returns:
+        JobReport: shards and files processed by this worker, errors per file
+    """
+    job = JobSpec.load(job_file)
+    worker_id = default_worker_id() if worker_id is None else worker_id
+    block_crypter = _job_block_crypter(block_crypter, job)
+    shards = load_plan(job, worker_id)
+    report = JobReport()
+    while True:
+        remaining = 0
+        for index, files in enumerate(shards):
+            if _load_json(job.work_dir / f"shard-{index:05d}.json", {}).get("completed"):
+                continue
+            remaining += 1
+            lease = Lease(job.work_dir / f"shard-{index:05d}.lock", worker_id, job.lease_time)
+            if not lease.acquire():
+                continue
+            try:
+                if _run_shard(block_crypter, job, index, files, lease, report):
+                    remaining -= 1
+            finally:
+                lease.release()
+        if remaining == 0:
+            return report
+        time.sleep(poll_interval)
+
+
+def run_workers(block_crypter: BlockCrypter, job_file: str | pathlib.Path, processes: int = 1) -> JobReport:
+    """Run a number of worker processes for a job on this host (see `run_worker()`).
+
+    Args:
+        block_crypter (BlockCrypter): BlockCrypter with the key
+        job_file (str | pathlib.Path): JSON job file
+        processes (int, optional): number of worker processes
+
+    Returns:
+        JobReport: shards and files processed by these workers, errors per file
+    """
+    if processes <= 1:
+        return run_worker(block_crypter, job_file)
+    report = JobReport()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [executor.submit(run_worker, block_crypter, job_file) for _ in range(processes)]
+        for future in concurrent.futures.as_completed(futures):
+            worker_report = future.result()
+            report.shards_completed += worker_report.shards_completed
+            report.files_processed += worker_report.files_processed
+            report.bytes_processed += worker_report.bytes_processed
+            report.errors.update(worker_report.errors)
+    return report
+
+
+def job_status(job_file: str | pathlib.Path) -> JobStatus:
+    """Get the progress of a job from its plan, leases and checkpoints.
+
+    Args:
+        job_file (str | pathlib.Path): JSON job file
+
+    Returns:
+        JobStatus: number of shards (completed, leased) and files (done, failed)
+    """
+    job = JobSpec.load(job_file)
+    status = JobStatus()
+    shards = _load_json(job.work_dir / PLAN_FILENAME, {"shards": []})["shards"]
+    for index, files in enumerate(shards):
+        checkpoint = _load_json(
+            job.work_dir / f"shard-{index:05d}.json", {"completed": False, "done": [], "errors": {}}
+        )
+        status.shards += 1
+        status.shards_completed += checkpoint["completed"]
+        status.shards_leased += Lease(job.work_dir / f"shard-{index:05d}.lock", "", job.lease_time).is_leased()
+        status.files += len(files)
+        status.files_done += len(checkpoint["done"])
+        status.files_failed += len(checkpoint["errors"])
+    return status
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""Deduplicating store for encrypted versions of files."""
+
+import dataclasses
+import datetime as dt
+import hashlib
+import json
+import math
+import os
+import pathlib
+import zlib
+from collections.abc import Iterator
+from typing import IO
+
+from crippy_app import BlockCrypter, DataObject, InvalidBlockException
+
+
+class ChunkNotFoundException(Exception):
+    """A chunk referenced by a version is missing from the store."""
+
+
+class VersionNotFoundException(Exception):
+    """The requested version is not in the store."""
+
+
+class ContentDefinedChunker:
+    """Split data into chunks with boundaries defined by the content.
+
+    A boundary depends only on the data just before it. After a change
+    (insertion, deletion or modification) the boundaries resynchronise
+    quickly, so a file with a small change shares almost all of its chunks
+    with the previous version.
+
+    Candidate boundaries are found at C speed: the bytes are translated
+    using `NGRAM` keyed tables (one per position in the n-gram) and combined
+    using a (big integer) XOR. Every position where this n-gram hash is zero
+    is a candidate (on average one every 256 bytes, also for text). A
+    candidate becomes a boundary when the CRC32 of the `WINDOW` bytes ending
+    at the candidate has a number of zero bits (see `_find_boundary()` for
+    chunks larger than `avg_size`). Tables and CRC seed are
+    derived from a key, so the chunk boundaries reveal nothing about the
+    content. Chunks are at least `min_size` and at most `max_size` bytes,
+    the average is about `avg_size`.
+    """
+
+    NGRAM = 4
+    WINDOW = 32
+
+    def __init__(
+        self, key: bytes, min_size: int = 16 * 1024, avg_size: int = 64 * 1024, max_size: int = 256 * 1024
+    ) -> None:
+        self.min_size = max(min_size, self.WINDOW)
+        self.avg_size = max(avg_size, self.min_size)
+        self.max_size = max(max_size, self.avg_size)
+        self._tables = [
+            bytes(sorted(range(256), key=lambda b, n=n: hashlib.sha256(key + bytes([n, b])).digest()))
+            for n in range(self.NGRAM)
+        ]
+        self._seed = int.from_bytes(hashlib.sha256(key).digest()[:4], "big")
+        # a candidate is found every 256 bytes (on average)
+        self._mask = (1 << max(0, round(math.log2(max(1, self.avg_size - self.min_size) / 256)))) - 1
+
+    def _ngram_hashes(self, data: bytes) -> bytes:
+        """Calculate the n-gram hash for every position in `data`."""
+        ngram_hash = 0
+        for n, table in enumerate(self._tables):
+            ngram_hash ^= int.from_bytes(data.translate(table), "little") << (8 * n)
+        return (ngram_hash & ((1 << (8 * len(data))) - 1)).to_bytes(len(data), "little")
+
+    def _find_boundary(self, data: bytes, ngram_hashes: bytes, start: int) -> int:
+        """Find the end of the chunk starting at `start` (-1: not in `data`).
+
+        Up to `avg_size` a candidate must also pass the CRC32 check, beyond
+        `avg_size` every candidate is a boundary (normalised chunking: data
+        with few candidates, like repetitive text, still gets chunks of
+        about `avg_size` bytes).
+        """
+        pos = start + self.min_size - 1
+        end = min(len(data), start + self.avg_size)
+        while (pos := ngram_hashes.find(0, pos, end)) != -1:
+            if zlib.crc32(data[pos + 1 - self.WINDOW : pos + 1], self._seed) & self._mask == 0:
+                return pos + 1
+            pos += 1
+        if end < start + self.avg_size:
+            return -1
+        end = min(len(data), start + self.max_size)
+        if (pos := ngram_hashes.find(0, start + self.avg_size, end)) != -1:
+            return pos + 1
+        return end if end == start + self.max_size else -1
+
+    def chunks(self, fh_in: IO[bytes], read_size: int = 1024 * 1024) -> Iterator[bytes]:
+        """Split a binary stream into chunks.
+
+        Args:
+            fh_in (IO[bytes]): binary stream
+            read_size (int, optional): number of bytes read at once
+
+        Yields:
+            bytes: the next chunk
+        """
+        data = b""
+        eof = False
+        while True:
+            # make sure the buffer holds at least one complete chunk (or all remaining data)
+            while not eof and (len(data) < max(read_size, self.max_size)):
+                new_data = fh_in.read(read_size)
+                eof = not new_data
+                data += new_data
+            ngram_hashes = self._ngram_hashes(data)
+            start = 0
+            while (end := self._find_boundary(data, ngram_hashes, start)) != -1:
+                yield data[start:end]
+                start = end
+            data = data[start:]
+            if eof:
+                if data:
+                    yield data
+                return
+
+
+@dataclasses.dataclass
+class StoreReport:
+    """Result of storing a version of a file."""
+
+    version: str
+    num_chunks: int = 0
+    new_chunks: int = 0
+    num_bytes: int = 0
+    new_bytes: int = 0
+
+
+class ChunkStore:
+    """Deduplicating store for encrypted versions of files.
+
+    Files are split into content defined chunks. Every unique chunk is
+    compressed (when useful), encrypted and stored once under its keyed
+    hash (the chunk id). A version of a file is stored as a small encrypted
+    recipe (a text block) with the list of chunk ids. Storing a new version
+    of a large file with a small change only costs compression, encryption
+    and storage of the changed chunks.
+
+    Layout of the store directory:
+        chunks/<id[:2]>/<id>              encrypted chunks (Fernet tokens)
+        versions/<name_id>/<version>.txt  recipes (text blocks)
+
+    File names are only stored inside the (encrypted) recipes, on disk a
+    keyed hash of the name is used.
+    """
+
+    def __init__(self, directory: str | pathlib.Path, block_crypter: BlockCrypter, **chunker_args) -> None:
+        self.directory = pathlib.Path(directory)
+        self.block_crypter = block_crypter
+        self.chunker = ContentDefinedChunker(block_crypter.keyed_hash(b"chunker").digest(), **chunker_args)
+
+    def _chunk_file(self, chunk_id: str) -> pathlib.Path:
+        return self.directory / "chunks" / chunk_id[:2] / chunk_id
+
+    def _version_dir(self, name: str) -> pathlib.Path:
+        return self.directory / "versions" / self.block_crypter.keyed_hash(name.encode("utf-8")).hexdigest()[:32]
+
+    @staticmethod
+    def _write_atomic(filename: pathlib.Path, data: bytes) -> None:
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = filename.with_name(f"{filename.name}.tmp")
+        tmp_file.write_bytes(data)
+        os.replace(tmp_file, filename)
+
+    def _put_chunk(self, chunk: bytes) -> tuple[str, bool]:
+        """Store a chunk (when not already present).
+
+        Returns:
+            tuple[str, bool]: (chunk id, chunk is new)
+        """
+        chunk_id = self.block_crypter.keyed_hash(chunk).hexdigest()
+        chunk_file = self._chunk_file(chunk_id)
+        if chunk_file.exists():
+            return chunk_id, False
+        zipped_chunk = zlib.compress(chunk)
+        payload = b"z" + zipped_chunk if len(zipped_chunk) < len(chunk) else b"r" + chunk
+        self._write_atomic(chunk_file, self.block_crypter.encrypt(payload))
+        return chunk_id, True
+
+    def _get_chunk(self, chunk_id: str) -> bytes:
+        """Get a chunk (decrypted and verified)."""
+        chunk_file = self._chunk_file(chunk_id)
+        if not chunk_file.exists():
+            raise ChunkNotFoundException(f"chunk not found: '{chunk_id}'")
+        payload = self.block_crypter.decrypt(chunk_file.read_bytes())
+        chunk = zlib.decompress(payload[1:]) if payload[:1] == b"z" else payload[1:]
+        if self.block_crypter.keyed_hash(chunk).hexdigest() != chunk_id:
+            raise InvalidBlockException(f"chunk does not match its id: '{chunk_id}'")
+        return chunk
+
+    def put(self, filename: str | pathlib.Path, name: None | str = None) -> StoreReport:
+        """Store a new version of a file.
+
+        Args:
+            filename (str | pathlib.Path): file to be stored
+            name (None | str, optional): name in the store, default: the
+                name of the file (without directory)
+
+        Returns:
+            StoreReport: version id and number of (new) chunks and bytes
+        """
+        filename = pathlib.Path(filename)
+        name = filename.name if name is None else name
+        report = StoreReport(version=dt.datetime.now(dt.timezone.utc).strftime("%Y%m%dT%H%M%S%fZ"))
+        chunks = []
+        with open(filename, "rb") as fh_in:
+            for chunk in self.chunker.chunks(fh_in):
+                chunk_id, is_new = self._put_chunk(chunk)
+                chunks.append([chunk_id, len(chunk)])
+                report.num_chunks += 1
+                report.num_bytes += len(chunk)
+                if is_new:
+                    report.new_chunks += 1
+                    report.new_bytes += len(chunk)
+        recipe = {"name": name, "version": report.version, "size": report.num_bytes, "chunks": chunks}
+        block = self.block_crypter.encrypt_to_block(DataObject.from_str(json.dumps(recipe)))
+        self._write_atomic(self._version_dir(name) / f"{report.version}.txt", block.encode("ascii"))
+        return report
+
+    def versions(self, name: str) -> list[str]:
+        """Get the versions of a file (oldest first).
+
+        Args:
+            name (str): name in the store
+
+        Returns:
+            list[str]: version ids
+        """
+        version_dir = self._version_dir(name)
+        if not version_dir.exists():
+            return []
+        return sorted(recipe.stem for recipe in version_dir.glob("*.txt"))
+
+    def get(self, name: str, target_file: str | pathlib.Path, version: None | str = None) -> int:
+        """Restore a version of a file.
+
+        The data is written to a temporary file which replaces the target
+        file only when all chunks were restored, an existing file is left
+        untouched when a chunk is missing or corrupt.
+
+        Args:
+            name (str): name in the store
+            target_file (str | pathlib.Path): file to be written
+            version (None | str, optional): version id, default: latest
+
+        Raises:
+            VersionNotFoundException: the version does not exist
+
+        Returns:
+            int: number of bytes written
+        """
+        if version is None:
+            if not (versions := self.versions(name)):
+                raise VersionNotFoundException(f"no versions found for '{name}'")
+            version = versions[-1]
+        recipe_file = self._version_dir(name) / f"{version}.txt"
+        if not recipe_file.exists():
+            raise VersionNotFoundException(f"version '{version}' not found for '{name}'")
+        recipe = json.loads(self.block_crypter.decrypt_from_block(recipe_file.read_text(encoding="ascii")).as_str())
+        target_file = pathlib.Path(target_file)
+        tmp_file = target_file.with_name(f"{target_file.name}.tmp")
+        num_bytes = 0
+        try:
+            with open(tmp_file, "wb") as fh_out:
+                for chunk_id, _ in recipe["chunks"]:
+                    num_bytes += fh_out.write(self._get_chunk(chunk_id))
+            os.replace(tmp_file, target_file)
+        finally:
+            tmp_file.unlink(missing_ok=True)
+        return num_bytes
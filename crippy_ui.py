@@ -18,10 +18,10 @@
     QTransform)
 from PySide6.QtWidgets import (QApplication, QCheckBox, QGridLayout, QGroupBox,
     QHBoxLayout, QLabel, QLineEdit, QMainWindow,
-    QMenu, QMenuBar, QPlainTextEdit, QPushButton,
-    QSizePolicy, QSpacerItem, QStatusBar, QVBoxLayout,
-    QWidget)
+    QMenu, QMenuBar, QPushButton, QSizePolicy,
+    QSpacerItem, QStatusBar, QVBoxLayout, QWidget)
 
+from myoutputtextedit import MyOutputTextEdit
 from myplaintextedit import MyPlainTextEdit
 import crippy_rc
 
@@ -51,6 +51,10 @@ def setupUi(self, MainWindow):
         self.decrypt_input_to_output.setObjectName(u"decrypt_input_to_output")
         self.decrypt_input_to_file = QAction(MainWindow)
         self.decrypt_input_to_file.setObjectName(u"decrypt_input_to_file")
+        self.encrypt_file_to_file = QAction(MainWindow)
+        self.encrypt_file_to_file.setObjectName(u"encrypt_file_to_file")
+        self.decrypt_file_to_file = QAction(MainWindow)
+        self.decrypt_file_to_file.setObjectName(u"decrypt_file_to_file")
         self.main_widget = QWidget(MainWindow)
         self.main_widget.setObjectName(u"main_widget")
         self.verticalLayout = QVBoxLayout(self.main_widget)
@@ -153,7 +157,7 @@ def setupUi(self, MainWindow):
         self.horizontalLayout_5.setContentsMargins(11, 11, 11, 11)
         self.horizontalLayout_5.setObjectName(u"horizontalLayout_5")
         self.horizontalLayout_5.setContentsMargins(6, 6, 6, 6)
-        self.te_output = QPlainTextEdit(self.gb_output)
+        self.te_output = MyOutputTextEdit(self.gb_output)
         self.te_output.setObjectName(u"te_output")
         self.te_output.setFont(font)
         self.te_output.setAcceptDrops(False)
@@ -186,13 +190,16 @@ def setupUi(self, MainWindow):
         self.menu_bar.addAction(self.menu_decrypt.menuAction())
         self.menu_bar.addAction(self.menu_help.menuAction())
         self.menu_file.addAction(self.file_new)
+        self.menu_file.addAction(self.file_save)
         self.menu_file.addSeparator()
         self.menu_file.addAction(self.file_exit)
         self.menu_help.addAction(self.help_about)
         self.menu_encrypt.addAction(self.encrypt_input_to_output)
         self.menu_encrypt.addAction(self.encrypt_file_to_output)
+        self.menu_encrypt.addAction(self.encrypt_file_to_file)
         self.menu_decrypt.addAction(self.decrypt_input_to_output)
         self.menu_decrypt.addAction(self.decrypt_input_to_file)
+        self.menu_decrypt.addAction(self.decrypt_file_to_file)
 
         self.retranslateUi(MainWindow)
 
@@ -225,6 +232,8 @@ def retranslateUi(self, MainWindow):
         self.encrypt_file_to_output.setText(QCoreApplication.translate("MainWindow", u"File -> Output", None))
         self.decrypt_input_to_output.setText(QCoreApplication.translate("MainWindow", u"Input -> Output", None))
         self.decrypt_input_to_file.setText(QCoreApplication.translate("MainWindow", u"Input -> File", None))
+        self.encrypt_file_to_file.setText(QCoreApplication.translate("MainWindow", u"File -> File", None))
+        self.decrypt_file_to_file.setText(QCoreApplication.translate("MainWindow", u"File -> File", None))
         self.gb_settings.setTitle(QCoreApplication.translate("MainWindow", u"Settings", None))
         self.lb_password.setText(QCoreApplication.translate("MainWindow", u"Password:", None))
         self.le_password.setPlaceholderText(QCoreApplication.translate("MainWindow", u"enter password...", None))
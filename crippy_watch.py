@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""Watch a directory tree and encrypt (or decrypt) files as they arrive."""
+
+import concurrent.futures
+import dataclasses
+import json
+import os
+import pathlib
+import threading
+import time
+from collections.abc import Callable
+
+from crippy_app import BlockCrypter, InvalidBlockException
+from crippy_batch import BLOCK_SUFFIX, atomic_write_text, encrypt_file_atomic, is_block_file, process_file
+
+# default name of the state file (in the output directory)
+STATE_FILENAME = "watch_state.json"
+
+# processing modes: "auto" decrypts block files and encrypts all other files
+WATCH_MODES = ("auto", "encrypt", "decrypt")
+
+# files with these suffixes are still being written (partial uploads, our own temporary files)
+IGNORE_SUFFIXES = (".tmp", ".part", ".partial")
+
+
+@dataclasses.dataclass
+class WatchEvent:
+    """Result of processing a file which arrived in the watched directory."""
+
+    # path relative to the watched directory
+    path: str
+    # "done" or "failed"
+    status: str
+    target: None | str = None
+    num_bytes: int = 0
+    error: None | str = None
+
+
+class WatchState:
+    """Files handed to a worker, kept in a small JSON state file.
+
+    A file is recorded (claimed) before it is processed and the state is
+    saved right away, so every version of a file (by size and modification
+    time) is processed at most once: after a crash, a claimed file which
+    was not finished is not processed again (its status stays "claimed").
+    A file which changes afterwards is a new arrival.
+    """
+
+    VERSION = 1
+
+    def __init__(self, filename: str | pathlib.Path) -> None:
+        self.filename = pathlib.Path(filename)
+        self.files: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        if self.filename.exists():
+            state = json.loads(self.filename.read_text(encoding="utf-8"))
+            if state.get("version") == self.VERSION:
+                self.files = state["files"]
+
+    def is_known(self, rel_path: str, stat: os.stat_result) -> bool:
+        """Check if this version of a file was already claimed."""
+        with self._lock:
+            entry = self.files.get(rel_path)
+        return (entry is not None) and (entry["size"], entry["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns)
+
+    def claim(self, rel_path: str, stat: os.stat_result) -> None:
+        """Record a file as being processed (saved before it is processed)."""
+        with self._lock:
+            self.files[rel_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "status": "claimed"}
+            self._save()
+
+    def finish(self, event: WatchEvent) -> None:
+        """Record the result of processing a file."""
+        with self._lock:
+            entry = self.files[event.path]
+            entry["status"] = event.status
+            if event.target is not None:
+                entry["target"] = event.target
+            if event.error is not None:
+                entry["error"] = event.error
+            self._save()
+
+    def _save(self) -> None:
+        """Save the state (atomically)."""
+        state = {"version": self.VERSION, "files": self.files}
+        atomic_write_text(self.filename, json.dumps(state, indent=1, sort_keys=True))
+
+
+class FolderWatcher:
+    """Watch a directory tree (by polling) and process new files in a bounded worker pool.
+
+    A file is only processed when it has settled: its size and modification
+    time did not change for `settle_time` seconds (it is no longer being
+    written). Settled files are encrypted to block files (or block files are
+    decrypted) in `output_dir`, with the same relative directory. At most
+    `2 * workers` files are queued or being processed, other settled files
+    wait for a later poll. Every version of a file is processed at most once
+    (see `WatchState`).
+
+    Example:
+        with FolderWatcher(block_crypter, "incoming", "encrypted") as watcher:
+            watcher.run(callback=print)
+    """
+
+    def __init__(
+        self,
+        block_crypter: BlockCrypter,
+        watch_dir: str | pathlib.Path,
+        output_dir: str | pathlib.Path,
+        mode: str = "auto",
+        settle_time: float = 2.0,
+        workers: int = 2,
+        state_file: None | str | pathlib.Path = None,
+        zip_data: None | bool = None,
+    ) -> None:
+        if mode not in WATCH_MODES:
+            raise ValueError(f"mode '{mode}' is not supported")
+        self.block_crypter = block_crypter
+        self.watch_dir = pathlib.Path(watch_dir)
+        self.output_dir = pathlib.Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.mode = mode
+        self.settle_time = settle_time
+        self.workers = max(1, workers)
+        self.zip_data = zip_data
+        self.state = WatchState(self.output_dir / STATE_FILENAME if state_file is None else state_file)
+        self._executor = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix="crippy-watch")
+        self._running: dict[concurrent.futures.Future, str] = {}
+        # (size, mtime_ns) of files which are not settled yet and the (monotonic) time they were first seen like that
+        self._observed: dict[str, tuple[tuple[int, int], float]] = {}
+
+    def close(self) -> list[WatchEvent]:
+        """Stop the worker pool, queued files and files being processed are finished first.
+
+        Returns:
+            list[WatchEvent]: results of the files finished since the last poll
+        """
+        self._executor.shutdown(wait=True)
+        return self._collect()
+
+    def __enter__(self) -> "FolderWatcher":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def _iter_candidates(self) -> list[tuple[str, pathlib.Path, os.stat_result]]:
+        """Get all files in the watched directory which were not processed yet (sorted)."""
+        excluded = {self.output_dir.resolve(), self.state.filename.resolve()}
+        candidates = []
+        for dir_path, dir_names, filenames in os.walk(self.watch_dir):
+            current_dir = pathlib.Path(dir_path)
+            dir_names[:] = sorted(name for name in dir_names if (current_dir / name).resolve() not in excluded)
+            for name in sorted(filenames):
+                path = current_dir / name
+                if name.startswith(".") or name.endswith(IGNORE_SUFFIXES) or path.resolve() in excluded:
+                    continue
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue  # removed in the meantime
+                rel_path = path.relative_to(self.watch_dir).as_posix()
+                if not self.state.is_known(rel_path, stat):
+                    candidates.append((rel_path, path, stat))
+        return candidates
+
+    def _settled(self, rel_path: str, stat: os.stat_result, now: float) -> bool:
+        """Check if a file did not change for `settle_time` seconds (observations are updated)."""
+        signature = (stat.st_size, stat.st_mtime_ns)
+        (last_signature, since) = self._observed.get(rel_path, (None, now))
+        if signature != last_signature:
+            self._observed[rel_path] = (signature, now)
+            return self.settle_time <= 0
+        return now - since >= self.settle_time
+
+    def _process(self, source: pathlib.Path, target_dir: pathlib.Path) -> tuple[pathlib.Path, int]:
+        """Encrypt or decrypt a file (according to the mode) to a target directory."""
+        is_block = is_block_file(self.block_crypter, source)
+        if (self.mode == "decrypt") and not is_block:
+            raise InvalidBlockException("not a block file")
+        if (self.mode == "encrypt") or not is_block:
+            target_file = target_dir / f"{source.name}{BLOCK_SUFFIX}"
+            return target_file, encrypt_file_atomic(self.block_crypter, source, target_file, zip_data=self.zip_data)
+        return process_file(self.block_crypter, source, target_dir)
+
+    def _collect(self) -> list[WatchEvent]:
+        """Get the results of the finished files."""
+        events = []
+        for future in [future for future in self._running if future.done()]:
+            rel_path = self._running.pop(future)
+            try:
+                (target_file, num_bytes) = future.result()
+            except Exception as exc:  # pylint: disable=broad-except
+                event = WatchEvent(rel_path, "failed", error=str(exc) or type(exc).__name__)
+            else:
+                event = WatchEvent(rel_path, "done", target=str(target_file), num_bytes=num_bytes)
+            self.state.finish(event)
+            events.append(event)
+        return events
+
+    def poll(self) -> list[WatchEvent]:
+        """Look for new, settled files once and hand them to the worker pool.
+
+        Returns:
+            list[WatchEvent]: results of the files finished since the last poll
+        """
+        events = self._collect()
+        in_progress = set(self._running.values())
+        now = time.monotonic()
+        candidates = self._iter_candidates()
+        # forget files which were removed (or processed)
+        candidate_paths = {rel_path for rel_path, _, _ in candidates}
+        self._observed = {rel_path: value for rel_path, value in self._observed.items() if rel_path in candidate_paths}
+        for rel_path, path, stat in candidates:
+            if (rel_path in in_progress) or not self._settled(rel_path, stat, now):
+                continue
+            if len(self._running) >= 2 * self.workers:
+                break
+            self.state.claim(rel_path, stat)
+            del self._observed[rel_path]
+            target_dir = self.output_dir / pathlib.PurePosixPath(rel_path).parent
+            self._running[self._executor.submit(self._process, path, target_dir)] = rel_path
+        return events
+
+    def is_busy(self) -> bool:
+        """Check if files are queued or being processed."""
+        return bool(self._running)
+
+    def run(
+        self,
+        interval: float = 1.0,
+        stop: None | threading.Event = None,
+        callback: None | Callable[[WatchEvent], None] = None,
+    ) -> None:
+        """Watch the directory until `stop` is set.
+
+        Args:
+            interval (float, optional): seconds between two polls
+            stop (None | threading.Event, optional): stops watching when set,
+                default: watch forever (until interrupted)
+            callback (None | Callable[[WatchEvent], None], optional): called
+                with the result of every processed file
+        """
+        stop = threading.Event() if stop is None else stop
+        while True:
+            for event in self.poll():
+                if callback is not None:
+                    callback(event)
+            if stop.wait(interval):
+                break
+        for event in self.close():
+            if callback is not None:
+                callback(event)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Read-only QPlainTextEdit which shows (very) large texts without blocking."""
+
+import pathlib
+from typing import Any
+
+from PySide6.QtCore import QMimeData, QTimer
+from PySide6.QtGui import QTextCursor
+from PySide6.QtWidgets import QPlainTextEdit
+
+
+class MyOutputTextEdit(QPlainTextEdit):
+    """Read-only QPlainTextEdit which shows (very) large texts without blocking.
+
+    The text is kept in a backing buffer and added to the widget piece by
+    piece (`CHUNK_CHARS` characters at a time) from the event loop, so the
+    GUI stays responsive while a multi-MB block is shown. At most
+    `MAX_SHOWN_CHARS` characters are shown, the rest is only in the backing
+    buffer. Copying the entire text (e.g. after 'Select All') and saving
+    always use the complete text from the backing buffer.
+    """
+
+    CHUNK_CHARS = 256 * 1024
+    MAX_SHOWN_CHARS = 8 * 1024 * 1024
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._text = ""
+        self._num_shown = 0
+        self._timer = QTimer(self)
+        self._timer.setInterval(0)
+        self._timer.timeout.connect(self._show_next_chunk)
+
+    def setPlainText(self, text: str) -> None:  # pylint: disable=invalid-name
+        """Set the text (shown incrementally).
+
+        Args:
+            text (str): new text
+        """
+        self._timer.stop()
+        self._text = text
+        self._num_shown = 0
+        super().setPlainText("")
+        if text:
+            self._timer.start()
+
+    def toPlainText(self) -> str:  # pylint: disable=invalid-name
+        """Get the complete text (from the backing buffer).
+
+        Returns:
+            str: complete text
+        """
+        return self._text
+
+    def clear(self) -> None:
+        """Clear the text."""
+        self.setPlainText("")
+
+    def _show_next_chunk(self) -> None:
+        """Add the next piece of the text to the widget."""
+        end = min(len(self._text), self._num_shown + self.CHUNK_CHARS, self.MAX_SHOWN_CHARS)
+        cursor = QTextCursor(self.document())
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertText(self._text[self._num_shown : end])
+        self._num_shown = end
+        if end == len(self._text):
+            self._timer.stop()
+        elif end == self.MAX_SHOWN_CHARS:
+            self._timer.stop()
+            cursor.insertText(f"\n\n[... {len(self._text) - end:,} more characters, use Copy or Save ...]")
+
+    def createMimeDataFromSelection(self) -> QMimeData:  # pylint: disable=invalid-name
+        """Create the data for copy (and drag): the complete text when everything is selected."""
+        cursor = self.textCursor()
+        if (
+            self._text
+            and (cursor.selectionStart() == 0)
+            and (cursor.selectionEnd() >= self.document().characterCount() - 1)
+        ):
+            mime_data = QMimeData()
+            mime_data.setText(self._text)
+            return mime_data
+        return super().createMimeDataFromSelection()
+
+    def save(self, filename: str | pathlib.Path, encoding: str = "utf-8") -> int:
+        """Save the complete text to a file (piece by piece).
+
+        Args:
+            filename (str | pathlib.Path): file to be written
+            encoding (str, optional): encoding, defaults to "utf-8"
+
+        Returns:
+            int: number of characters written
+        """
+        with open(filename, "w", encoding=encoding, newline="\n") as fh_out:
+            for pos in range(0, len(self._text), self.CHUNK_CHARS):
+                fh_out.write(self._text[pos : pos + self.CHUNK_CHARS])
+        return len(self._text)
@@ -12,10 +12,12 @@ class MyPlainTextEdit(QPlainTextEdit):
     """QPlainTextEdit with drag and drop support for files.
 
     This widget will emit a signal `file_dropped` (with the filename) when a
-    file is dropped.
+    single file is dropped, or a signal `files_dropped` (with a list of
+    filenames) when multiple files are dropped at once.
     """
 
     file_dropped = Signal(pathlib.Path)
+    files_dropped = Signal(list)
 
     def dragEnterEvent(self, event: Any) -> None:
         """Accept drag events for URLs (i.e. filenames)"""
@@ -27,8 +29,10 @@ def dropEvent(self, event: Any) -> None:
         """Handle a drop event."""
         mime_data = event.mimeData()
         if mime_data.hasUrls():
-            url = mime_data.urls()[0]
-            filename = pathlib.Path(url.toLocalFile())
-            self.file_dropped.emit(filename)
+            filenames = [pathlib.Path(url.toLocalFile()) for url in mime_data.urls()]
+            if len(filenames) == 1:
+                self.file_dropped.emit(filenames[0])
+            else:
+                self.files_dropped.emit(filenames)
         else:
             super().dropEvent(event)
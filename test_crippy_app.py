@@ -2,19 +2,39 @@
 """Unit tests for crippy_app.py"""
 
 import base64
+import concurrent.futures
+import copy
+import gc
 import inspect
+import io
+import mmap
 import pathlib
+import random
+import tempfile
+import threading
+import time
 import unittest
 import unittest.mock as mk
 import zlib
 
+from cryptography.fernet import Fernet, InvalidToken
+
+import crippy_app
 from crippy_app import (
+    BUNDLE_CONTENT_TYPE,
     BlockCrypter,
+    BlockInfo,
     DataObject,
+    DecompressionLimitException,
     InvalidBlockException,
     InvalidContentException,
     InvalidDataException,
+    KeyNotFoundException,
+    Keyring,
+    MemoryBudget,
     MissingFilenameException,
+    register_zdict,
+    train_zdict,
 )
 
 # pylint: disable=missing-class-docstring, missing-function-docstring, no-value-for-parameter, unused-argument
@@ -846,5 +866,936 @@ def test034_create_dataobject_application_octet_stream_with_spaces_in_filename_z
         self.assertEqual(mk_data_obj.mock_calls[0], expected_call)
 
 
+class TestBlockCrypterStream(unittest.TestCase):
+    KEY = Fernet.generate_key()
+
+    def setUp(self):
+        self.bc = BlockCrypter(self.KEY, chunk_size=1024)
+        tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_path = pathlib.Path(tmp_dir.name)
+        self.src_dir = self.tmp_path / "src"
+        (self.src_dir / "sub").mkdir(parents=True)
+        (self.src_dir / "a.txt").write_text("test\n" * 1000, encoding="utf-8")
+        (self.src_dir / "sub" / "b.bin").write_bytes(random.Random(0).randbytes(10_000))
+
+    def _encrypted_directory(self):
+        fh_out = io.StringIO()
+        self.bc.encrypt_directory_to_block(self.src_dir, fh_out)
+        return fh_out.getvalue()
+
+    def test001_encrypt_directory_to_block_headers(self):
+        block = self._encrypted_directory()
+        self.assertIn("Content-Type: application/x-tar\n", block)
+        self.assertIn('Content-Disposition: attachment; filename="src.tar"\n', block)
+        self.assertIn("Transfer-Encoding: chunked\n", block)
+
+    def test002_encrypt_directory_to_block_not_a_directory(self):
+        with self.assertRaises(InvalidDataException):
+            self.bc.encrypt_directory_to_block(self.src_dir / "a.txt", io.StringIO())
+
+    def test003_decrypt_block_to_directory(self):
+        block = self._encrypted_directory()
+        target_dir = self.tmp_path / "dst"
+        names = self.bc.decrypt_block_to_directory(io.StringIO(block), target_dir)
+        self.assertEqual(sorted(names), ["src", "src/a.txt", "src/sub", "src/sub/b.bin"])
+        for name in ("a.txt", "sub/b.bin"):
+            self.assertEqual((target_dir / "src" / name).read_bytes(), (self.src_dir / name).read_bytes())
+
+    def test004_decrypt_block_to_directory_no_tar(self):
+        block = self.bc.encrypt_to_block(DataObject.from_str("test004"))
+        with self.assertRaises(InvalidContentException):
+            self.bc.decrypt_block_to_directory(io.StringIO(block), self.tmp_path / "dst")
+
+    def test005_decrypt_from_block_chunked(self):
+        obj = self.bc.decrypt_from_block(self._encrypted_directory())
+        self.assertEqual(obj.content_type, "application/x-tar")
+        self.assertEqual(obj.filename, "src.tar")
+        self.assertTrue(obj.is_zipped)
+
+    def test006_decrypt_from_block_chunked_truncated(self):
+        chunks = self._encrypted_directory().split("\n\n")
+        self.assertGreater(len(chunks), 3)
+        block = "\n\n".join(chunks[:-1]) + f"\n{self.bc._end_block}\n"
+        with self.assertRaises(InvalidBlockException) as exc:
+            self.bc.decrypt_from_block(block)
+        self.assertTrue("truncated" in exc.exception.args[0])
+
+    def test007_decrypt_from_block_chunked_reordered(self):
+        chunks = self._encrypted_directory().split("\n\n")
+        chunks[2], chunks[3] = chunks[3], chunks[2]
+        with self.assertRaises(InvalidBlockException) as exc:
+            self.bc.decrypt_from_block("\n\n".join(chunks))
+        self.assertTrue("out of order" in exc.exception.args[0])
+
+    def test008_block_writer_and_reader(self):
+        data = bytes(range(256)) * 100
+        fh_out = io.StringIO()
+        with self.bc.open_block_writer(
+            fh_out, "application/octet-stream", filename="test008", zip_data=False
+        ) as writer:
+            writer.write(data[:1000])
+            writer.write(data[1000:])
+        reader = self.bc.open_block_reader(io.StringIO(fh_out.getvalue()))
+        self.assertEqual(reader.info.filename, "test008")
+        self.assertEqual(reader.read(10), data[:10])
+        self.assertEqual(b"".join(reader), data[10:])
+
+    def test009_block_writer_empty(self):
+        fh_out = io.StringIO()
+        with self.bc.open_block_writer(fh_out, "text/plain", charset="utf-8"):
+            pass
+        self.assertEqual(self.bc.decrypt_from_block(fh_out.getvalue()).as_str(), "")
+
+    def test010_block_reader_not_chunked(self):
+        text = "test010" * 100
+        reader = self.bc.open_block_reader(io.StringIO(self.bc.encrypt_to_block(DataObject.from_str(text))))
+        self.assertEqual(reader.read().decode("utf-8"), text)
+
+    def test011_encrypt_file_to_block_and_decrypt_block_to_file(self):
+        source_file = self.src_dir / "sub" / "b.bin"
+        fh_out = io.StringIO()
+        num_bytes = self.bc.encrypt_file_to_block(source_file, fh_out)
+        self.assertEqual(num_bytes, source_file.stat().st_size)
+        self.assertNotIn("Content-Encoding: gzip", fh_out.getvalue())  # random data is not compressible
+        (filename, num_bytes) = self.bc.decrypt_block_to_file(io.StringIO(fh_out.getvalue()), directory=self.tmp_path)
+        self.assertEqual(filename, str(self.tmp_path / "b.bin"))
+        self.assertEqual(num_bytes, source_file.stat().st_size)
+        self.assertEqual((self.tmp_path / "b.bin").read_bytes(), source_file.read_bytes())
+
+    def test012_encrypt_file_to_block_auto_zip(self):
+        fh_out = io.StringIO()
+        self.bc.encrypt_file_to_block(self.src_dir / "a.txt", fh_out)
+        self.assertIn("Content-Encoding: gzip", fh_out.getvalue())
+        self.assertEqual(self.bc.decrypt_from_block(fh_out.getvalue()).as_str(), "test\n" * 1000)
+
+    def test013_decrypt_block_to_file_missing_filename(self):
+        block = self.bc.encrypt_to_block(DataObject.from_str("test013"))
+        with self.assertRaises(MissingFilenameException):
+            self.bc.decrypt_block_to_file(io.StringIO(block))
+
+    def test014_keyed_hash(self):
+        self.assertEqual(
+            self.bc.keyed_hash(b"test014").digest(), BlockCrypter(self.KEY).keyed_hash(b"test014").digest()
+        )
+        self.assertNotEqual(
+            self.bc.keyed_hash(b"test014").digest(), BlockCrypter(Fernet.generate_key()).keyed_hash(b"test014").digest()
+        )
+
+    def test015_encrypt_to_block_base85(self):
+        data = DataObject.from_file(self.src_dir / "sub" / "b.bin", zip_data=False)
+        block64 = self.bc.encrypt_to_block(data)
+        block85 = self.bc.encrypt_to_block(data, transfer_encoding="base85")
+        self.assertNotIn("Content-Transfer-Encoding", block64)
+        self.assertIn("Content-Transfer-Encoding: base85\n", block85)
+        self.assertLess(len(block85), len(block64) * 0.95)
+        self.assertEqual(self.bc.decrypt_from_block(block85).binary_data, data.binary_data)
+        self.assertEqual(self.bc.decrypt_from_block(block64).binary_data, data.binary_data)
+
+    def test016_encrypt_to_block_base85_default(self):
+        bc = BlockCrypter(self.KEY, transfer_encoding="base85")
+        block = bc.encrypt_to_block(DataObject.from_str("test016"))
+        self.assertIn("Content-Transfer-Encoding: base85\n", block)
+        self.assertEqual(self.bc.decrypt_from_block(block).as_str(), "test016")
+
+    def test017_block_writer_base85(self):
+        fh_out = io.StringIO()
+        with self.bc.open_block_writer(fh_out, "text/plain", charset="utf-8", transfer_encoding="base85") as writer:
+            writer.write(("test017\n" * 1000).encode("utf-8"))
+        self.assertIn("Content-Transfer-Encoding: base85\n", fh_out.getvalue())
+        self.assertEqual(self.bc.decrypt_from_block(fh_out.getvalue()).as_str(), "test017\n" * 1000)
+        reader = self.bc.open_block_reader(io.StringIO(fh_out.getvalue()))
+        self.assertEqual(reader.read().decode("utf-8"), "test017\n" * 1000)
+
+    def test018_decrypt_from_block_base85_wrong_key(self):
+        block = self.bc.encrypt_to_block(DataObject.from_str("test018"), transfer_encoding="base85")
+        with self.assertRaises(InvalidToken):
+            BlockCrypter(Fernet.generate_key()).decrypt_from_block(block)
+
+    def test019_raw_token_is_a_fernet_token(self):
+        token = self.bc._encrypt_raw(b"test019")
+        self.assertEqual(self.bc.decrypt(base64.urlsafe_b64encode(token)), b"test019")
+        self.assertEqual(self.bc._decrypt_raw(base64.urlsafe_b64decode(self.bc.encrypt(b"test019"))), b"test019")
+
+    def test020_transfer_encoding_not_supported(self):
+        with self.assertRaises(InvalidDataException):
+            self.bc.encrypt_to_block(DataObject.from_str("test020"), transfer_encoding="base32")
+        block = self.bc.encrypt_to_block(DataObject.from_str("test020"), transfer_encoding="base85")
+        with self.assertRaises(InvalidContentException):
+            self.bc.decrypt_from_block(block.replace("base85", "base32"))
+
+    def test021_encrypt_to_container_and_decrypt_from_container(self):
+        data = DataObject.from_file(self.src_dir / "sub" / "b.bin", zip_data=False)
+        fh_out = io.BytesIO()
+        num_bytes = self.bc.encrypt_to_container(data, fh_out)
+        self.assertEqual(num_bytes, len(fh_out.getvalue()))
+        self.assertLess(num_bytes, len(self.bc.encrypt_to_block(data)) * 0.8)
+        result = self.bc.decrypt_from_container(io.BytesIO(fh_out.getvalue()))
+        self.assertEqual(result.binary_data, data.binary_data)
+        self.assertEqual(result.filename, "b.bin")
+
+    def test022_block_to_container_to_block_lossless(self):
+        block = self._encrypted_directory()
+        fh_container = io.BytesIO()
+        self.bc.block_to_container(io.StringIO(block), fh_container)
+        fh_block = io.StringIO()
+        self.bc.container_to_block(io.BytesIO(fh_container.getvalue()), fh_block)
+        self.assertEqual(fh_block.getvalue(), block)
+        self.assertEqual(
+            self.bc.decrypt_from_container(io.BytesIO(fh_container.getvalue())).binary_data,
+            self.bc.decrypt_from_block(block).binary_data,
+        )
+
+    def test023_container_to_block_base85(self):
+        data = DataObject.from_str("test023" * 100)
+        fh_container = io.BytesIO()
+        self.bc.encrypt_to_container(data, fh_container)
+        fh_block = io.StringIO()
+        self.bc.container_to_block(io.BytesIO(fh_container.getvalue()), fh_block, transfer_encoding="base85")
+        self.assertIn("Content-Transfer-Encoding: base85\n", fh_block.getvalue())
+        self.assertEqual(self.bc.decrypt_from_block(fh_block.getvalue()).as_str(), "test023" * 100)
+        fh_container2 = io.BytesIO()
+        self.bc.block_to_container(io.StringIO(fh_block.getvalue()), fh_container2)
+        self.assertEqual(fh_container2.getvalue(), fh_container.getvalue())
+
+    def test024_decrypt_from_container_chunked(self):
+        fh_block = io.StringIO()
+        with self.bc.open_block_writer(fh_block, "application/octet-stream", filename="b.bin") as writer:
+            writer.write((self.src_dir / "sub" / "b.bin").read_bytes())
+        fh_container = io.BytesIO()
+        self.bc.block_to_container(io.StringIO(fh_block.getvalue()), fh_container)
+        result = self.bc.decrypt_from_container(io.BytesIO(fh_container.getvalue()))
+        self.assertTrue(result.is_zipped)
+        self.assertEqual(zlib.decompress(result.binary_data), (self.src_dir / "sub" / "b.bin").read_bytes())
+
+    def test025_decrypt_from_container_invalid(self):
+        fh_container = io.BytesIO()
+        self.bc.encrypt_to_container(DataObject.from_str("test025"), fh_container)
+        container = fh_container.getvalue()
+        with self.assertRaisesRegex(InvalidBlockException, "not a crippy container"):
+            self.bc.decrypt_from_container(io.BytesIO(b"test025" + container))
+        with self.assertRaisesRegex(InvalidBlockException, "version is not supported"):
+            self.bc.decrypt_from_container(io.BytesIO(container[:8] + b"\x02" + container[9:]))
+        with self.assertRaisesRegex(InvalidBlockException, "truncated"):
+            self.bc.decrypt_from_container(io.BytesIO(container[:-10]))
+
+    def test026_verify_block(self):
+        block = self._encrypted_directory()
+        with mk.patch.object(self.bc, "_decrypt_raw") as decrypt_raw, mk.patch.object(self.bc, "decrypt") as decrypt:
+            num_tokens = self.bc.verify_block(block)
+            decrypt_raw.assert_not_called()
+            decrypt.assert_not_called()
+        self.assertGreater(num_tokens, 1)
+        self.assertEqual(self.bc.verify_block(io.StringIO(block)), num_tokens)
+        self.assertEqual(self.bc.verify_block(self.bc.encrypt_to_block(DataObject.from_str("test026"))), 1)
+        block = self.bc.encrypt_to_block(DataObject.from_str("test026"), transfer_encoding="base85")
+        self.assertEqual(self.bc.verify_block(block), 1)
+
+    def test027_verify_block_errors(self):
+        block = self._encrypted_directory()
+        with self.assertRaises(InvalidToken):
+            BlockCrypter(Fernet.generate_key()).verify_block(block)
+        (header, data) = block.split("\n\n", 1)
+        chunks = data.split("\n\n")
+        with self.assertRaisesRegex(InvalidBlockException, "out of order"):
+            self.bc.verify_block("\n\n".join([header, chunks[1], chunks[0], *chunks[2:]]))
+        with self.assertRaisesRegex(InvalidBlockException, "truncated"):
+            self.bc.verify_block("\n\n".join([header, *chunks[:-1]]) + "\n===== END BLOCK =====\n")
+        corrupt_block = self.bc.encrypt_to_block(DataObject.from_str("test027")).replace("\ngAAAAA", "\ngAAAAB")
+        with self.assertRaises(InvalidToken):
+            self.bc.verify_block(corrupt_block)
+        with self.assertRaises(InvalidBlockException):
+            self.bc.verify_block("test027")
+
+    def test028_size_headers(self):
+        text = "test028\n" * 100
+        for transfer_encoding in ("base64", "base85"):
+            block = self.bc.encrypt_to_block(DataObject.from_str(text), transfer_encoding=transfer_encoding)
+            self.assertIn(f"Content-Length: {len(text)}\n", block)
+            self.assertIn(f"Stored-Length: {len(zlib.compress(text.encode('utf-8')))}\n", block)
+            result = self.bc.decrypt_from_block(block)
+            self.assertEqual((result.as_str(), result.size), (text, len(text)))
+            self.assertEqual(self.bc.open_block_reader(io.StringIO(block)).info.size, len(text))
+            self.assertEqual(self.bc.verify_block(block), 1)
+            # a truncated block is rejected before decrypting
+            lines = block.split("\n")
+            lines[lines.index("") + 1] = lines[lines.index("") + 1][:-5]
+            truncated_block = "\n".join(lines)
+            with (
+                mk.patch.object(self.bc, "_decrypt_raw") as decrypt_raw,
+                mk.patch.object(self.bc, "decrypt") as decrypt,
+            ):
+                with self.assertRaisesRegex(InvalidBlockException, "truncated"):
+                    self.bc.decrypt_from_block(truncated_block)
+                with self.assertRaisesRegex(InvalidBlockException, "truncated"):
+                    self.bc.verify_block(truncated_block)
+                decrypt_raw.assert_not_called()
+                decrypt.assert_not_called()
+        with self.assertRaisesRegex(InvalidBlockException, "Content-Length"):
+            self.bc.decrypt_from_block(
+                self.bc.encrypt_to_block(DataObject.from_str("test028", zip_data=False)).replace(
+                    "Content-Length: 7", "Content-Length: 8"
+                )
+            )
+
+    def test029_size_header_chunked(self):
+        source_file = self.src_dir / "sub" / "b.bin"
+        fh_out = io.StringIO()
+        self.bc.encrypt_file_to_block(source_file, fh_out)
+        block = fh_out.getvalue()
+        self.assertIn("Content-Length: 10000\n", block)
+        self.assertNotIn("Stored-Length", block)
+        self.assertEqual(self.bc.open_block_reader(io.StringIO(block)).info.size, 10_000)
+        (filename, num_bytes) = self.bc.decrypt_block_to_file(io.StringIO(block), filename=self.tmp_path / "b.out")
+        self.assertEqual(num_bytes, 10_000)
+        self.assertEqual(pathlib.Path(filename).read_bytes(), source_file.read_bytes())
+        with self.assertRaisesRegex(InvalidBlockException, "Content-Length"):
+            self.bc.open_block_reader(
+                io.StringIO(block.replace("Content-Length: 10000", "Content-Length: 10001"))
+            ).read()
+
+    def test030_block_writer_size_mismatch(self):
+        writer = self.bc.open_block_writer(io.StringIO(), "application/octet-stream", size=10)
+        writer.write(b"test030")
+        with self.assertRaises(InvalidDataException):
+            writer.close()
+
+    def test032_decrypt_block_to_file_errors(self):
+        fh_out = io.StringIO()
+        self.bc.encrypt_file_to_block(self.src_dir / "sub" / "b.bin", fh_out)
+        block = fh_out.getvalue()
+        fh_out = io.StringIO()
+        with self.bc.open_block_writer(fh_out, "application/octet-stream", filename="b.bin", zip_data=False) as writer:
+            writer.write((self.src_dir / "sub" / "b.bin").read_bytes())
+        block_without_size = fh_out.getvalue().replace("Content-Type:", "Content-Length: 1000000000000\nContent-Type:")
+        target_file = self.tmp_path / "b.out"
+        target_file.write_bytes(b"existing")
+        for name, block_crypter, text, exception, preallocated in (
+            ("wrong key", BlockCrypter(Fernet.generate_key()), block, InvalidToken, False),
+            (
+                "forged size",
+                self.bc,
+                block.replace("Content-Length: 10000", "Content-Length: 1000000000000"),
+                None,
+                False,
+            ),
+            ("truncated", self.bc, "\n\n".join(block.split("\n\n")[:-1]) + f"\n{self.bc._end_block}\n", None, True),
+        ):
+            with self.subTest(name), mk.patch("crippy_app._preallocate") as preallocate:
+                with self.assertRaises(exception or InvalidBlockException):
+                    block_crypter.decrypt_block_to_file(io.StringIO(text), filename=target_file)
+                self.assertEqual(preallocate.called, preallocated)
+                self.assertEqual(target_file.read_bytes(), b"existing")
+                self.assertEqual(list(self.tmp_path.glob("*.tmp")), [])
+        # a size which is not in the (authenticated) first chunk is preallocated up to a limit
+        with mk.patch("crippy_app._preallocate") as preallocate, self.assertRaises(InvalidBlockException):
+            self.bc.decrypt_block_to_file(io.StringIO(block_without_size), filename=target_file)
+        self.assertEqual(preallocate.call_args.args[1], crippy_app._PREALLOCATE_MAX_SIZE)
+        self.assertEqual(target_file.read_bytes(), b"existing")
+        bc_limited = BlockCrypter(self.KEY, max_decompressed_size=20_000)
+        with mk.patch("crippy_app._preallocate") as preallocate:
+            bc_limited.decrypt_block_to_file(io.StringIO(block), filename=target_file)
+        self.assertEqual(preallocate.call_args.args[1], 10_000)
+        self.assertEqual(target_file.read_bytes(), (self.src_dir / "sub" / "b.bin").read_bytes())
+
+    def test031_inspect_block(self):
+        block = self.bc.encrypt_to_block(DataObject.from_str("test031\n" * 100), transfer_encoding="base85")
+        with mk.patch.object(self.bc, "_decrypt_raw") as decrypt_raw, mk.patch.object(self.bc, "decrypt") as decrypt:
+            info = BlockCrypter(Fernet.generate_key()).inspect_block(block)
+            decrypt_raw.assert_not_called()
+            decrypt.assert_not_called()
+        token = "".join(block.split("\n\n", 1)[1].splitlines()[:-1])
+        self.assertEqual(
+            info,
+            BlockInfo(
+                content_type="text/plain",
+                charset="utf-8",
+                content_encoding="gzip",
+                transfer_encoding="base85",
+                size=800,
+                payload_size=len(token),
+                num_tokens=1,
+            ),
+        )
+        fh_out = io.StringIO()
+        self.bc.encrypt_file_to_block(self.src_dir / "sub" / "b.bin", fh_out)
+        info = self.bc.inspect_block(io.StringIO(fh_out.getvalue()))
+        self.assertEqual((info.filename, info.chunked, info.size, info.num_tokens), ("b.bin", True, 10_000, 10))
+        with self.assertRaises(InvalidBlockException):
+            self.bc.inspect_block("test031")
+
+
+class TestZdict(unittest.TestCase):
+    KEY = Fernet.generate_key()
+
+    @staticmethod
+    def _message(rnd):
+        return (
+            f"Dear {rnd.choice(['Alice', 'Bob', 'Carol'])},\n\nYour order #{rnd.randint(1000, 99999)} has been "
+            f"shipped. The amount of EUR {rnd.randint(1, 500)} has been charged to your account.\n\n"
+            "Kind regards,\nThe Shop Team\n"
+        )
+
+    def setUp(self):
+        rnd = random.Random(0)
+        self.zdict = train_zdict(self._message(rnd).encode("utf-8") for _ in range(100))
+        self.zdict_id = register_zdict(self.zdict)
+        self.text = self._message(rnd)
+        self.bc = BlockCrypter(self.KEY)
+
+    def test001_train_zdict(self):
+        self.assertLessEqual(len(self.zdict), 32 * 1024)
+        self.assertIn(b"Kind regards,\nThe Shop Team\n", self.zdict)
+        self.assertLessEqual(len(train_zdict([b"aaaa bbbb cccc", b"aaaa bbbb cccc"], size=10)), 10)
+        self.assertEqual(train_zdict([b"only one sample"]), b"")
+
+    def test002_from_str_with_zdict(self):
+        data = DataObject.from_str(self.text, zdict_id=self.zdict_id)
+        self.assertTrue(data.is_zipped)
+        self.assertEqual(data.zdict_id, self.zdict_id)
+        self.assertLess(len(data.binary_data), len(zlib.compress(self.text.encode("utf-8"))) / 2)
+        self.assertEqual(data.as_str(), self.text)
+
+    def test003_encrypt_to_block_with_zdict(self):
+        block = self.bc.encrypt_to_block(DataObject.from_str(self.text, zdict_id=self.zdict_id))
+        self.assertIn(f"Dictionary-Id: {self.zdict_id}\n", block)
+        result = self.bc.decrypt_from_block(block)
+        self.assertEqual(result.zdict_id, self.zdict_id)
+        self.assertEqual(result.as_str(), self.text)
+        self.assertEqual(self.bc.open_block_reader(io.StringIO(block)).read().decode("utf-8"), self.text)
+
+    def test004_no_zdict_when_not_zipped(self):
+        data = DataObject.from_str(self.text, zip_data=False, zdict_id=self.zdict_id)
+        self.assertIsNone(data.zdict_id)
+        self.assertNotIn("Dictionary-Id", self.bc.encrypt_to_block(data))
+
+    def test005_unknown_zdict(self):
+        with self.assertRaises(InvalidContentException):
+            DataObject.from_str(self.text, zdict_id="0123456789abcdef")
+        block = self.bc.encrypt_to_block(DataObject.from_str(self.text, zdict_id=self.zdict_id))
+        with self.assertRaises(InvalidContentException):
+            self.bc.decrypt_from_block(block.replace(self.zdict_id, "0123456789abcdef"))
+
+
+class TestDecompressionLimits(unittest.TestCase):
+    KEY = Fernet.generate_key()
+    SIZE = 10 * 1024 * 1024
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_path = pathlib.Path(tmp_dir.name)
+        self.bomb = DataObject(
+            content_type="text/plain", charset="utf-8", is_zipped=True, binary_data=zlib.compress(b" " * self.SIZE)
+        )
+
+    def test001_iter_decompress_bounded_pieces(self):
+        pieces = list(crippy_app._iter_decompress([self.bomb.binary_data]))
+        self.assertEqual(sum(len(piece) for piece in pieces), self.SIZE)
+        self.assertLessEqual(max(len(piece) for piece in pieces), crippy_app._DECOMPRESS_PIECE_SIZE)
+        with self.assertRaises(InvalidBlockException):
+            list(crippy_app._iter_decompress([self.bomb.binary_data[:-10]]))
+
+    def test002_max_decompressed_size(self):
+        self.assertEqual(len(self.bomb.as_str()), self.SIZE)
+        with mk.patch("crippy_app.MAX_DECOMPRESSED_SIZE", self.SIZE - 1):
+            with self.assertRaises(DecompressionLimitException):
+                self.bomb.as_str()
+            with self.assertRaises(DecompressionLimitException):
+                self.bomb.to_file(self.tmp_path / "bomb.txt")
+        with mk.patch("crippy_app.MAX_DECOMPRESSED_SIZE", None):
+            self.assertEqual(self.bomb.to_file(self.tmp_path / "bomb.txt")[1], self.SIZE)
+
+    def test003_max_compression_ratio(self):
+        with mk.patch("crippy_app.MAX_COMPRESSION_RATIO", 100):
+            with self.assertRaisesRegex(DecompressionLimitException, "ratio"):
+                self.bomb.as_str()
+            self.assertEqual(DataObject.from_str("test003" * 1000).as_str(), "test003" * 1000)
+
+    def test004_streaming_limits(self):
+        block = BlockCrypter(self.KEY).encrypt_to_block(self.bomb)
+        self.assertEqual(len(BlockCrypter(self.KEY).open_block_reader(io.StringIO(block)).read()), self.SIZE)
+        bc = BlockCrypter(self.KEY, max_decompressed_size=1024 * 1024)
+        with self.assertRaises(DecompressionLimitException):
+            bc.open_block_reader(io.StringIO(block)).read()
+        bc = BlockCrypter(self.KEY, max_compression_ratio=100)
+        with self.assertRaises(DecompressionLimitException):
+            bc.decrypt_block_to_file(io.StringIO(block), filename=self.tmp_path / "bomb.txt")
+
+    def test005_content_length_exceeds_limit(self):
+        fh_out = io.StringIO()
+        with BlockCrypter(self.KEY).open_block_writer(fh_out, "text/plain", size=self.SIZE) as writer:
+            writer.write(b" " * self.SIZE)
+        bc = BlockCrypter(self.KEY, max_decompressed_size=1024)
+        with (
+            mk.patch.object(bc, "_decrypt_text") as decrypt_text,
+            self.assertRaisesRegex(DecompressionLimitException, "Content-Length"),
+        ):
+            bc.open_block_reader(io.StringIO(fh_out.getvalue())).read()
+        decrypt_text.assert_not_called()
+
+
+class TestMemoryBudget(unittest.TestCase):
+    KEY = Fernet.generate_key()
+
+    def setUp(self):
+        self.budget = MemoryBudget(limit=1024 * 1024, spill_size=64 * 1024)
+        patch_budget = mk.patch("crippy_app.MEMORY_BUDGET", self.budget)
+        patch_budget.start()
+        self.addCleanup(patch_budget.stop)
+        tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_path = pathlib.Path(tmp_dir.name)
+        self.bc = BlockCrypter(self.KEY, chunk_size=16 * 1024)
+        self.text = random.Random(0).randbytes(150_000).hex()
+
+    def test001_reserve_and_release(self):
+        self.assertEqual(self.budget.available(), 64 * 1024)
+        self.assertTrue(self.budget.reserve(60 * 1024))
+        self.assertEqual(self.budget.available(), 64 * 1024)
+        self.assertFalse(self.budget.reserve(65 * 1024))
+        for _ in range(16):
+            self.budget.reserve(60 * 1024)
+        self.assertEqual(self.budget.available(), 4 * 1024)
+        self.budget.release(17 * 60 * 1024)
+        self.assertEqual(self.budget.in_use, 0)
+        self.assertEqual(MemoryBudget(limit=None, spill_size=10).available(), 10)
+
+    def test002_payload_is_accounted(self):
+        data = DataObject.from_str("test002" * 1000, zip_data=False)
+        self.assertIsInstance(data.binary_data, bytes)
+        self.assertEqual(self.budget.in_use, 7000)
+        data.binary_data = b"test002"
+        self.assertEqual(self.budget.in_use, 7)
+        del data
+        gc.collect()
+        self.assertEqual(self.budget.in_use, 0)
+
+    def test003_large_payload_is_spilled(self):
+        data = DataObject.from_str(self.text, zip_data=False)
+        self.assertIsInstance(data.binary_data, mmap.mmap)
+        self.assertEqual(self.budget.in_use, 0)
+        self.assertEqual(data.as_str(), self.text)
+        self.assertEqual(data.to_file(self.tmp_path / "text.txt")[1], len(self.text))
+        self.assertEqual((self.tmp_path / "text.txt").read_text(encoding="utf-8"), self.text)
+        for transfer_encoding in ("base64", "base85"):
+            block = self.bc.encrypt_to_block(data, transfer_encoding=transfer_encoding)
+            self.assertEqual(self.bc.decrypt_from_block(block).as_str(), self.text)
+
+    def test004_from_file_is_spilled(self):
+        source_file = self.tmp_path / "source.bin"
+        source_file.write_bytes(self.text.encode("ascii"))
+        with mk.patch("crippy_app._READ_SIZE", 16 * 1024):
+            for zip_data in (False, True):
+                data = DataObject.from_file(source_file, zip_data=zip_data)
+                self.assertIsInstance(data.binary_data, mmap.mmap)
+                self.assertEqual((data.is_zipped, data.size), (zip_data, len(self.text)))
+                self.assertEqual(data.to_file(self.tmp_path / "target.bin")[1], len(self.text))
+                self.assertEqual((self.tmp_path / "target.bin").read_bytes(), source_file.read_bytes())
+
+    def test005_decrypt_is_spilled(self):
+        fh_out = io.StringIO()
+        with self.bc.open_block_writer(fh_out, "text/plain", charset="utf-8", zip_data=False) as writer:
+            writer.write(self.text.encode("utf-8"))
+        data = self.bc.decrypt_from_block(fh_out.getvalue())
+        self.assertIsInstance(data.binary_data, mmap.mmap)
+        self.assertEqual(data.as_str(), self.text)
+        fh_container = io.BytesIO()
+        self.bc.encrypt_to_container(data, fh_container)
+        fh_container.seek(0)
+        data = self.bc.decrypt_from_container(fh_container)
+        self.assertIsInstance(data.binary_data, mmap.mmap)
+        self.assertEqual(data.as_str(), self.text)
+
+    def test006_copy_reserves_own_memory(self):
+        data = DataObject(binary_data=b"x" * 1000)
+        data_copy = copy.copy(data)
+        self.assertEqual(self.budget.in_use, 2000)
+        data_copy.binary_data = b"y" * 10
+        self.assertEqual(self.budget.in_use, 1010)
+        self.assertEqual(copy.deepcopy(data), data)
+        gc.collect()
+        self.assertEqual(self.budget.in_use, 1010)
+        del data, data_copy
+        gc.collect()
+        self.assertEqual(self.budget.in_use, 0)
+
+    def test007_bundle_is_spilled(self):
+        items = [DataObject.from_str(self.text[:1000]), DataObject.from_str(self.text, zip_data=True)]
+        with mk.patch("crippy_app._READ_SIZE", 16 * 1024):
+            for zip_data in (False, True):
+                bundle = DataObject.from_items(items, zip_data=zip_data)
+                self.assertIsInstance(bundle.binary_data, mmap.mmap)
+                self.assertEqual(bundle.is_zipped, zip_data)
+                (first, second) = bundle.items()
+                self.assertEqual((first.as_str(), first.size), (self.text[:1000], 1000))
+                self.assertIsInstance(second.binary_data, mmap.mmap)
+                self.assertEqual(second.as_str(), self.text)
+        self.assertLessEqual(self.budget.in_use, self.budget.limit)
+        with self.assertRaises(InvalidDataException):
+            DataObject.from_items([DataObject(binary_data=zlib.compress(b"abc"), is_zipped=True, size=4)])
+
+
+class TestKeyring(unittest.TestCase):
+    KEYS = tuple(Fernet.generate_key() for _ in range(3))
+
+    def setUp(self):
+        self.bcs = [BlockCrypter(key, include_key_id=True, chunk_size=1024) for key in self.KEYS]
+        self.keyring = Keyring(self.bcs)
+        self.text = "test\n" * 1000
+
+    def test001_key_id(self):
+        self.assertEqual(len(self.bcs[0].key_id), 16)
+        self.assertEqual(self.bcs[0].key_id, BlockCrypter(self.KEYS[0]).key_id)
+        self.assertNotEqual(self.bcs[0].key_id, self.bcs[1].key_id)
+        self.assertIn(f"Key-Id: {self.bcs[0].key_id}\n", self.bcs[0].encrypt_to_block(DataObject.from_str("test")))
+        self.assertNotIn("Key-Id", BlockCrypter(self.KEYS[0]).encrypt_to_block(DataObject.from_str("test")))
+
+    def test002_keyring(self):
+        self.assertEqual(len(self.keyring), 3)
+        self.assertIn(self.bcs[1].key_id, self.keyring)
+        self.assertIs(self.keyring.get(self.bcs[1].key_id.upper()), self.bcs[1])
+        with self.assertRaises(KeyNotFoundException):
+            self.keyring.get("0123456789abcdef")
+        key_id = self.keyring.add_password("password", salt=b"salt")
+        self.assertEqual(len(self.keyring), 4)
+        self.assertTrue(self.keyring.get(key_id).include_key_id)
+
+    def test003_decrypt_with_key_id(self):
+        block = self.bcs[1].encrypt_to_block(DataObject.from_str(self.text))
+        with mk.patch.object(self.bcs[2], "decrypt_from_block") as decrypt_from_block:
+            self.assertEqual(self.keyring.decrypt_from_block(block).as_str(), self.text)
+            decrypt_from_block.assert_not_called()
+        self.assertEqual(self.keyring.open_block_reader(io.StringIO(block)).read().decode("utf-8"), self.text)
+        with self.assertRaises(KeyNotFoundException):
+            Keyring(self.bcs[:1]).decrypt_from_block(block)
+
+    def test004_decrypt_without_key_id(self):
+        bc = BlockCrypter(self.KEYS[0])
+        block = bc.encrypt_to_block(DataObject.from_str(self.text))
+        self.assertEqual(self.keyring.decrypt_from_block(block).as_str(), self.text)
+        fh_out = io.StringIO()
+        with bc.open_block_writer(fh_out, "text/plain", charset="utf-8") as writer:
+            writer.write(self.text.encode("utf-8"))
+        fh_out.seek(0)
+        self.assertEqual(self.keyring.open_block_reader(fh_out).read().decode("utf-8"), self.text)
+        with self.assertRaises(KeyNotFoundException):
+            Keyring(self.bcs[1:]).decrypt_from_block(block)
+        with self.assertRaises(KeyNotFoundException):
+            Keyring().decrypt_from_block(block)
+        with self.assertRaises(KeyNotFoundException):
+            Keyring().open_block_reader(io.StringIO(block))
+
+
+class TestPipeline(unittest.TestCase):
+    KEY = Fernet.generate_key()
+
+    def setUp(self):
+        self.bc = BlockCrypter(self.KEY, chunk_size=1024, workers=3)
+        self.bc_sequential = BlockCrypter(self.KEY, chunk_size=1024, workers=0)
+        tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_path = pathlib.Path(tmp_dir.name)
+
+    def _encrypt_file(self, bc, data, zip_data=None):
+        source_file = self.tmp_path / "source.bin"
+        source_file.write_bytes(data)
+        fh_out = io.StringIO()
+        self.assertEqual(bc.encrypt_file_to_block(source_file, fh_out, zip_data=zip_data), len(data))
+        return fh_out.getvalue()
+
+    def test001_same_block_layout(self):
+        rnd = random.Random(1)
+        for data in (b"", rnd.randbytes(1024), rnd.randbytes(2048), rnd.randbytes(10_000), b"test001\n" * 5000):
+            for zip_data in (False, True):
+                pipelined = self._encrypt_file(self.bc, data, zip_data)
+                sequential = self._encrypt_file(self.bc_sequential, data, zip_data)
+                self.assertEqual(pipelined.split("\n\n", 1)[0], sequential.split("\n\n", 1)[0])
+                self.assertEqual(
+                    [len(line) for line in pipelined.split("\n")], [len(line) for line in sequential.split("\n")]
+                )
+                for bc, block in ((self.bc, sequential), (self.bc_sequential, pipelined), (self.bc, pipelined)):
+                    (filename, num_bytes) = bc.decrypt_block_to_file(io.StringIO(block), self.tmp_path / "out.bin")
+                    self.assertEqual(num_bytes, len(data))
+                    self.assertEqual(pathlib.Path(filename).read_bytes(), data)
+
+    def test002_errors_are_passed_on(self):
+        block = self._encrypt_file(self.bc, random.Random(2).randbytes(10_000))
+        (header, data) = block.split("\n\n", 1)
+        chunks = data.split("\n\n")
+        with self.assertRaisesRegex(InvalidBlockException, "out of order"):
+            self.bc.decrypt_block_to_file(
+                io.StringIO("\n\n".join([header, chunks[1], chunks[0], *chunks[2:]])), self.tmp_path / "out.bin"
+            )
+        chunks[3] = "gAAAAB" + chunks[3][6:]
+        with self.assertRaises(InvalidToken):
+            self.bc.decrypt_block_to_file(io.StringIO("\n\n".join([header, *chunks])), self.tmp_path / "out.bin")
+
+    def test003_threads_stop(self):
+        num_threads = threading.active_count()
+        block = self._encrypt_file(self.bc, b"test003\n" * 10_000)
+        reader = self.bc._block_reader(*self.bc._read_block(io.StringIO(block)), workers=self.bc.workers)
+        self.assertEqual(reader.read(10), b"test003\nte")
+        del reader
+        gc.collect()
+        for _ in range(50):
+            if threading.active_count() <= num_threads:
+                break
+            time.sleep(0.1)
+        self.assertLessEqual(threading.active_count(), num_threads)
+
+    def test004_content_length_mismatch(self):
+        headers = self.bc._create_headers("application/octet-stream", None, None, False, None, content_length=10)
+        with self.assertRaises(InvalidDataException):
+            self.bc._write_pipelined(io.StringIO(), headers, [b"test004"], False, None)
+
+
+class TestMultipart(unittest.TestCase):
+    KEY = Fernet.generate_key()
+
+    def setUp(self):
+        self.bc = BlockCrypter(self.KEY, workers=2)
+        self.data = random.Random(0).randbytes(20_000)
+        self.obj = DataObject(
+            content_type="application/octet-stream", filename="data.bin", binary_data=self.data, size=20_000
+        )
+
+    def test001_parts_in_any_order(self):
+        parts = self.bc.encrypt_to_parts(self.obj, max_size=3000)
+        self.assertGreater(len(parts), 7)
+        self.assertTrue(all(len(part) <= 3000 for part in parts))
+        self.assertIn(f"Part: 1/{len(parts)}\n", parts[0])
+        shuffled = parts[:]
+        random.Random(1).shuffle(shuffled)
+        texts = ["\n".join(shuffled[:3]), io.StringIO("header text\n" + "".join(shuffled[3:])), parts[0]]
+        fh_out = io.BytesIO()
+        info = self.bc.decrypt_parts(texts, fh_out)
+        self.assertEqual(fh_out.getvalue(), self.data)
+        self.assertEqual(
+            (info.content_type, info.filename, info.size), ("application/octet-stream", "data.bin", 20_000)
+        )
+        self.assertEqual(self.bc.decrypt_from_parts(["".join(shuffled)]).binary_data, self.data)
+        self.assertTrue(crippy_app.is_multipart(parts[-1]))
+        self.assertFalse(crippy_app.is_multipart(self.bc.encrypt_to_block(self.obj)))
+
+    def test002_text_compressed(self):
+        text = "test002 " * 10_000
+        for transfer_encoding in crippy_app.TRANSFER_ENCODINGS:
+            parts = self.bc.encrypt_to_parts(
+                DataObject.from_str(text), max_size=1000, width=50, transfer_encoding=transfer_encoding
+            )
+            self.assertTrue(all(len(part) <= 1000 for part in parts))
+            fh_out = io.BytesIO()
+            info = self.bc.decrypt_parts(reversed(parts), fh_out)
+            self.assertEqual(fh_out.getvalue().decode(info.charset), text)
+            self.assertEqual(self.bc.decrypt_from_parts(parts).as_str(), text)
+        (part,) = self.bc.encrypt_to_parts(DataObject.from_str(""), max_size=1000)
+        fh_out = io.BytesIO()
+        self.bc.decrypt_parts([part], fh_out)
+        self.assertEqual(fh_out.getvalue(), b"")
+
+    def test003_invalid_parts(self):
+        parts = self.bc.encrypt_to_parts(self.obj, max_size=3000)
+        with self.assertRaisesRegex(InvalidBlockException, "missing: 2, 4"):
+            self.bc.decrypt_parts(parts[:1] + parts[2:3] + parts[4:], io.BytesIO())
+        other_parts = self.bc.encrypt_to_parts(self.obj, max_size=3000)
+        with self.assertRaisesRegex(InvalidBlockException, "different"):
+            self.bc.decrypt_parts(parts[:1] + other_parts[1:], io.BytesIO())
+        with self.assertRaisesRegex(InvalidBlockException, "not a part"):
+            self.bc.decrypt_parts([self.bc.encrypt_to_block(self.obj)], io.BytesIO())
+        with self.assertRaises(InvalidBlockException):
+            self.bc.decrypt_parts(["no parts"], io.BytesIO())
+        # a corrupt part is found before anything is written
+        corrupt_parts = parts[:]
+        corrupt_parts[-1] = corrupt_parts[-1].replace("\ngAAAAA", "\ngAAAAB", 1)
+        fh_out = io.BytesIO()
+        with self.assertRaises(InvalidToken):
+            self.bc.decrypt_parts(corrupt_parts, fh_out)
+        self.assertEqual(fh_out.getvalue(), b"")
+        with self.assertRaises(InvalidToken):
+            BlockCrypter(Fernet.generate_key()).decrypt_parts(parts, io.BytesIO())
+
+    def test004_max_size_too_small(self):
+        with self.assertRaises(InvalidDataException):
+            self.bc.encrypt_to_parts(self.obj, max_size=300)
+        with self.assertRaises(InvalidDataException):
+            self.bc.encrypt_to_parts(DataObject(), max_size=3000)
+
+
+class TestBundle(unittest.TestCase):
+    KEY = Fernet.generate_key()
+
+    def setUp(self):
+        self.bc = BlockCrypter(self.KEY, chunk_size=1024)
+        rnd = random.Random(0)
+        self.items = [DataObject.from_str(f"secret {i}: {rnd.randbytes(8).hex()}") for i in range(200)]
+        self.items.insert(
+            10, DataObject(content_type="application/octet-stream", filename="a.bin", binary_data=b"\0" * 5, size=5)
+        )
+        self.items.append(DataObject.from_str("last item " * 100, charset="latin-1"))
+
+    def test001_bundle_round_trip(self):
+        bundle = DataObject.from_items(self.items)
+        self.assertEqual((bundle.content_type, bundle.is_zipped), (BUNDLE_CONTENT_TYPE, True))
+        block = self.bc.encrypt_to_block(bundle)
+        self.assertIn("Content-Type: multipart/mixed\n", block)
+        self.assertLess(len(block), sum(len(self.bc.encrypt_to_block(item)) for item in self.items) / 10)
+        items = self.bc.decrypt_from_block(block).items()
+        self.assertEqual(len(items), len(self.items))
+        for item, original in zip(items, self.items):
+            self.assertEqual(
+                (item.content_type, item.charset, item.filename, item.size, item.is_zipped),
+                (original.content_type, original.charset, original.filename, original.size, False),
+            )
+            self.assertEqual(item.as_str("latin-1"), original.as_str("latin-1"))
+        self.assertEqual(DataObject.from_items([]).items(), [])
+
+    def test002_extract_item(self):
+        block = self.bc.encrypt_to_block(DataObject.from_items(self.items))
+        index = self.bc.read_bundle_index(io.StringIO(block))
+        self.assertEqual([item.filename for item in index if item.filename], ["a.bin"])
+        self.assertEqual(self.bc.extract_item(io.StringIO(block), "a.bin").binary_data, b"\0" * 5)
+        self.assertEqual(self.bc.extract_item(io.StringIO(block), 5).as_str(), self.items[5].as_str())
+        self.assertEqual(
+            self.bc.extract_item(io.StringIO(block), -1 % len(index)).as_str("latin-1"), "last item " * 100
+        )
+        with self.assertRaises(KeyError):
+            self.bc.extract_item(io.StringIO(block), "missing.bin")
+        with self.assertRaises(KeyError):
+            self.bc.extract_item(io.StringIO(block), len(index))
+
+    def test003_extract_item_stops_early(self):
+        items = [DataObject(content_type="application/octet-stream", filename="first.bin", binary_data=b"first")]
+        items.append(
+            DataObject(content_type="application/octet-stream", binary_data=random.Random(1).randbytes(50_000))
+        )
+        fh_out = io.StringIO()
+        with self.bc.open_block_writer(fh_out, BUNDLE_CONTENT_TYPE, zip_data=False) as writer:
+            writer.write(DataObject.from_items(items, zip_data=False).binary_data)
+        with mk.patch.object(self.bc, "_decrypt_text", wraps=self.bc._decrypt_text) as decrypt_text:
+            self.assertEqual(self.bc.extract_item(io.StringIO(fh_out.getvalue()), "first.bin").binary_data, b"first")
+            self.assertEqual(decrypt_text.call_count, 1)
+
+    def test004_no_bundle(self):
+        block = self.bc.encrypt_to_block(DataObject.from_str("test004"))
+        with self.assertRaises(InvalidContentException):
+            self.bc.read_bundle_index(io.StringIO(block))
+        with self.assertRaises(InvalidContentException):
+            self.bc.extract_item(io.StringIO(block), 0)
+        with self.assertRaises(InvalidContentException):
+            self.bc.decrypt_from_block(block).items()
+        with self.assertRaises(InvalidContentException):
+            DataObject(content_type=BUNDLE_CONTENT_TYPE, binary_data=b"\0\0\0\x02[").items()
+        with self.assertRaises(InvalidDataException):
+            DataObject.from_items([DataObject.from_str("test004"), DataObject()])
+
+
+class TestRecords(unittest.TestCase):
+    KEY = Fernet.generate_key()
+
+    def setUp(self):
+        self.bc = BlockCrypter(self.KEY)
+
+    def test001_round_trip(self):
+        rnd = random.Random(1)
+        records = [rnd.randbytes(size) for size in (0, 1, 15, 16, 17, 100, 256, 257, 1000)] * 3
+        tokens = self.bc.encrypt_records(records)
+        self.assertEqual(len(tokens), len(records))
+        self.assertEqual(len(set(tokens)), len(tokens))
+        self.assertEqual(self.bc.decrypt_records(tokens), records)
+        self.assertEqual(self.bc.decrypt_records(token.decode("ascii") for token in tokens), records)
+        self.assertEqual(self.bc.encrypt_records([]), [])
+        self.assertEqual(self.bc.decrypt_records([]), [])
+
+    def test002_batches(self):
+        records = [f"record {i}".encode() for i in range(50)]
+        with mk.patch.object(crippy_app, "_RECORD_BATCH_SIZE", 7):
+            tokens = self.bc.encrypt_records(iter(records))
+            self.assertEqual(self.bc.decrypt_records(iter(tokens)), records)
+
+    def test003_fernet_compatible(self):
+        records = [b"", b"test003", b"x" * 300]
+        fernet = Fernet(self.KEY)
+        self.assertEqual([fernet.decrypt(token) for token in self.bc.encrypt_records(records)], records)
+        self.assertEqual(self.bc.decrypt_records([fernet.encrypt(record) for record in records]), records)
+
+    def test004_invalid(self):
+        tokens = self.bc.encrypt_records([b"test004", b"other"])
+        with self.assertRaises(InvalidToken):
+            BlockCrypter(Fernet.generate_key()).decrypt_records(tokens)
+        raw = bytearray(base64.urlsafe_b64decode(tokens[1]))
+        raw[30] ^= 1
+        for invalid in (base64.urlsafe_b64encode(bytes(raw)), tokens[1][:-4], b"not a token!", "\u00e9"):
+            with self.subTest(invalid=invalid), self.assertRaises(InvalidToken):
+                self.bc.decrypt_records([tokens[0], invalid])
+
+
+class TestThreadSafety(unittest.TestCase):
+    """Shared objects used by many threads at once (meant for a free-threaded build, also run with the GIL)."""
+
+    KEY = Fernet.generate_key()
+    NUM_THREADS = 8
+
+    def _run_threads(self, function, num_calls: int = 200) -> list:
+        barrier = threading.Barrier(self.NUM_THREADS)
+
+        def run(thread_index: int) -> list:
+            barrier.wait()
+            return [function(thread_index, call) for call in range(num_calls)]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.NUM_THREADS) as executor:
+            return list(executor.map(run, range(self.NUM_THREADS)))
+
+    def test001_shared_block_crypter(self):
+        bc = BlockCrypter(self.KEY, chunk_size=256, workers=0)
+
+        def encrypt_decrypt(thread_index: int, call: int) -> bool:
+            text = f"thread {thread_index} call {call} " * (call % 50)
+            block = bc.encrypt_to_block(DataObject.from_str(text, zip_data=call % 2 == 0))
+            records = [text.encode(), str(call).encode()]
+            return (bc.decrypt_from_block(block).as_str() == text) and (
+                bc.decrypt_records(bc.encrypt_records(records)) == records
+            )
+
+        self.assertTrue(all(all(results) for results in self._run_threads(encrypt_decrypt)))
+
+    def test002_shared_data_object(self):
+        bc = BlockCrypter(self.KEY)
+        data_obj = DataObject.from_str("test002 " * 1000)
+
+        def read(thread_index: int, call: int) -> bool:
+            return bc.decrypt_from_block(bc.encrypt_to_block(data_obj)).as_str() == data_obj.as_str()
+
+        self.assertTrue(all(all(results) for results in self._run_threads(read, num_calls=50)))
+
+    def test003_keyring_add_while_decrypting(self):
+        keys = [Fernet.generate_key() for _ in range(self.NUM_THREADS)]
+        blocks = [BlockCrypter(key).encrypt_to_block(DataObject.from_str(f"key {i}")) for i, key in enumerate(keys)]
+        keyring = Keyring([BlockCrypter(keys[0])])
+
+        def add_and_decrypt(thread_index: int, call: int) -> bool:
+            if call == 0:
+                keyring.add(BlockCrypter(keys[thread_index], include_key_id=True))
+            return keyring.decrypt_from_block(blocks[0]).as_str() == "key 0"
+
+        self.assertTrue(all(all(results) for results in self._run_threads(add_and_decrypt, num_calls=20)))
+        self.assertEqual(len(keyring), self.NUM_THREADS)
+
+    def test004_memory_budget_and_zdicts(self):
+        budget = MemoryBudget(limit=1000, spill_size=100)
+
+        def reserve_release(thread_index: int, call: int) -> bool:
+            zdict_id = register_zdict(f"thread {thread_index} call {call}".encode())
+            if crippy_app._get_zdict(zdict_id) != f"thread {thread_index} call {call}".encode():
+                return False
+            if budget.reserve(50):
+                budget.release(50)
+            return budget.in_use <= 1000
+
+        with mk.patch.dict(crippy_app._ZDICTS):
+            self.assertTrue(all(all(results) for results in self._run_threads(reserve_release)))
+        self.assertEqual(budget.in_use, 0)
+
+
 if __name__ == "__main__":
     unittest.main()  # pragma: no cover
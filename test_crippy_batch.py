@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""Unit tests for crippy_batch.py"""
+
+import os
+import pathlib
+import random
+import tempfile
+import unittest
+import unittest.mock as mk
+
+from cryptography.fernet import Fernet, InvalidToken
+
+import crippy_batch
+from crippy_app import BlockCrypter, DataObject, InvalidBlockException
+
+# pylint: disable=missing-class-docstring, missing-function-docstring, invalid-name
+
+
+class TestEncryptDirectoryIncremental(unittest.TestCase):
+    KEY = Fernet.generate_key()
+
+    def setUp(self):
+        self.bc = BlockCrypter(self.KEY)
+        tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp_dir.cleanup)
+        self.src_dir = pathlib.Path(tmp_dir.name) / "src"
+        self.dst_dir = pathlib.Path(tmp_dir.name) / "dst"
+        (self.src_dir / "sub").mkdir(parents=True)
+        (self.src_dir / "a.txt").write_text("a" * 1000, encoding="utf-8")
+        (self.src_dir / "sub" / "b.bin").write_bytes(random.Random(0).randbytes(2000))
+
+    def _sync(self, bc=None):
+        return crippy_batch.encrypt_directory_incremental(self.bc if bc is None else bc, self.src_dir, self.dst_dir)
+
+    def test001_first_run_encrypts_everything(self):
+        report = self._sync()
+        self.assertEqual(report, crippy_batch.SyncReport(files_encrypted=2, bytes_encrypted=3000))
+        self.assertTrue((self.dst_dir / "a.txt.txt").exists())
+        self.assertTrue((self.dst_dir / "sub" / "b.bin.txt").exists())
+        self.assertTrue((self.dst_dir / crippy_batch.MANIFEST_FILENAME).exists())
+
+    def test002_blocks_can_be_decrypted(self):
+        self._sync()
+        block = (self.dst_dir / "sub" / "b.bin.txt").read_text(encoding="ascii")
+        obj = self.bc.decrypt_from_block(block)
+        self.assertEqual(obj.filename, "b.bin")
+        self.assertEqual(obj.binary_data, (self.src_dir / "sub" / "b.bin").read_bytes())
+
+    def test003_second_run_skips_unchanged_files(self):
+        self._sync()
+        report = self._sync()
+        self.assertEqual(report, crippy_batch.SyncReport(files_skipped=2, bytes_skipped=3000))
+
+    def test004_changed_file_is_encrypted_again(self):
+        self._sync()
+        (self.src_dir / "a.txt").write_text("b" * 500, encoding="utf-8")
+        report = self._sync()
+        self.assertEqual(report, crippy_batch.SyncReport(1, 500, 1, 2000, 0))
+        obj = self.bc.decrypt_from_block((self.dst_dir / "a.txt.txt").read_text(encoding="ascii"))
+        self.assertEqual(obj.as_str(), "b" * 500)
+
+    def test005_touched_file_with_same_content_is_skipped(self):
+        self._sync()
+        stat = (self.src_dir / "a.txt").stat()
+        os.utime(self.src_dir / "a.txt", ns=(stat.st_atime_ns, stat.st_mtime_ns + 5_000_000_000))
+        report = self._sync()
+        self.assertEqual(report, crippy_batch.SyncReport(files_skipped=2, bytes_skipped=3000))
+        self.assertEqual(self._sync().files_skipped, 2)
+
+    def test006_deleted_file_is_removed(self):
+        self._sync()
+        (self.src_dir / "a.txt").unlink()
+        report = self._sync()
+        self.assertEqual(report, crippy_batch.SyncReport(files_skipped=1, bytes_skipped=2000, files_removed=1))
+        self.assertFalse((self.dst_dir / "a.txt.txt").exists())
+
+    def test007_new_key_encrypts_everything(self):
+        self._sync()
+        report = self._sync(BlockCrypter(Fernet.generate_key()))
+        self.assertEqual(report.files_encrypted, 2)
+
+    def test008_missing_block_file_is_encrypted_again(self):
+        self._sync()
+        (self.dst_dir / "a.txt.txt").unlink()
+        report = self._sync()
+        self.assertEqual(report, crippy_batch.SyncReport(1, 1000, 1, 2000, 0))
+
+    def test009_file_changed_while_encrypting(self):
+        encrypt_file_atomic = crippy_batch.encrypt_file_atomic
+
+        def encrypt_and_change(block_crypter, source_file, target_file, zip_data=None):
+            num_bytes = encrypt_file_atomic(block_crypter, source_file, target_file, zip_data=zip_data)
+            if source_file.name == "a.txt":
+                source_file.write_text("c" * 1000, encoding="utf-8")  # same size, new content
+                os.utime(source_file, ns=(1, 1))
+            return num_bytes
+
+        with mk.patch("crippy_batch.encrypt_file_atomic", side_effect=encrypt_and_change):
+            self.assertEqual(self._sync().files_encrypted, 2)
+        # recorded without size and hash: encrypted again, now with the new content
+        report = self._sync()
+        self.assertEqual(report, crippy_batch.SyncReport(1, 1000, 1, 2000, 0))
+        obj = self.bc.decrypt_from_block((self.dst_dir / "a.txt.txt").read_text(encoding="ascii"))
+        self.assertEqual(obj.as_str(), "c" * 1000)
+
+    def test010_interrupted_run_keeps_progress(self):
+        encrypt_file_atomic = crippy_batch.encrypt_file_atomic
+
+        def encrypt_or_fail(block_crypter, source_file, target_file, zip_data=None):
+            if source_file.name == "b.bin":
+                raise KeyboardInterrupt
+            return encrypt_file_atomic(block_crypter, source_file, target_file, zip_data=zip_data)
+
+        with (
+            mk.patch("crippy_batch.encrypt_file_atomic", side_effect=encrypt_or_fail),
+            self.assertRaises(KeyboardInterrupt),
+        ):
+            self._sync()
+        report = self._sync()
+        self.assertEqual(report, crippy_batch.SyncReport(1, 2000, 1, 1000, 0))
+
+    def test011_file_changed_while_encrypting_then_deleted(self):
+        encrypt_file_atomic = crippy_batch.encrypt_file_atomic
+
+        def encrypt_and_change(block_crypter, source_file, target_file, zip_data=None):
+            num_bytes = encrypt_file_atomic(block_crypter, source_file, target_file, zip_data=zip_data)
+            if source_file.name == "a.txt":
+                source_file.write_text("changed", encoding="utf-8")
+            return num_bytes
+
+        with mk.patch("crippy_batch.encrypt_file_atomic", side_effect=encrypt_and_change):
+            self._sync()
+        self.assertTrue((self.dst_dir / "a.txt.txt").exists())
+        (self.src_dir / "a.txt").unlink()
+        self.assertEqual(self._sync(), crippy_batch.SyncReport(0, 0, 1, 2000, 1))
+        self.assertFalse((self.dst_dir / "a.txt.txt").exists())
+
+
+class TestFileToFile(unittest.TestCase):
+    KEY = Fernet.generate_key()
+
+    def setUp(self):
+        self.bc = BlockCrypter(self.KEY, chunk_size=1024)
+        tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_path = pathlib.Path(tmp_dir.name)
+        self.source_file = self.tmp_path / "a.bin"
+        self.source_file.write_bytes(random.Random(0).randbytes(10_000))
+
+    def test001_encrypt_and_decrypt_file_atomic(self):
+        block_file = self.tmp_path / "a.bin.txt"
+        self.assertEqual(crippy_batch.encrypt_file_atomic(self.bc, self.source_file, block_file), 10_000)
+        target_file = self.tmp_path / "b.bin"
+        self.assertEqual(crippy_batch.decrypt_file_atomic(self.bc, block_file, target_file), 10_000)
+        self.assertEqual(target_file.read_bytes(), self.source_file.read_bytes())
+        self.assertEqual(sorted(p.name for p in self.tmp_path.iterdir()), ["a.bin", "a.bin.txt", "b.bin"])
+
+    def test002_decrypt_file_atomic_keeps_target_on_error(self):
+        block_file = self.tmp_path / "a.bin.txt"
+        crippy_batch.encrypt_file_atomic(self.bc, self.source_file, block_file)
+        target_file = self.tmp_path / "b.bin"
+        target_file.write_bytes(b"test002")
+        with self.assertRaises(InvalidToken):
+            crippy_batch.decrypt_file_atomic(BlockCrypter(Fernet.generate_key()), block_file, target_file)
+        self.assertEqual(target_file.read_bytes(), b"test002")
+        self.assertFalse((self.tmp_path / "b.bin.tmp").exists())
+
+    def test003_process_file_encrypts_and_decrypts(self):
+        out_dir = self.tmp_path / "out"
+        (block_file, num_bytes) = crippy_batch.process_file(self.bc, self.source_file, out_dir)
+        self.assertEqual((block_file, num_bytes), (out_dir / "a.bin.txt", 10_000))
+        self.assertTrue(crippy_batch.is_block_file(self.bc, block_file))
+        self.assertFalse(crippy_batch.is_block_file(self.bc, self.source_file))
+        (target_file, num_bytes) = crippy_batch.process_file(self.bc, block_file, self.tmp_path / "restored")
+        self.assertEqual((target_file, num_bytes), (self.tmp_path / "restored" / "a.bin", 10_000))
+        self.assertEqual(target_file.read_bytes(), self.source_file.read_bytes())
+
+    def test004_process_file_directory(self):
+        source_dir = self.tmp_path / "dir"
+        source_dir.mkdir()
+        (source_dir / "c.txt").write_text("test004", encoding="utf-8")
+        (block_file, _) = crippy_batch.process_file(self.bc, source_dir, self.tmp_path / "out")
+        self.assertEqual(block_file, self.tmp_path / "out" / "dir.txt")
+        with open(block_file, encoding="ascii") as fh_in:
+            self.bc.decrypt_block_to_directory(fh_in, self.tmp_path / "restored")
+        self.assertEqual((self.tmp_path / "restored" / "dir" / "c.txt").read_text(encoding="utf-8"), "test004")
+
+
+class TestInspectFiles(unittest.TestCase):
+    KEY = Fernet.generate_key()
+
+    def setUp(self):
+        self.bc = BlockCrypter(self.KEY, chunk_size=1024)
+        tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_path = pathlib.Path(tmp_dir.name)
+        (self.tmp_path / "data.bin").write_bytes(random.Random(0).randbytes(5000))
+        crippy_batch.encrypt_file_atomic(self.bc, self.tmp_path / "data.bin", self.tmp_path / "a.txt")
+        blocks = [self.bc.encrypt_to_block(DataObject.from_str(f"text {i}")) for i in range(3)]
+        (self.tmp_path / "b.txt").write_text("\n".join(blocks), encoding="ascii")
+
+    def test001_inspect_file_without_key(self):
+        bc = BlockCrypter(Fernet.generate_key())
+        (info,) = crippy_batch.inspect_file(bc, self.tmp_path / "a.txt")
+        self.assertEqual(
+            (info.content_type, info.filename, info.size, info.chunked, info.num_tokens),
+            ("application/octet-stream", "data.bin", 5000, True, 5),
+        )
+        infos = crippy_batch.inspect_file(bc, self.tmp_path / "b.txt")
+        self.assertEqual(
+            [(info.content_type, info.charset, info.size) for info in infos], [("text/plain", "utf-8", 6)] * 3
+        )
+        with self.assertRaises(InvalidBlockException):
+            crippy_batch.inspect_file(bc, self.tmp_path / "data.bin")
+
+    def test002_inspect_files(self):
+        (self.tmp_path / "c.txt").write_text("===== START BLOCK =====\nContent-Type: text/plain\n", encoding="ascii")
+        report = crippy_batch.inspect_files(self.bc, [self.tmp_path])
+        self.assertEqual(sorted(report.blocks), [str(self.tmp_path / "a.txt"), str(self.tmp_path / "b.txt")])
+        self.assertEqual([len(infos) for _, infos in sorted(report.blocks.items())], [1, 3])
+        self.assertEqual(list(report.errors), [str(self.tmp_path / "c.txt")])
+
+
+if __name__ == "__main__":
+    unittest.main()  # pragma: no cover
+
+
+class TestRotateKeys(unittest.TestCase):
+    OLD_KEY = Fernet.generate_key()
+    NEW_KEY = Fernet.generate_key()
+
+    def setUp(self):
+        self.old_bc = BlockCrypter(self.OLD_KEY, chunk_size=1024)
+        self.new_bc = BlockCrypter(self.NEW_KEY, include_key_id=True)
+        tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_path = pathlib.Path(tmp_dir.name)
+        (self.tmp_path / "sub").mkdir()
+        self.data = random.Random(0).randbytes(5000)
+        (self.tmp_path / "data.bin").write_bytes(self.data)
+        crippy_batch.encrypt_file_atomic(self.old_bc, self.tmp_path / "data.bin", self.tmp_path / "sub" / "a.txt")
+        blocks = [self.old_bc.encrypt_to_block(DataObject.from_str(f"text {i}")) for i in range(3)]
+        (self.tmp_path / "b.txt").write_text("intro\n" + "between\n".join(blocks) + "outro\n", encoding="ascii")
+
+    def test001_rotate_file(self):
+        self.assertEqual(crippy_batch.rotate_file(self.old_bc, self.new_bc, self.tmp_path / "b.txt"), 3)
+        text = (self.tmp_path / "b.txt").read_text(encoding="ascii")
+        self.assertTrue(text.startswith("intro\n"))
+        self.assertTrue(text.endswith("===== END BLOCK =====\noutro\n"))
+        self.assertEqual(text.count(f"Key-Id: {self.new_bc.key_id}\n"), 3)
+        self.assertEqual(self.new_bc.decrypt_from_block(text).as_str(), "text 0")
+        with self.assertRaises(InvalidToken):
+            self.old_bc.decrypt_from_block(text)
+        # already rotated: skipped
+        self.assertEqual(crippy_batch.rotate_file(self.old_bc, self.new_bc, self.tmp_path / "b.txt"), 0)
+
+    def test002_rotate_keys(self):
+        report = crippy_batch.rotate_keys(self.old_bc, self.new_bc, [self.tmp_path], max_workers=2)
+        self.assertEqual(report, crippy_batch.RotationReport(files_rotated=2, blocks_rotated=4))
+        target_file = self.tmp_path / "data.out"
+        crippy_batch.decrypt_file_atomic(self.new_bc, self.tmp_path / "sub" / "a.txt", target_file)
+        self.assertEqual(target_file.read_bytes(), self.data)
+
+    def test003_rotate_keys_is_resumable(self):
+        crippy_batch.rotate_file(self.old_bc, self.new_bc, self.tmp_path / "b.txt")
+        (self.tmp_path / "sub" / "a.txt.tmp").write_text("===== START BLOCK =====\ntruncated", encoding="ascii")
+        report = crippy_batch.rotate_keys(self.old_bc, self.new_bc, [self.tmp_path], max_workers=1)
+        self.assertEqual(report, crippy_batch.RotationReport(files_rotated=1, blocks_rotated=1, files_skipped=1))
+
+    def test004_rotate_keys_reports_errors(self):
+        other_bc = BlockCrypter(Fernet.generate_key())
+        report = crippy_batch.rotate_keys(other_bc, self.new_bc, [self.tmp_path / "b.txt"], max_workers=1)
+        self.assertEqual(report.files_rotated, 0)
+        self.assertEqual(list(report.errors), [str(self.tmp_path / "b.txt")])
+        self.assertTrue((self.tmp_path / "b.txt").read_text(encoding="ascii").startswith("intro\n"))
+
+
+class TestVerifyFiles(unittest.TestCase):
+    KEY = Fernet.generate_key()
+
+    def setUp(self):
+        self.bc = BlockCrypter(self.KEY, chunk_size=1024)
+        tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_path = pathlib.Path(tmp_dir.name)
+        (self.tmp_path / "data.bin").write_bytes(random.Random(0).randbytes(5000))
+        crippy_batch.encrypt_file_atomic(self.bc, self.tmp_path / "data.bin", self.tmp_path / "a.txt")
+        blocks = [self.bc.encrypt_to_block(DataObject.from_str(f"text {i}")) for i in range(3)]
+        (self.tmp_path / "b.txt").write_text("\n".join(blocks), encoding="ascii")
+
+    def test001_verify_file(self):
+        self.assertEqual(crippy_batch.verify_file(self.bc, self.tmp_path / "a.txt"), 1)
+        self.assertEqual(crippy_batch.verify_file(self.bc, self.tmp_path / "b.txt"), 3)
+        with self.assertRaises(InvalidToken):
+            crippy_batch.verify_file(BlockCrypter(Fernet.generate_key()), self.tmp_path / "a.txt")
+
+    def test002_verify_files(self):
+        report = crippy_batch.verify_files(self.bc, [self.tmp_path], max_workers=2)
+        self.assertEqual(report, crippy_batch.VerifyReport(files_passed=2, blocks_passed=4))
+        lines = (self.tmp_path / "a.txt").read_text(encoding="ascii").splitlines(keepends=True)
+        i = lines.index("\n") + 2  # second line of the data
+        lines[i] = lines[i][:10] + ("A" if lines[i][10] != "A" else "B") + lines[i][11:]
+        (self.tmp_path / "a.txt").write_text("".join(lines), encoding="ascii")
+        report = crippy_batch.verify_files(self.bc, [self.tmp_path], max_workers=2)
+        self.assertEqual(report.files_passed, 1)
+        self.assertEqual(list(report.errors), [str(self.tmp_path / "a.txt")])
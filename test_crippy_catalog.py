@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Unit tests for crippy_catalog.py"""
+
+import os
+import pathlib
+import random
+import tempfile
+import unittest
+
+from cryptography.fernet import Fernet, InvalidToken
+
+import crippy_batch
+import crippy_catalog
+from crippy_app import BlockCrypter, DataObject, InvalidBlockException, MissingFilenameException
+
+
+class TestCatalog(unittest.TestCase):
+    KEY = Fernet.generate_key()
+
+    def setUp(self):
+        self.bc = BlockCrypter(self.KEY, chunk_size=1024)
+        tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_path = pathlib.Path(tmp_dir.name)
+        self.blocks_dir = self.tmp_path / "blocks"
+        (self.blocks_dir / "sub").mkdir(parents=True)
+        self.data = random.Random(0).randbytes(5000)
+        (self.tmp_path / "data.bin").write_bytes(self.data)
+        crippy_batch.encrypt_file_atomic(self.bc, self.tmp_path / "data.bin", self.blocks_dir / "sub" / "a.txt")
+        blocks = [self.bc.encrypt_to_block(DataObject.from_str(f"text {i}")) for i in range(3)]
+        (self.blocks_dir / "b.txt").write_text("some text\n" + "\n".join(blocks), encoding="ascii")
+        self.catalog = crippy_catalog.Catalog(self.tmp_path / "catalog.db")
+        self.addCleanup(self.catalog.close)
+
+    def test001_scan_file(self):
+        entries = crippy_catalog.scan_file(self.bc, self.blocks_dir / "b.txt")
+        self.assertEqual([entry.offset for entry in entries][0], len("some text\n"))
+        content = (self.blocks_dir / "b.txt").read_bytes()
+        for i, entry in enumerate(entries):
+            block = content[entry.offset : entry.offset + entry.length].decode("ascii")
+            self.assertEqual(self.bc.decrypt_from_block(block).as_str(), f"text {i}")
+            self.assertEqual((entry.content_type, entry.charset, entry.size), ("text/plain", "utf-8", 6))
+        with self.assertRaises(InvalidBlockException):
+            crippy_catalog.scan_file(self.bc, self.tmp_path / "data.bin")
+
+    def test002_refresh_incremental(self):
+        report = self.catalog.refresh([self.blocks_dir])
+        self.assertEqual(report, crippy_catalog.RefreshReport(files_added=2, blocks_indexed=4))
+        self.assertEqual(len(self.catalog), 4)
+        report = self.catalog.refresh([self.blocks_dir])
+        self.assertEqual(report, crippy_catalog.RefreshReport(files_unchanged=2))
+        # a changed file is scanned again, a deleted file is removed
+        block_file = self.blocks_dir / "b.txt"
+        block_file.write_text(self.bc.encrypt_to_block(DataObject.from_str("new")), encoding="ascii")
+        os.utime(block_file, ns=(1, 1))
+        (self.blocks_dir / "sub" / "a.txt").unlink()
+        report = self.catalog.refresh([self.blocks_dir])
+        self.assertEqual(report, crippy_catalog.RefreshReport(files_updated=1, files_removed=1, blocks_indexed=1))
+        self.assertEqual(len(self.catalog), 1)
+
+    def test003_find_and_extract(self):
+        self.catalog.refresh([self.blocks_dir])
+        self.assertEqual(len(self.catalog.find(content_type="text/plain")), 3)
+        self.assertEqual(self.catalog.find(filename="missing.bin"), [])
+        (entry,) = self.catalog.find(filename="data.*")
+        self.assertEqual((entry.filename, entry.size, entry.offset), ("data.bin", 5000, 0))
+        self.assertEqual(self.catalog.find(filename="data.bin", content_type="application/octet-stream"), [entry])
+        target_dir = self.tmp_path / "out"
+        target_dir.mkdir()
+        (filename, num_bytes) = self.catalog.extract(self.bc, entry, target_dir)
+        self.assertEqual((pathlib.Path(filename), num_bytes), (target_dir / "data.bin", 5000))
+        self.assertEqual(pathlib.Path(filename).read_bytes(), self.data)
+        (_, entry, _) = self.catalog.find(content_type="text/plain")
+        self.assertEqual(self.bc.decrypt_from_block(self.catalog.read_block(entry)).as_str(), "text 1")
+
+    def test004_changed_file(self):
+        self.catalog.refresh([self.blocks_dir])
+        (entry,) = self.catalog.find(filename="data.bin")
+        pathlib.Path(entry.path).write_text("short", encoding="ascii")
+        with self.assertRaises(InvalidBlockException):
+            self.catalog.read_block(entry)
+
+    def test005_extract_wrong_key_keeps_existing_file(self):
+        self.catalog.refresh([self.blocks_dir])
+        (entry,) = self.catalog.find(filename="data.bin")
+        target_dir = self.tmp_path / "out"
+        target_dir.mkdir()
+        (target_dir / "data.bin").write_bytes(b"existing")
+        with self.assertRaises(InvalidToken):
+            self.catalog.extract(BlockCrypter(Fernet.generate_key()), entry, target_dir)
+        self.assertEqual(sorted(target_dir.iterdir()), [target_dir / "data.bin"])
+        self.assertEqual((target_dir / "data.bin").read_bytes(), b"existing")
+        (text_entry, _, _) = self.catalog.find(content_type="text/plain")
+        with self.assertRaises(MissingFilenameException):
+            self.catalog.extract(self.bc, text_entry, target_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()  # pragma: no cover
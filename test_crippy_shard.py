@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Unit tests for crippy_shard.py"""
+
+import json
+import pathlib
+import tempfile
+import time
+import unittest
+import unittest.mock as mk
+
+from cryptography.fernet import Fernet
+
+import crippy_batch
+import crippy_shard
+from crippy_app import BlockCrypter, InvalidDataException
+
+# pylint: disable=missing-class-docstring, missing-function-docstring, protected-access
+
+
+class TestShardedJob(unittest.TestCase):
+    KEY = Fernet.generate_key()
+
+    def setUp(self):
+        self.bc = BlockCrypter(self.KEY)
+        tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_path = pathlib.Path(tmp_dir.name)
+        self.files = {f"sub{i % 3}/file{i:02d}.bin": f"content {i}".encode() * (i + 1) for i in range(12)}
+        for rel_path, data in self.files.items():
+            (self.tmp_path / "in" / rel_path).parent.mkdir(parents=True, exist_ok=True)
+            (self.tmp_path / "in" / rel_path).write_bytes(data)
+        (self.tmp_path / "single.bin").write_bytes(b"single")
+        self.job_file = self._write_job(
+            "job.json",
+            {
+                "inputs": ["in", "single.bin"],
+                "output": "out",
+                "codec": {"transfer_encoding": "base85", "zip": False},
+                "concurrency": {"shard_size": 5, "threads": 2, "lease_time": 60},
+            },
+        )
+
+    def _write_job(self, name: str, spec: dict) -> pathlib.Path:
+        job_file = self.tmp_path / name
+        job_file.write_text(json.dumps(spec), encoding="utf-8")
+        return job_file
+
+    def _decrypt(self, block_file: pathlib.Path) -> bytes:
+        target_file = self.tmp_path / "decrypted.bin"
+        crippy_batch.decrypt_file_atomic(self.bc, block_file, target_file)
+        return target_file.read_bytes()
+
+    def test001_load(self):
+        job = crippy_shard.JobSpec.load(self.job_file)
+        self.assertEqual(
+            (job.mode, job.transfer_encoding, job.zip_data, job.shard_size), ("encrypt", "base85", False, 5)
+        )
+        self.assertEqual(job.work_dir, self.tmp_path / "job.json.work")
+        self.assertEqual(len(list(job.iter_inputs())), 13)
+        self.assertIn(("single.bin", "single.bin"), list(job.iter_inputs()))
+        for spec in ({"output": "out"}, {"inputs": [], "output": "out", "mode": "rotate"}, "no job"):
+            with self.subTest(spec=spec), self.assertRaises(InvalidDataException):
+                crippy_shard.JobSpec.load(self._write_job("invalid.json", spec))
+
+    def test002_run_worker(self):
+        report = crippy_shard.run_worker(self.bc, self.job_file, worker_id="worker-1")
+        self.assertEqual((report.shards_completed, report.files_processed, report.errors), (3, 13, {}))
+        for rel_path, data in self.files.items():
+            block_file = self.tmp_path / "out" / f"{rel_path}.txt"
+            self.assertIn("Content-Transfer-Encoding: base85", block_file.read_text(encoding="ascii"))
+            self.assertEqual(self._decrypt(block_file), data)
+        status = crippy_shard.job_status(self.job_file)
+        self.assertEqual(crippy_shard.JobStatus(3, 3, 0, 13, 13, 0), status)
+        # decrypt the result again with another job
+        job_file = self._write_job("decrypt.json", {"inputs": ["out"], "output": "back", "mode": "auto"})
+        self.assertEqual(crippy_shard.run_worker(self.bc, job_file).files_processed, 13)
+        for rel_path, data in self.files.items():
+            self.assertEqual((self.tmp_path / "back" / rel_path).read_bytes(), data)
+
+    def test003_take_over_crashed_shard(self):
+        job = crippy_shard.JobSpec.load(self.job_file)
+        shards = crippy_shard.load_plan(job, "worker-1")
+        (done_path, _) = shards[0][0]
+        (job.work_dir / "shard-00000.json").write_text(
+            json.dumps({"completed": False, "done": [done_path], "errors": {}}), encoding="utf-8"
+        )
+        (job.work_dir / "shard-00000.lock").write_text(
+            json.dumps({"owner": "crashed", "expires": time.time() - 1}), encoding="utf-8"
+        )
+        self.assertEqual(crippy_shard.job_status(self.job_file).shards_leased, 0)
+        with mk.patch("crippy_shard.process_job_file", wraps=crippy_shard.process_job_file) as process_job_file:
+            report = crippy_shard.run_worker(self.bc, self.job_file, worker_id="worker-2")
+        self.assertEqual(report.files_processed, 12)
+        self.assertNotIn(done_path, [call.args[2] for call in process_job_file.call_args_list])
+        self.assertFalse((self.tmp_path / "out" / f"{done_path}.txt").exists())
+        self.assertEqual(crippy_shard.job_status(self.job_file).shards_completed, 3)
+
+    def test004_lease(self):
+        lock_file = self.tmp_path / "shard.lock"
+        lease_1 = crippy_shard.Lease(lock_file, "worker-1", 60)
+        lease_2 = crippy_shard.Lease(lock_file, "worker-2", 60)
+        self.assertTrue(lease_1.acquire())
+        self.assertFalse(lease_2.acquire())
+        self.assertTrue(lease_1.renew())
+        self.assertFalse(lease_2.renew())
+        lease_2.release()  # not ours: nothing happens
+        self.assertTrue(lease_1.is_leased())
+        lease_1.release()
+        self.assertFalse(lease_1.is_leased())
+        # an expired lease (the owner stopped renewing it) is taken over, the old owner loses it
+        self.assertTrue(lease_1.acquire())
+        with mk.patch("crippy_shard.time.time", return_value=time.time() + 61):
+            self.assertTrue(lease_2.acquire())
+        self.assertFalse(lease_1.renew())
+        self.assertTrue(lease_2.renew())
+        self.assertEqual(sorted(path.name for path in self.tmp_path.glob("shard.lock*")), ["shard.lock"])
+
+    def test005_worker_processes(self):
+        report = crippy_shard.run_workers(self.bc, self.job_file, processes=2)
+        self.assertEqual((report.shards_completed, report.files_processed, report.errors), (3, 13, {}))
+        self.assertEqual(self._decrypt(self.tmp_path / "out" / "single.bin.txt"), b"single")
+
+
+if __name__ == "__main__":
+    unittest.main()  # pragma: no cover
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Unit tests for crippy_store.py"""
+
+import io
+import pathlib
+import random
+import tempfile
+import unittest
+
+from cryptography.fernet import Fernet
+
+from crippy_app import BlockCrypter
+from crippy_store import ChunkNotFoundException, ChunkStore, ContentDefinedChunker, VersionNotFoundException
+
+# pylint: disable=missing-class-docstring, missing-function-docstring, invalid-name, protected-access
+
+
+class TestContentDefinedChunker(unittest.TestCase):
+    def setUp(self):
+        self.chunker = ContentDefinedChunker(b"test", min_size=1024, avg_size=4096, max_size=16384)
+        self.data = random.Random(0).randbytes(500_000)
+
+    def _chunks(self, data):
+        return list(self.chunker.chunks(io.BytesIO(data), read_size=10_000))
+
+    def test001_chunks_add_up_to_data(self):
+        self.assertEqual(b"".join(self._chunks(self.data)), self.data)
+
+    def test002_chunk_sizes(self):
+        chunks = self._chunks(self.data)
+        self.assertTrue(all(1024 <= len(chunk) <= 16384 for chunk in chunks[:-1]))
+        self.assertLess(len(chunks), len(self.data) / 1024)
+
+    def test003_insertion_only_changes_nearby_chunks(self):
+        chunks = self._chunks(self.data)
+        new_chunks = self._chunks(self.data[:250_000] + b"test003" + self.data[250_000:])
+        self.assertLessEqual(len(set(new_chunks) - set(chunks)), 2)
+
+    def test004_text(self):
+        words = "the quick brown fox jumps over a lazy dog".split()
+        rnd = random.Random(0)
+        text = " ".join(rnd.choice(words) for _ in range(100_000)).encode()
+        chunks = self._chunks(text)
+        self.assertEqual(b"".join(chunks), text)
+        self.assertLess(sum(len(chunk) == 16384 for chunk in chunks), len(chunks) / 10)
+
+    def test005_empty(self):
+        self.assertEqual(self._chunks(b""), [])
+
+    def test006_boundaries_depend_on_key(self):
+        other_chunker = ContentDefinedChunker(b"other", min_size=1024, avg_size=4096, max_size=16384)
+        other_chunks = list(other_chunker.chunks(io.BytesIO(self.data)))
+        self.assertNotEqual([len(chunk) for chunk in self._chunks(self.data)], [len(chunk) for chunk in other_chunks])
+
+
+class TestChunkStore(unittest.TestCase):
+    KEY = Fernet.generate_key()
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_path = pathlib.Path(tmp_dir.name)
+        self.store = ChunkStore(self.tmp_path / "store", BlockCrypter(self.KEY), min_size=1024, avg_size=4096)
+        self.data = random.Random(0).randbytes(300_000)
+        self.source_file = self.tmp_path / "data.bin"
+        self.source_file.write_bytes(self.data)
+
+    def test001_put_and_get(self):
+        report = self.store.put(self.source_file)
+        self.assertEqual(report.num_bytes, len(self.data))
+        self.assertEqual(report.new_chunks, report.num_chunks)
+        self.assertEqual(self.store.get("data.bin", self.tmp_path / "restored.bin"), len(self.data))
+        self.assertEqual((self.tmp_path / "restored.bin").read_bytes(), self.data)
+
+    def test002_unchanged_file_stores_no_chunks(self):
+        self.store.put(self.source_file)
+        report = self.store.put(self.source_file)
+        self.assertEqual(report.new_chunks, 0)
+        self.assertEqual(report.new_bytes, 0)
+        self.assertEqual(len(self.store.versions("data.bin")), 2)
+
+    def test003_small_change_stores_few_chunks(self):
+        first = self.store.put(self.source_file)
+        self.source_file.write_bytes(self.data[:100_000] + b"test003" + self.data[100_000:])
+        report = self.store.put(self.source_file)
+        self.assertLessEqual(report.new_chunks, 2)
+        self.assertLess(report.new_bytes, report.num_bytes / 10)
+        self.store.get("data.bin", self.tmp_path / "latest.bin")
+        self.assertEqual((self.tmp_path / "latest.bin").read_bytes(), self.source_file.read_bytes())
+        self.store.get("data.bin", self.tmp_path / "first.bin", version=first.version)
+        self.assertEqual((self.tmp_path / "first.bin").read_bytes(), self.data)
+
+    def test004_unknown_name(self):
+        self.assertEqual(self.store.versions("unknown"), [])
+        with self.assertRaises(VersionNotFoundException):
+            self.store.get("unknown", self.tmp_path / "unknown")
+
+    def test005_unknown_version(self):
+        self.store.put(self.source_file)
+        with self.assertRaises(VersionNotFoundException):
+            self.store.get("data.bin", self.tmp_path / "restored.bin", version="unknown")
+
+    def test006_missing_chunk(self):
+        self.store.put(self.source_file)
+        next((self.tmp_path / "store" / "chunks").glob("*/*")).unlink()
+        (self.tmp_path / "restored.bin").write_bytes(b"existing")
+        with self.assertRaises(ChunkNotFoundException):
+            self.store.get("data.bin", self.tmp_path / "restored.bin")
+        self.assertEqual((self.tmp_path / "restored.bin").read_bytes(), b"existing")
+        self.assertFalse((self.tmp_path / "restored.bin.tmp").exists())
+
+    def test007_names_are_not_stored_in_clear(self):
+        self.store.put(self.source_file, name="secret_name.bin")
+        names = [path.name for path in (self.tmp_path / "store").rglob("*")]
+        self.assertFalse(any("secret" in name for name in names))
+
+
+if __name__ == "__main__":
+    unittest.main()  # pragma: no cover
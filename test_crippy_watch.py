@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Unit tests for crippy_watch.py"""
+
+import json
+import os
+import pathlib
+import tempfile
+import threading
+import unittest
+import unittest.mock as mk
+
+from cryptography.fernet import Fernet
+
+import crippy_batch
+import crippy_watch
+from crippy_app import BlockCrypter
+
+# pylint: disable=missing-class-docstring, missing-function-docstring, protected-access
+
+
+class TestFolderWatcher(unittest.TestCase):
+    KEY = Fernet.generate_key()
+
+    def setUp(self):
+        self.bc = BlockCrypter(self.KEY)
+        tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_path = pathlib.Path(tmp_dir.name)
+        self.watch_dir = self.tmp_path / "in"
+        (self.watch_dir / "sub").mkdir(parents=True)
+        self.output_dir = self.tmp_path / "out"
+
+    def _watcher(self, **kwargs) -> crippy_watch.FolderWatcher:
+        kwargs.setdefault("settle_time", 0)
+        watcher = crippy_watch.FolderWatcher(self.bc, self.watch_dir, self.output_dir, **kwargs)
+        self.addCleanup(watcher.close)
+        return watcher
+
+    def _decrypt(self, block_file: pathlib.Path) -> bytes:
+        target_file = self.tmp_path / "decrypted.bin"
+        crippy_batch.decrypt_file_atomic(self.bc, block_file, target_file)
+        return target_file.read_bytes()
+
+    def test001_settle_time(self):
+        watcher = self._watcher(settle_time=5)
+        source = self.watch_dir / "sub" / "a.bin"
+        with mk.patch("crippy_watch.time.monotonic") as monotonic:
+            source.write_bytes(b"part 1")
+            monotonic.return_value = 100.0
+            self.assertEqual((watcher.poll(), watcher.is_busy()), ([], False))
+            # still being written: the settle time starts again
+            with open(source, "ab") as fh_out:
+                fh_out.write(b", part 2")
+            os.utime(source, ns=(1, 1))
+            monotonic.return_value = 104.0
+            watcher.poll()
+            monotonic.return_value = 108.0
+            watcher.poll()
+            self.assertFalse(watcher.is_busy())
+            monotonic.return_value = 109.0
+            watcher.poll()
+            self.assertTrue(watcher.is_busy())
+        (event,) = watcher.close()
+        self.assertEqual((event.path, event.status, event.num_bytes), ("sub/a.bin", "done", 14))
+        self.assertEqual(pathlib.Path(event.target), self.output_dir / "sub" / "a.bin.txt")
+        self.assertEqual(self._decrypt(self.output_dir / "sub" / "a.bin.txt"), b"part 1, part 2")
+
+    def test002_at_most_once(self):
+        (self.watch_dir / "a.bin").write_bytes(b"a")
+        (self.watch_dir / "b.bin").write_bytes(b"b")
+        (self.watch_dir / "upload.part").write_bytes(b"partial")
+        watcher = self._watcher()
+        watcher.poll()
+        self.assertEqual(sorted(event.path for event in watcher.close()), ["a.bin", "b.bin"])
+        state = json.loads((self.output_dir / crippy_watch.STATE_FILENAME).read_text(encoding="utf-8"))
+        self.assertEqual({entry["status"] for entry in state["files"].values()}, {"done"})
+        # a file claimed by a crashed watcher is not processed again, a changed file is
+        state["files"]["a.bin"]["status"] = "claimed"
+        (self.output_dir / crippy_watch.STATE_FILENAME).write_text(json.dumps(state), encoding="utf-8")
+        (self.watch_dir / "b.bin").write_bytes(b"b, version 2")
+        watcher = self._watcher()
+        watcher.poll()
+        self.assertEqual([event.path for event in watcher.close()], ["b.bin"])
+        self.assertEqual(self._decrypt(self.output_dir / "b.bin.txt"), b"b, version 2")
+
+    def test003_modes(self):
+        (self.watch_dir / "plain.bin").write_bytes(b"plain")
+        (self.tmp_path / "secret.bin").write_bytes(b"secret")
+        crippy_batch.encrypt_file_atomic(self.bc, self.tmp_path / "secret.bin", self.watch_dir / "secret.bin.txt")
+        watcher = self._watcher(mode="auto")
+        watcher.poll()
+        events = {event.path: event for event in watcher.close()}
+        self.assertEqual(pathlib.Path(events["plain.bin"].target), self.output_dir / "plain.bin.txt")
+        self.assertEqual(pathlib.Path(events["secret.bin.txt"].target), self.output_dir / "secret.bin")
+        self.assertEqual((self.output_dir / "secret.bin").read_bytes(), b"secret")
+        watcher = self._watcher(mode="decrypt", state_file=self.tmp_path / "state.json")
+        watcher.poll()
+        events = {event.path: event for event in watcher.close()}
+        self.assertEqual((events["plain.bin"].status, events["plain.bin"].error), ("failed", "not a block file"))
+        self.assertEqual(events["secret.bin.txt"].status, "done")
+        with self.assertRaises(ValueError):
+            self._watcher(mode="rotate")
+
+    def test004_run_output_dir_inside(self):
+        self.output_dir = self.watch_dir / "out"
+        (self.watch_dir / "a.bin").write_bytes(b"a")
+        events = []
+        stop = threading.Event()
+
+        def callback(event: crippy_watch.WatchEvent) -> None:
+            events.append(event)
+            stop.set()
+
+        self._watcher(workers=1).run(interval=0.01, stop=stop, callback=callback)
+        self.assertEqual([event.path for event in events], ["a.bin"])
+        self.assertEqual(sorted(path.name for path in self.output_dir.iterdir()), ["a.bin.txt", "watch_state.json"])
+
+
+if __name__ == "__main__":
+    unittest.main()  # pragma: no cover
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Unit tests for usersettings.py"""
+
+import gc
+import json
+import os
+import pathlib
+import tempfile
+import time
+import unittest
+import unittest.mock as mk
+
+import usersettings
+from usersettings import UserSettings
+
+# pylint: disable=missing-class-docstring, missing-function-docstring, invalid-name
+
+
+@mk.patch.object(UserSettings, "ENCODING", "utf-8")
+class TestUserSettings(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp_dir.cleanup)
+        self.config_path = pathlib.Path(tmp_dir.name)
+        patcher = mk.patch("usersettings.PlatformDirs")
+        self.addCleanup(patcher.stop)
+        patcher.start().return_value.user_config_path = self.config_path
+        self.settings_file = self.config_path / UserSettings.DEFAULT_FILENAME
+
+    def _file_content(self):
+        return json.loads(self.settings_file.read_text(encoding="utf-8"))
+
+    def test001_get_set_immediate_write(self):
+        settings = UserSettings("test", write_delay=0)
+        self.assertIsNone(settings.get("a"))
+        settings["a"] = 1
+        self.assertEqual(settings["a"], 1)
+        self.assertEqual(self._file_content(), {"a": 1})
+        self.assertFalse(self.settings_file.with_name("settings.json.tmp").exists())
+
+    def test002_file_is_read_once(self):
+        self.settings_file.write_text(json.dumps({"a": 1}), encoding="utf-8")
+        settings = UserSettings("test", write_delay=0)
+        with mk.patch("usersettings.json.loads", wraps=json.loads) as loads:
+            for _ in range(10):
+                self.assertEqual(settings["a"], 1)
+            self.assertEqual(loads.call_count, 1)
+
+    def test003_reload_when_file_changes(self):
+        settings = UserSettings("test", write_delay=0)
+        settings["a"] = 1
+        self.settings_file.write_text(json.dumps({"a": 2}), encoding="utf-8")
+        stat = self.settings_file.stat()
+        os.utime(self.settings_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        self.assertEqual(settings["a"], 2)
+
+    def test004_batch_writes_once(self):
+        settings = UserSettings("test", write_delay=0)
+        with mk.patch("usersettings.os.replace", wraps=os.replace) as replace:
+            with settings.batch():
+                settings["a"] = 1
+                settings["b"] = 2
+                self.assertFalse(self.settings_file.exists())
+            self.assertEqual(replace.call_count, 1)
+        self.assertEqual(self._file_content(), {"a": 1, "b": 2})
+
+    def test005_debounced_write(self):
+        settings = UserSettings("test", write_delay=0.05)
+        settings["a"] = 1
+        settings["b"] = 2
+        self.assertFalse(self.settings_file.exists())
+        self.assertEqual(settings.settings, {"a": 1, "b": 2})
+        time.sleep(0.3)
+        self.assertEqual(self._file_content(), {"a": 1, "b": 2})
+
+    def test006_flush(self):
+        settings = UserSettings("test", write_delay=60)
+        settings.settings = {"a": 1}
+        settings.flush()
+        self.assertEqual(self._file_content(), {"a": 1})
+
+    def test007_settings_type_error(self):
+        settings = UserSettings("test", write_delay=0)
+        with self.assertRaises(TypeError):
+            settings.settings = [1, 2]
+
+    def test008_flush_at_exit(self):
+        settings = UserSettings("test", write_delay=60)
+        settings["a"] = 1
+        usersettings._flush_all()
+        self.assertEqual(self._file_content(), {"a": 1})
+        # instances are not kept alive for the exit hook
+        del settings
+        gc.collect()
+        self.assertEqual(len(usersettings._INSTANCES), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()  # pragma: no cover
@@ -1,12 +1,28 @@
 #!/usr/bin/env python3
 """Manage user settings using a (user and platform specific) file."""
 
+import atexit
+import contextlib
 import json
+import os
 import pathlib
+import threading
+import weakref
+from collections.abc import Iterator
 from typing import Any
 
 from platformdirs import PlatformDirs
 
+# live UserSettings instances, their pending changes are written when the program exits
+_INSTANCES: "weakref.WeakSet[UserSettings]" = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_all() -> None:
+    """Write the pending changes of all live UserSettings instances."""
+    for user_settings in list(_INSTANCES):
+        user_settings.flush()
+
 
 class UserSettings:
     """Manage user settings using a (user and platform specific) file.
@@ -17,9 +33,18 @@ class UserSettings:
     https://docs.python.org/3/library/json.html?highlight=json#py-to-json-table
 
     The default filename (can be overruled) is: settings.json
+
+    The settings are loaded once and cached in memory, the file is only read
+    again when its modification time changes. Changes are written back after
+    `write_delay` seconds (multiple changes in that period result in a single
+    write), use `batch()` to group changes explicitly and `flush()` to write
+    immediately. Pending changes are written when the program exits. The
+    file is always replaced atomically (temporary file and `os.replace()`).
     """
 
     DEFAULT_FILENAME = "settings.json"
+    DEFAULT_WRITE_DELAY = 1.0
+    ENCODING = "ansi"
 
     def __init__(
         self,
@@ -27,6 +52,7 @@ def __init__(
         app_author: None | str = None,
         filename: None | str | pathlib.Path = None,
         roaming: bool = False,
+        write_delay: None | float = None,
     ) -> None:
         r"""Create a new UserSettings instance.
 
@@ -53,6 +79,9 @@ def __init__(
                 settings file, default: `UserSettings.DEFAULT_FILENAME`.
             roaming (bool, optional): only relevant on Windows: roaming or
                 local directory, defaults to local (`roaming=False`).
+            write_delay (None | float, optional): delay (in seconds) before
+                changes are written, default: `DEFAULT_WRITE_DELAY`, 0: write
+                immediately.
         """
         self.platformdirs = PlatformDirs(appname=app_name, appauthor=app_author, roaming=roaming)
         if not self.platformdirs.user_config_path.exists():
@@ -61,13 +90,82 @@ def __init__(
             self.user_settings_file = self.platformdirs.user_config_path / self.DEFAULT_FILENAME
         else:
             self.user_settings_file = self.platformdirs.user_config_path / pathlib.Path(filename).name
+        self.write_delay = self.DEFAULT_WRITE_DELAY if write_delay is None else write_delay
+        self._lock = threading.RLock()
+        self._cache: dict = {}
+        self._mtime_ns: None | int = -1  # -1: never loaded, None: no file
+        self._dirty = False
+        self._batch_depth = 0
+        self._timer: None | threading.Timer = None
+        _INSTANCES.add(self)
+
+    def _file_mtime_ns(self) -> None | int:
+        """Get the modification time of the settings file (None: no file)."""
+        try:
+            return self.user_settings_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load(self) -> dict:
+        """Get the cached settings, (re)load them when the file has changed."""
+        with self._lock:
+            if not self._dirty and ((mtime_ns := self._file_mtime_ns()) != self._mtime_ns):
+                if mtime_ns is None:
+                    self._cache = {}
+                else:
+                    self._cache = json.loads(self.user_settings_file.read_text(encoding=self.ENCODING))
+                self._mtime_ns = mtime_ns
+            return self._cache
+
+    def _changed(self) -> None:
+        """Register a change: schedule a (debounced) write."""
+        self._dirty = True
+        if self._batch_depth > 0:
+            return
+        if self.write_delay <= 0:
+            self.flush()
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(self.write_delay, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self) -> None:
+        """Write pending changes (atomically)."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            tmp_file = self.user_settings_file.with_name(f"{self.user_settings_file.name}.tmp")
+            tmp_file.write_text(json.dumps(self._cache), encoding=self.ENCODING)
+            os.replace(tmp_file, self.user_settings_file)
+            self._mtime_ns = self._file_mtime_ns()
+            self._dirty = False
+
+    @contextlib.contextmanager
+    def batch(self) -> Iterator["UserSettings"]:
+        """Group changes: they are written (once) after the batch.
+
+        Yields:
+            UserSettings: this object
+        """
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                if (self._batch_depth == 0) and self._dirty:
+                    self._changed()
 
     @property
     def settings(self) -> dict:
-        """Get all settings at once."""
-        if self.user_settings_file.exists():
-            return json.loads(self.user_settings_file.read_text(encoding="ansi"))
-        return {}
+        """Get all settings at once (a copy)."""
+        return dict(self._load())
 
     @settings.setter
     def settings(self, value: dict) -> None:
@@ -80,7 +178,9 @@ def settings(self, value: dict) -> None:
             TypeError: is raised when the `value` is not a dictionary
         """
         if isinstance(value, dict):
-            self.user_settings_file.write_text(json.dumps(value), encoding="ansi")
+            with self._lock:
+                self._cache = dict(value)
+                self._changed()
         else:
             raise TypeError(f"operand type must be a 'dict', got: '{type(value).__name__}'")
 
@@ -108,7 +208,7 @@ def __getitem__(self, name: str) -> Any:
         Returns:
             Any: setting value
         """
-        return self.settings[name]
+        return self._load()[name]
 
     def __setitem__(self, key: str, value: Any) -> None:
         """Set a single setting.
@@ -117,6 +217,6 @@ def __setitem__(self, key: str, value: Any) -> None:
             key (str): name of the setting
             value (Any): value for the settings
         """
-        current_settings = self.settings
-        current_settings[key] = value
-        self.settings = current_settings
+        with self._lock:
+            self._load()[key] = value
+            self._changed()